@@ -0,0 +1,125 @@
+from typing import Any, Sequence
+import uuid
+
+import redis.asyncio as aioredis
+
+from connection import get_async_connection_pool
+from enums import ProductAmountCacheResults
+from redis_controller import (
+    ReservationRequest,
+    _batch_calls,
+    _finish_hold_call,
+    _hold_call,
+    _multi_reservation_args,
+    _multi_reservation_result,
+    _reservation_call,
+    _sweep_call,
+)
+from script_catalog import load_catalog
+from script_registry import AsyncScriptRegistry
+import settings
+
+
+class AsyncProductStockLogController:
+    """
+    Асинхронный вариант ProductStockLogController на redis.asyncio.
+
+    Все контроллеры одного event loop делят пул соединений из connection.py,
+    поэтому контроллер нужно создавать внутри работающего loop.
+    """
+
+    def __init__(
+      self,
+      redis_client: aioredis.StrictRedis | None = None,
+      hooks: Sequence[Any] = (),
+      events_stream: str | None = settings.STOCK_EVENTS_STREAM
+    ) -> None:
+        self.redis_host = settings.REDIS_HOST
+        self.redis_port = settings.REDIS_PORT
+        self.redis_db = settings.REDIS_DB
+        self.redis_client = redis_client or self._get_redis_client()
+        self.scripts = AsyncScriptRegistry(self.redis_client, hooks=hooks)
+        self.events_stream = events_stream
+
+    def _get_redis_client(self) -> aioredis.StrictRedis:
+        return aioredis.StrictRedis(connection_pool=get_async_connection_pool())
+
+    async def __aenter__(self) -> "AsyncProductStockLogController":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        await self.redis_client.aclose()
+
+    async def load_scripts(self) -> None:
+        await self.scripts.load()
+
+    async def activate_script_version(self, version: str, directory: str = settings.SCRIPT_CATALOG_DIR) -> None:
+        """
+        Переключает контроллер на версию скриптов из каталога (script_catalog.py).
+
+        Скрипты новой версии загружаются в Redis до переключения; вызовы,
+        начатые до него, завершаются на прежней версии.
+        """
+        await self.scripts.activate(load_catalog(version, directory))
+
+    async def execute_lua_reservation_script(
+      self,
+      available_key: str,
+      reserved_key: str,
+      required_amount: int,
+      idempotency_key: str | None = None
+    ) -> tuple[int, int | None]:
+        keys, args = _reservation_call(
+            available_key, reserved_key, required_amount, idempotency_key, self.events_stream
+        )
+        result, current_amount = await self.scripts.execute("reservation", keys, args)
+        return result, current_amount
+
+    async def execute_lua_reservation_batch(
+      self,
+      requests: Sequence[ReservationRequest],
+      chunk_size: int = 500
+    ) -> list[tuple[int, int | None]]:
+        replies = await self.scripts.execute_many("reservation", _batch_calls(requests, self.events_stream), chunk_size)
+        return [(result, current_amount) for result, current_amount in replies]
+
+    async def reserve_many(
+      self,
+      items: Sequence[ReservationRequest]
+    ) -> tuple[int, list[tuple[int, int | None]]]:
+        keys, args = _multi_reservation_args(items, self.events_stream)
+        return _multi_reservation_result(await self.scripts.execute("multi_reservation", keys, args))
+
+
+    async def reserve_hold(
+      self,
+      available_key: str,
+      reserved_key: str,
+      required_amount: int,
+      ttl: int = settings.HOLD_TTL
+    ) -> tuple[int, int | None, str | None]:
+        reservation_id = uuid.uuid4().hex
+        keys, args = _hold_call(available_key, reserved_key, required_amount, ttl, reservation_id, self.events_stream)
+        result, current_amount = await self.scripts.execute("hold_reservation", keys, args)
+        if result != ProductAmountCacheResults.ENOUGH_AMOUNT:
+            return result, current_amount, None
+        return result, current_amount, reservation_id
+
+    async def release(self, reservation_id: str) -> tuple[int, int | None]:
+        return await self._finish_hold(reservation_id, "release")
+
+    async def commit(self, reservation_id: str) -> tuple[int, int | None]:
+        return await self._finish_hold(reservation_id, "commit")
+
+    async def _finish_hold(self, reservation_id: str, mode: str) -> tuple[int, int | None]:
+        keys, args = _finish_hold_call(reservation_id, mode, self.events_stream)
+        result, current_amount = await self.scripts.execute("finish_hold", keys, args)
+        return result, current_amount
+
+    async def sweep_expired_holds(self, batch_size: int = settings.HOLD_SWEEP_BATCH_SIZE) -> tuple[int, int]:
+        keys, args = _sweep_call(batch_size, self.events_stream)
+        released, processed = await self.scripts.execute("sweep_holds", keys, args)
+        return released, processed
@@ -0,0 +1,477 @@
+"""
+Микробенчмарки контроллера резервирования.
+
+Запуск (нужен Redis из settings):
+    python benchmark.py scripts --calls 10000
+    python benchmark.py batch --requests 10000 --chunk-size 500
+    python benchmark.py hot-sku --threads 50 --attempts 200 --stock 5000 --buckets 8
+    python benchmark.py commands --calls 10000
+    python benchmark.py memory --skus 1000000
+    python benchmark.py hooks --calls 10000 --rounds 5
+    python benchmark.py coalesce --threads 200 --attempts 50 --stock 5000 --window 0.002
+    python benchmark.py processes --requests 200000 --max-processes 8 --chunk-size 500
+    python benchmark.py availability --skus 200 --calls 1000 --cache-ttl 1
+"""
+import argparse
+import concurrent.futures
+import os
+import statistics
+import time
+import timeit
+from typing import Any, Sequence
+
+import redis
+from redis.exceptions import NoScriptError
+
+from connection import connection_kwargs, get_connection_pool
+from enums import ProductAmountCacheResults
+from keys import bucket_keys, stock_keys
+from metrics import ReservationMetrics
+from process_pool import ReservationProcessPool
+from redis_controller import ProductStockLogController
+from script import lua_legacy_reservation_script, lua_reservation_script
+from script_registry import ScriptRegistry
+import settings
+
+
+AVAILABLE_KEY = "bench:product:available"
+RESERVED_KEY = "bench:product:reserved"
+
+
+def _report(name: str, timings: list[float]) -> None:
+    timings = sorted(timings)
+    total = sum(timings)
+    print(
+        f"{name:<24} calls={len(timings)} "
+        f"mean={statistics.mean(timings) * 1e6:.1f}us "
+        f"p50={timings[len(timings) // 2] * 1e6:.1f}us "
+        f"p99={timings[int(len(timings) * 0.99)] * 1e6:.1f}us "
+        f"ops/s={len(timings) / total:.0f}"
+    )
+
+
+def _seed(controller: ProductStockLogController, available: int) -> None:
+    controller.redis_client.set(AVAILABLE_KEY, available)
+    controller.redis_client.set(RESERVED_KEY, 0)
+
+
+def bench_scripts(calls: int) -> None:
+    controller = ProductStockLogController()
+    controller.load_scripts()
+    _seed(controller, calls * 2)
+
+    # Старый путь: register_script на каждый вызов
+    timings = []
+    for _ in range(calls):
+        started = time.perf_counter()
+        script = controller.redis_client.register_script(lua_reservation_script)
+        script(keys=[AVAILABLE_KEY, RESERVED_KEY], args=[1])
+        timings.append(time.perf_counter() - started)
+    _report("register_script/call", timings)
+
+    timings = []
+    for _ in range(calls):
+        started = time.perf_counter()
+        controller.execute_lua_reservation_script(AVAILABLE_KEY, RESERVED_KEY, 1)
+        timings.append(time.perf_counter() - started)
+    _report("registry evalsha", timings)
+
+    controller.redis_client.delete(AVAILABLE_KEY, RESERVED_KEY)
+
+
+def bench_batch(requests: int, chunk_size: int) -> None:
+    controller = ProductStockLogController()
+    controller.load_scripts()
+    _seed(controller, requests * 2)
+
+    # Поштучный цикл, как в TestProductStockLogControllerConcurrency
+    started = time.perf_counter()
+    for _ in range(requests):
+        controller.execute_lua_reservation_script(AVAILABLE_KEY, RESERVED_KEY, 1)
+    elapsed = time.perf_counter() - started
+    print(f"{'one-at-a-time':<24} requests={requests} seconds={elapsed:.3f} ops/s={requests / elapsed:.0f}")
+
+    batch = [(AVAILABLE_KEY, RESERVED_KEY, 1)] * requests
+    started = time.perf_counter()
+    controller.execute_lua_reservation_batch(batch, chunk_size=chunk_size)
+    elapsed = time.perf_counter() - started
+    print(f"{'pipelined batch':<24} requests={requests} seconds={elapsed:.3f} ops/s={requests / elapsed:.0f}")
+
+    controller.redis_client.delete(AVAILABLE_KEY, RESERVED_KEY)
+
+
+def _run_contended(threads: int, attempts: int, reserve) -> tuple[list[float], float]:
+    def worker(thread_id):
+        timings = []
+        for _ in range(attempts):
+            started = time.perf_counter()
+            result, _ = reserve()
+            if result == ProductAmountCacheResults.ENOUGH_AMOUNT:
+                timings.append(time.perf_counter() - started)
+        return timings
+
+    started = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as executor:
+        timings = [t for chunk in executor.map(worker, range(threads)) for t in chunk]
+    return timings, time.perf_counter() - started
+
+
+def bench_hot_sku(threads: int, attempts: int, stock: int, buckets: int) -> None:
+    controller = ProductStockLogController()
+    controller.load_scripts()
+    total = threads * attempts
+
+    # Один ключ: все потоки бьют в AVAILABLE_KEY
+    _seed(controller, stock)
+    timings, elapsed = _run_contended(
+        threads, attempts,
+        lambda: controller.execute_lua_reservation_script(AVAILABLE_KEY, RESERVED_KEY, 1),
+    )
+    print(f"{'single key':<24} attempts={total} seconds={elapsed:.3f} ops/s={total / elapsed:.0f}")
+    if timings:
+        _report("  success latency", timings)
+
+    sku = "bench-hot"
+    controller.redis_client.set(bucket_keys(sku, 0)[0], stock)
+    controller.rebalance_stock_buckets(sku, buckets)
+    timings, elapsed = _run_contended(
+        threads, attempts,
+        lambda: controller.execute_sharded_reservation(sku, 1, buckets=buckets),
+    )
+    print(f"{f'{buckets} buckets':<24} attempts={total} seconds={elapsed:.3f} ops/s={total / elapsed:.0f}")
+    if timings:
+        _report("  success latency", timings)
+
+    controller.redis_client.delete(
+        AVAILABLE_KEY, RESERVED_KEY, *[key for b in range(buckets) for key in bucket_keys(sku, b)]
+    )
+
+
+def bench_coalesce(threads: int, attempts: int, stock: int, window: float) -> None:
+    total = threads * attempts
+    for name, coalesce_window in (("one call per request", 0), (f"coalesced {window * 1000:g}ms", window)):
+        metrics = ReservationMetrics()
+        controller = ProductStockLogController(hooks=[metrics], coalesce_window=coalesce_window)
+        controller.load_scripts()
+        _seed(controller, stock)
+        timings, elapsed = _run_contended(
+            threads, attempts,
+            lambda: controller.execute_lua_reservation_script(AVAILABLE_KEY, RESERVED_KEY, 1),
+        )
+        script_calls = sum(histogram.count for histogram in metrics.latency.values())
+        print(
+            f"{name:<24} attempts={total} script calls={script_calls} "
+            f"seconds={elapsed:.3f} ops/s={total / elapsed:.0f}"
+        )
+        if timings:
+            _report("  success latency", timings)
+
+    controller.redis_client.delete(AVAILABLE_KEY, RESERVED_KEY)
+
+
+def bench_processes(requests: int, max_processes: int, chunk_size: int, skus: int) -> None:
+    controller = ProductStockLogController()
+    sku_keys = [stock_keys(f"bench-pp-{sku}") for sku in range(skus)]
+    batch = [(*sku_keys[index % skus], 1) for index in range(requests)]
+
+    baseline = None
+    processes = 1
+    while processes <= max_processes:
+        pipe = controller.redis_client.pipeline(transaction=False)
+        for available_key, reserved_key in sku_keys:
+            pipe.set(available_key, requests)
+            pipe.set(reserved_key, 0)
+        pipe.execute()
+
+        with ReservationProcessPool(processes=processes) as pool:
+            # Прогрев: процессы стартуют и загружают скрипты до замера
+            pool.reserve(batch[:chunk_size * processes], chunk_size)
+            started = time.perf_counter()
+            pool.reserve(batch, chunk_size)
+            elapsed = time.perf_counter() - started
+        ops = requests / elapsed
+        baseline = baseline or ops
+        print(
+            f"{f'{processes} processes':<24} requests={requests} seconds={elapsed:.3f} "
+            f"ops/s={ops:.0f} speedup={ops / baseline:.2f}x"
+        )
+        processes *= 2
+
+    controller.redis_client.delete(*[key for keys in sku_keys for key in keys])
+
+
+def bench_availability(skus: int, calls: int, cache_ttl: float) -> None:
+    controller = ProductStockLogController()
+    cached = ProductStockLogController(availability_cache_ttl=cache_ttl)
+    listing = [f"bench-listing-{sku}" for sku in range(skus)]
+    controller.redis_client.mset({stock_keys(sku)[0]: 10 for sku in listing})
+
+    variants = {
+        # Как делают вызывающие сейчас: GET на каждый SKU
+        "GET per SKU": lambda: [controller.redis_client.get(stock_keys(sku)[0]) for sku in listing],
+        "get_availability": lambda: controller.get_availability(listing),
+        f"cached {cache_ttl:g}s": lambda: cached.get_availability(listing),
+    }
+    for name, read in variants.items():
+        timings = []
+        for _ in range(calls):
+            started = time.perf_counter()
+            read()
+            timings.append(time.perf_counter() - started)
+        _report(name, timings)
+
+    controller.redis_client.delete(*[stock_keys(sku)[0] for sku in listing])
+
+
+def _script_command_calls(controller: ProductStockLogController) -> int:
+    # Команды, вызванные из Lua, попадают в commandstats наравне с клиентскими
+    stats = controller.redis_client.info("commandstats")
+    skipped = {"cmdstat_evalsha", "cmdstat_eval", "cmdstat_info", "cmdstat_config|resetstat"}
+    return sum(value["calls"] for name, value in stats.items() if name not in skipped)
+
+
+def bench_commands(calls: int) -> None:
+    controller = ProductStockLogController()
+    controller.load_scripts()
+    legacy = controller.redis_client.register_script(lua_legacy_reservation_script)
+    variants = {
+        "legacy script": lambda: legacy(keys=[AVAILABLE_KEY, RESERVED_KEY], args=[1]),
+        "lean script": lambda: controller.execute_lua_reservation_script(AVAILABLE_KEY, RESERVED_KEY, 1),
+    }
+
+    for name, reserve in variants.items():
+        # Сначала calls успешных резервирований, затем calls отказов
+        _seed(controller, calls)
+        for phase in ("success", "sold out"):
+            controller.redis_client.config_resetstat()
+            timings = []
+            for _ in range(calls):
+                started = time.perf_counter()
+                reserve()
+                timings.append(time.perf_counter() - started)
+            commands_per_call = _script_command_calls(controller) / calls
+            _report(f"{name} ({phase})", timings)
+            print(f"{'':<24} redis commands per call={commands_per_call:.2f}")
+
+    controller.redis_client.delete(AVAILABLE_KEY, RESERVED_KEY)
+
+
+def _memory_layouts() -> dict:
+    def write_keys(pipe, sku):
+        pipe.set(f"bench:memory:{sku}:available", 100)
+        pipe.set(f"bench:memory:{sku}:reserved", 0)
+
+    def write_hash(pipe, sku):
+        pipe.hset(f"bench:memory:{sku}", mapping={"available": 100, "reserved": 0, "sold": 0, "version": 0})
+
+    return {
+        "string keys": (write_keys, lambda sku: [f"bench:memory:{sku}:available", f"bench:memory:{sku}:reserved"]),
+        "hash": (write_hash, lambda sku: [f"bench:memory:{sku}"]),
+    }
+
+
+def bench_memory(skus: int, chunk_size: int, sample: int) -> None:
+    controller = ProductStockLogController()
+    client = controller.redis_client
+
+    for name, (write, sku_keys) in _memory_layouts().items():
+        before = client.info("memory")["used_memory"]
+        for start in range(0, skus, chunk_size):
+            pipe = client.pipeline(transaction=False)
+            for sku in range(start, min(start + chunk_size, skus)):
+                write(pipe, sku)
+            pipe.execute()
+        used = client.info("memory")["used_memory"] - before
+
+        pipe = client.pipeline(transaction=False)
+        for sku in range(min(sample, skus)):
+            for key in sku_keys(sku):
+                pipe.memory_usage(key)
+        sampled = sum(pipe.execute()) / min(sample, skus)
+
+        print(
+            f"{name:<24} skus={skus} used_memory={used / 2 ** 20:.1f}MiB "
+            f"per_sku={used / skus:.1f}B memory_usage_per_sku={sampled:.1f}B"
+        )
+
+        for start in range(0, skus, chunk_size):
+            pipe = client.pipeline(transaction=False)
+            for sku in range(start, min(start + chunk_size, skus)):
+                pipe.unlink(*sku_keys(sku))
+            pipe.execute()
+
+
+class _UninstrumentedScriptRegistry(ScriptRegistry):
+    """ScriptRegistry.execute без проверок хуков - база для bench_hooks."""
+
+    def execute(
+      self,
+      name: str,
+      keys: Sequence[str],
+      args: Sequence[Any],
+      client: redis.StrictRedis | None = None
+    ) -> Any:
+        if client is None:
+            client = self.redis_client
+        catalog = self.catalog
+        try:
+            return client.evalsha(catalog.shas[name], len(keys), *keys, *args)
+        except NoScriptError:
+            client.script_load(catalog.sources[name])
+            return client.evalsha(catalog.shas[name], len(keys), *keys, *args)
+
+
+class _StubClient:
+    """Клиент без сети: EVALSHA сразу отвечает ENOUGH_AMOUNT."""
+
+    def evalsha(self, *args: Any) -> list[int]:
+        return [ProductAmountCacheResults.ENOUGH_AMOUNT, 0]
+
+
+def bench_hooks(calls: int, rounds: int) -> None:
+    # База - тот же путь ScriptRegistry.execute без проверок хуков на обычном
+    # BlockingConnectionPool (без переопределённого get_connection). Прямой
+    # EVALSHA - только ориентир.
+    plain_client = redis.StrictRedis(
+        connection_pool=redis.BlockingConnectionPool(max_connections=settings.REDIS_MAX_CONNECTIONS, **connection_kwargs())
+    )
+    timed_client = redis.StrictRedis(connection_pool=get_connection_pool())
+    uninstrumented = _UninstrumentedScriptRegistry(plain_client)
+    disabled = ScriptRegistry(timed_client, hooks=())
+    metrics = ReservationMetrics()
+    instrumented = ScriptRegistry(timed_client, hooks=[metrics])
+    disabled.load()
+    sha = disabled.shas["reservation"]
+    keys, args = [AVAILABLE_KEY, RESERVED_KEY], [1]
+    variants = {
+        "raw evalsha": lambda: plain_client.evalsha(sha, 2, AVAILABLE_KEY, RESERVED_KEY, 1),
+        "no hook checks": lambda: uninstrumented.execute("reservation", keys, args),
+        "hooks disabled": lambda: disabled.execute("reservation", keys, args),
+        "ReservationMetrics": lambda: instrumented.execute("reservation", keys, args),
+    }
+
+    # Раунды чередуются, чтобы дрейф Redis и сети не ложился на один вариант.
+    # Кроме задержки считается CPU клиентского потока (thread_time): в нём нет
+    # ожидания ответа, поэтому разница Python-кода не тонет в шуме сервера.
+    timings = {name: [] for name in variants}
+    cpu = {name: 0.0 for name in variants}
+    for _ in range(rounds):
+        for name, call in variants.items():
+            timed_client.set(AVAILABLE_KEY, calls)
+            timed_client.set(RESERVED_KEY, 0)
+            cpu_started = time.thread_time()
+            for _ in range(calls):
+                started = time.perf_counter()
+                call()
+                timings[name].append(time.perf_counter() - started)
+            cpu[name] += time.thread_time() - cpu_started
+    for name, values in timings.items():
+        _report(name, values)
+
+    # Цена инструментирования - разница с тем же путём без проверок хуков
+    total_calls = calls * rounds
+    baseline = cpu["no hook checks"] / total_calls
+    for name in ("hooks disabled", "ReservationMetrics"):
+        print(f"{name + ' overhead':<24} client cpu {(cpu[name] / total_calls - baseline) * 1e6:+.2f}us per call")
+    print(f"{'':<24} recorded p99={metrics.latency['reservation'].percentile(0.99) * 1e6:.1f}us")
+
+    # Через Redis разница тонет в шуме сети, поэтому те же пути меряются и
+    # без неё: execute на клиенте-заглушке и get_connection/release пулов.
+    # Повторы вариантов чередуются, берётся лучший.
+    def best_difference(checked: Any, unchecked: Any, number: int) -> float:
+        checked_runs, unchecked_runs = [], []
+        for _ in range(7):
+            checked_runs.append(timeit.timeit(checked, number=number))
+            unchecked_runs.append(timeit.timeit(unchecked, number=number))
+        return (min(checked_runs) - min(unchecked_runs)) / number
+
+    stub = _StubClient()
+    stub_disabled = ScriptRegistry(stub, disabled.catalog)
+    stub_uninstrumented = _UninstrumentedScriptRegistry(stub, disabled.catalog)
+    execute_checks = best_difference(
+        lambda: stub_disabled.execute("reservation", keys, args),
+        lambda: stub_uninstrumented.execute("reservation", keys, args),
+        100_000,
+    )
+    print(f"{'execute hook checks':<24} {execute_checks * 1e9:+.0f}ns per call (без сети)")
+    timed_pool, plain_pool = timed_client.connection_pool, plain_client.connection_pool
+    pool_checks = best_difference(
+        lambda: timed_pool.release(timed_pool.get_connection()),
+        lambda: plain_pool.release(plain_pool.get_connection()),
+        20_000,
+    )
+    print(f"{'pool wait hook check':<24} {pool_checks * 1e9:+.0f}ns per get_connection/release")
+
+    timed_client.delete(AVAILABLE_KEY, RESERVED_KEY)
+    plain_client.connection_pool.disconnect()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    scripts = commands.add_parser("scripts", help="register_script на каждый вызов против реестра")
+    scripts.add_argument("--calls", type=int, default=10000)
+
+    batch = commands.add_parser("batch", help="поштучные вызовы против pipelined batch")
+    batch.add_argument("--requests", type=int, default=10000)
+    batch.add_argument("--chunk-size", type=int, default=500)
+
+    hot_sku = commands.add_parser("hot-sku", help="один ключ против шардированного стока под конкуренцией")
+    hot_sku.add_argument("--threads", type=int, default=50)
+    hot_sku.add_argument("--attempts", type=int, default=200)
+    hot_sku.add_argument("--stock", type=int, default=5000)
+    hot_sku.add_argument("--buckets", type=int, default=8)
+
+    commands_parser = commands.add_parser("commands", help="число команд Redis и задержка: исходный скрипт против lean")
+    commands_parser.add_argument("--calls", type=int, default=10000)
+
+    memory = commands.add_parser("memory", help="память: пара строковых ключей против хэша на SKU")
+    memory.add_argument("--skus", type=int, default=1_000_000)
+    memory.add_argument("--chunk-size", type=int, default=10000)
+    memory.add_argument("--sample", type=int, default=1000)
+
+    hooks = commands.add_parser("hooks", help="накладные расходы инструментирования: реестр без проверок хуков, с hooks=() и с ReservationMetrics")
+    hooks.add_argument("--calls", type=int, default=10000)
+    hooks.add_argument("--rounds", type=int, default=5)
+
+    coalesce = commands.add_parser("coalesce", help="горячий SKU: вызов на запрос против объединения запросов")
+    coalesce.add_argument("--threads", type=int, default=200)
+    coalesce.add_argument("--attempts", type=int, default=50)
+    coalesce.add_argument("--stock", type=int, default=5000)
+    coalesce.add_argument("--window", type=float, default=0.002)
+
+    processes = commands.add_parser("processes", help="масштабирование ReservationProcessPool по числу процессов")
+    processes.add_argument("--requests", type=int, default=200000)
+    processes.add_argument("--max-processes", type=int, default=os.cpu_count() or 1)
+    processes.add_argument("--chunk-size", type=int, default=500)
+    processes.add_argument("--skus", type=int, default=1000)
+
+    availability = commands.add_parser("availability", help="остатки листинга: GET на SKU против get_availability и кэша")
+    availability.add_argument("--skus", type=int, default=200)
+    availability.add_argument("--calls", type=int, default=1000)
+    availability.add_argument("--cache-ttl", type=float, default=1.0)
+
+    args = parser.parse_args()
+    if args.command == "scripts":
+        bench_scripts(args.calls)
+    elif args.command == "batch":
+        bench_batch(args.requests, args.chunk_size)
+    elif args.command == "hot-sku":
+        bench_hot_sku(args.threads, args.attempts, args.stock, args.buckets)
+    elif args.command == "commands":
+        bench_commands(args.calls)
+    elif args.command == "memory":
+        bench_memory(args.skus, args.chunk_size, args.sample)
+    elif args.command == "hooks":
+        bench_hooks(args.calls, args.rounds)
+    elif args.command == "coalesce":
+        bench_coalesce(args.threads, args.attempts, args.stock, args.window)
+    elif args.command == "processes":
+        bench_processes(args.requests, args.max_processes, args.chunk_size, args.skus)
+    elif args.command == "availability":
+        bench_availability(args.skus, args.calls, args.cache_ttl)
+
+
+if __name__ == "__main__":
+    main()
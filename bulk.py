@@ -0,0 +1,186 @@
+"""
+Массовая загрузка и выгрузка стока.
+
+Вход - CSV с колонками sku,available[,reserved] или JSONL с теми же полями.
+Загрузка идёт пачками по chunk_size SKU: MSET пар ключей (keys.stock_keys)
+или pipeline HSET хэшей (keys.stock_hash_key). Выгрузка читает текущие
+значения через SCAN и pipelined MGET/HMGET, не держа весь каталог в памяти.
+MSET затрагивает ключи разных слотов, поэтому загрузка в режиме keys
+рассчитана на standalone Redis.
+
+    python bulk.py load stock.csv --mode hash --chunk-size 10000
+    python bulk.py resp stock.csv > stock.resp && redis-cli --pipe < stock.resp
+    python bulk.py export --mode keys --format jsonl > snapshot.jsonl
+"""
+import argparse
+import csv
+import json
+import sys
+from typing import IO, Iterable, Iterator, NamedTuple
+
+import redis
+
+from connection import get_connection_pool
+from keys import hash_tag, stock_hash_key, stock_keys
+import settings
+
+
+class StockRow(NamedTuple):
+    sku: str
+    available: int
+    reserved: int = 0
+
+
+def read_csv(stream: IO[str]) -> Iterator[StockRow]:
+    for row in csv.DictReader(stream):
+        yield StockRow(row["sku"], int(row["available"]), int(row.get("reserved") or 0))
+
+
+def read_jsonl(stream: IO[str]) -> Iterator[StockRow]:
+    for line in stream:
+        if line.strip():
+            row = json.loads(line)
+            yield StockRow(str(row["sku"]), int(row["available"]), int(row.get("reserved", 0)))
+
+
+def write_csv(rows: Iterable[StockRow], stream: IO[str]) -> None:
+    writer = csv.writer(stream)
+    writer.writerow(StockRow._fields)
+    writer.writerows(rows)
+
+
+def write_jsonl(rows: Iterable[StockRow], stream: IO[str]) -> None:
+    for row in rows:
+        stream.write(json.dumps(row._asdict()) + "\n")
+
+
+def _chunks(rows: Iterable[StockRow], chunk_size: int) -> Iterator[list[StockRow]]:
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _commands(row: StockRow, mode: str) -> list[tuple]:
+    if mode == "hash":
+        return [(
+            "HSET", stock_hash_key(row.sku),
+            "available", row.available, "reserved", row.reserved, "sold", 0, "version", 0,
+        )]
+    available_key, reserved_key = stock_keys(row.sku)
+    return [("SET", available_key, row.available), ("SET", reserved_key, row.reserved)]
+
+
+def load_stock(
+  client: redis.StrictRedis,
+  rows: Iterable[StockRow],
+  mode: str = "keys",
+  chunk_size: int = 10000
+) -> int:
+    """Записывает строки в Redis пачками и возвращает число загруженных SKU."""
+    loaded = 0
+    for chunk in _chunks(rows, chunk_size):
+        if mode == "keys":
+            mapping = {}
+            for row in chunk:
+                available_key, reserved_key = stock_keys(row.sku)
+                mapping[available_key] = row.available
+                mapping[reserved_key] = row.reserved
+            client.mset(mapping)
+        else:
+            pipe = client.pipeline(transaction=False)
+            for row in chunk:
+                for command in _commands(row, mode):
+                    pipe.execute_command(*command)
+            pipe.execute()
+        loaded += len(chunk)
+    return loaded
+
+
+def write_resp(rows: Iterable[StockRow], stream: IO[bytes], mode: str = "keys") -> None:
+    """Пишет команды в протоколе RESP для redis-cli --pipe."""
+    for row in rows:
+        for command in _commands(row, mode):
+            parts = [str(part).encode() for part in command]
+            stream.write(b"*%d\r\n" % len(parts))
+            for part in parts:
+                stream.write(b"$%d\r\n%s\r\n" % (len(part), part))
+
+
+def export_stock(
+  client: redis.StrictRedis,
+  mode: str = "keys",
+  chunk_size: int = 10000,
+  prefix: str = settings.STOCK_KEY_PREFIX
+) -> Iterator[StockRow]:
+    """Потоково выгружает текущий сток: SCAN пачками + pipelined MGET/HMGET."""
+    if mode == "hash":
+        match = f"{prefix}:{{*}}"
+    else:
+        match = f"{prefix}:{{*}}:available"
+    batch = []
+    for key in client.scan_iter(match=match, count=chunk_size):
+        batch.append(key.decode() if isinstance(key, bytes) else key)
+        if len(batch) >= chunk_size:
+            yield from _export_batch(client, batch, mode)
+            batch = []
+    if batch:
+        yield from _export_batch(client, batch, mode)
+
+
+def _export_batch(client: redis.StrictRedis, batch: list[str], mode: str) -> Iterator[StockRow]:
+    if mode == "hash":
+        pipe = client.pipeline(transaction=False)
+        for stock_key in batch:
+            pipe.hmget(stock_key, "available", "reserved")
+        values = pipe.execute()
+    else:
+        reserved_keys = [available_key[:-len("available")] + "reserved" for available_key in batch]
+        pipe = client.pipeline(transaction=False)
+        pipe.mget(batch)
+        pipe.mget(reserved_keys)
+        available, reserved = pipe.execute()
+        values = zip(available, reserved)
+    for key, (available, reserved) in zip(batch, values):
+        if available is not None:
+            yield StockRow(hash_tag(key), int(available), int(reserved or 0))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    for name in ("load", "resp"):
+        command = commands.add_parser(name)
+        command.add_argument("path", help="CSV или JSONL; '-' - stdin")
+        command.add_argument("--format", choices=["csv", "jsonl"])
+        command.add_argument("--mode", choices=["keys", "hash"], default="keys")
+        command.add_argument("--chunk-size", type=int, default=10000)
+    export = commands.add_parser("export")
+    export.add_argument("--format", choices=["csv", "jsonl"], default="jsonl")
+    export.add_argument("--mode", choices=["keys", "hash"], default="keys")
+    export.add_argument("--chunk-size", type=int, default=10000)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        client = redis.StrictRedis(connection_pool=get_connection_pool())
+        writer = write_csv if args.format == "csv" else write_jsonl
+        writer(export_stock(client, args.mode, args.chunk_size), sys.stdout)
+        return
+
+    stream = sys.stdin if args.path == "-" else open(args.path, encoding="utf-8", newline="")
+    with stream:
+        input_format = args.format or ("jsonl" if args.path.endswith(".jsonl") else "csv")
+        rows = read_jsonl(stream) if input_format == "jsonl" else read_csv(stream)
+        if args.command == "resp":
+            write_resp(rows, sys.stdout.buffer, args.mode)
+        else:
+            client = redis.StrictRedis(connection_pool=get_connection_pool())
+            print(f"Загружено SKU: {load_stock(client, rows, args.mode, args.chunk_size)}")
+
+
+if __name__ == "__main__":
+    main()
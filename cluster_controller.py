@@ -0,0 +1,155 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Sequence
+
+from redis.cluster import ClusterNode, RedisCluster
+
+from connection import get_cluster_client
+from enums import ProductAmountCacheResults
+from keys import bucket_keys
+from redis_controller import (
+    ProductStockLogController,
+    ReservationRequest,
+    _bucket_order,
+    _multi_reservation_args,
+)
+import settings
+
+
+class ClusterProductStockLogController(ProductStockLogController):
+    """
+    Контроллер для Redis Cluster.
+
+    Ключи каждого вызова скрипта должны лежать в одном слоте - используйте
+    keys.stock_keys. reserve_many работает для корзины из одного слота;
+    холды (release/commit/sweep) в кластере не поддерживаются, а
+    rebalance_stock_buckets неатомарен. Стрим событий (events_stream) тоже: он лежит в своём
+    слоте, а скрипт резервирования не может писать в чужой слот.
+    start_availability_tracking следит только за узлом settings.REDIS_HOST.
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        if self.events_stream is not None:
+            raise ValueError(
+                "Стрим событий лежит в своём слоте: в кластере скрипты не могут писать в него. "
+                "Передайте events_stream=None; значение по умолчанию берётся из STOCK_EVENTS_STREAM, "
+                "поэтому эта переменная не должна быть задана для процессов с кластерным контроллером"
+            )
+
+    def _get_redis_client(self) -> RedisCluster:
+        return get_cluster_client()
+
+    def execute_lua_reservation_batch(
+      self,
+      requests: Sequence[ReservationRequest],
+      chunk_size: int = 500
+    ) -> list[tuple[int, int | None]]:
+        """
+        Независимые резервирования, сгруппированные по слотам.
+
+        На каждый слот уходит один вызов batch_reservation (по chunk_size строк),
+        вызовы одного узла идут одним pipeline, узлы обрабатываются параллельно.
+        """
+        slots: dict[int, list[int]] = {}
+        for index, (available_key, _, _) in enumerate(requests):
+            slots.setdefault(self.redis_client.keyslot(available_key), []).append(index)
+
+        nodes: dict[str, tuple[ClusterNode, list[list[int]]]] = {}
+        for slot, indexes in slots.items():
+            node = self.redis_client.nodes_manager.get_node_from_slot(slot)
+            groups = nodes.setdefault(node.name, (node, []))[1]
+            for start in range(0, len(indexes), chunk_size):
+                groups.append(indexes[start:start + chunk_size])
+
+        results: list[tuple[int, int | None]] = [None] * len(requests)
+
+        def run_node(node: ClusterNode, groups: list[list[int]]) -> None:
+            calls = [_multi_reservation_args([requests[index] for index in group]) for group in groups]
+            replies = self.scripts.execute_many(
+                "batch_reservation", calls, len(calls), client=self.redis_client.get_redis_connection(node)
+            )
+            for group, reply in zip(groups, replies):
+                for index, line in zip(group, zip(reply[::2], reply[1::2])):
+                    results[index] = line
+
+        if nodes:
+            with ThreadPoolExecutor(max_workers=len(nodes)) as executor:
+                futures = [executor.submit(run_node, node, groups) for node, groups in nodes.values()]
+                for future in futures:
+                    future.result()
+        return results
+
+    def _read_availability(self, redis_keys: list[str], layout: str, chunk_size: int) -> list[int | None]:
+        """MGET в кластере не пересекает слоты: mget_nonatomic разбивает ключи по слотам сам."""
+        if layout != "keys":
+            return super()._read_availability(redis_keys, layout, chunk_size)
+        values = []
+        for start in range(0, len(redis_keys), chunk_size):
+            values += self.redis_client.mget_nonatomic(redis_keys[start:start + chunk_size])
+        return [None if value is None else int(value) for value in values]
+
+    def execute_sharded_reservation(
+      self,
+      sku: str | int,
+      required_amount: int,
+      buckets: int = settings.STOCK_BUCKETS,
+      routing_key: str | None = None
+    ) -> tuple[int, int | None]:
+        """
+        Бакеты лежат в разных слотах, поэтому перебираются отдельными вызовами
+        reservation; следующий бакет пробуется, только если в текущем не хватило.
+        Количество берётся из одного бакета: если остаток разошёлся по бакетам
+        мелкими частями, соберите его rebalance_stock_buckets.
+        """
+        found = False
+        total = 0
+        for bucket in _bucket_order(buckets, routing_key):
+            available_key, reserved_key = bucket_keys(sku, bucket)
+            result, current_amount = self.execute_lua_reservation_script(
+                available_key, reserved_key, required_amount
+            )
+            if result == ProductAmountCacheResults.ENOUGH_AMOUNT:
+                return result, current_amount
+            if result == ProductAmountCacheResults.NOT_ENOUGH_AMOUNT:
+                found = True
+                total += current_amount
+        if not found:
+            return ProductAmountCacheResults.KEY_NOT_EXIST, None
+        return ProductAmountCacheResults.NOT_ENOUGH_AMOUNT, total
+
+    def rebalance_stock_buckets(self, sku: str | int, buckets: int = settings.STOCK_BUCKETS) -> int:
+        """
+        Неатомарный rebalance: бакеты лежат в разных слотах.
+
+        Остатки читаются одним mget_nonatomic, излишек каждого бакета над
+        долей забирается скриптом take_available (не больше, чем в бакете
+        осталось к этому моменту), затем раздаётся через INCRBY бакетам ниже
+        доли; нераспределённое возвращается в бакет 0. Параллельные
+        резервирования не ломаются, но на время переноса часть товара не видна
+        ни в одном бакете, и NOT_ENOUGH_AMOUNT возможен при достаточной сумме.
+        Если процесс упадёт между забором и раздачей, забранное количество
+        потеряется - запускайте rebalance вне пика. Возвращает сумму available
+        на момент чтения.
+        """
+        keys = [bucket_keys(sku, bucket) for bucket in range(buckets)]
+        for _, reserved_key in keys:
+            self.redis_client.set(reserved_key, 0, nx=True)
+        values = [
+            int(value or 0) for value in self.redis_client.mget_nonatomic([available_key for available_key, _ in keys])
+        ]
+        total = sum(values)
+        share, extra = divmod(total, buckets)
+        targets = [share + (1 if bucket < extra else 0) for bucket in range(buckets)]
+
+        in_transit = 0
+        for (available_key, _), value, target in zip(keys, values, targets):
+            if value > target:
+                in_transit += self.scripts.execute("take_available", [available_key], [value - target])
+        for (available_key, _), value, target in zip(keys, values, targets):
+            if value < target and in_transit:
+                amount = min(target - value, in_transit)
+                self.redis_client.incrby(available_key, amount)
+                in_transit -= amount
+        if in_transit:
+            self.redis_client.incrby(keys[0][0], in_transit)
+        return total
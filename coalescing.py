@@ -0,0 +1,82 @@
+import threading
+from typing import Any
+
+from keys import sku_from_key
+from script_registry import ScriptRegistry
+import settings
+
+
+class _Batch:
+    def __init__(self) -> None:
+        self.amounts: list[int] = []
+        self.results: list[tuple[int, int | None]] = []
+        self.error: BaseException | None = None
+        self.full = threading.Event()
+        self.done = threading.Event()
+
+
+class ReservationCoalescer:
+    """
+    Объединяет одновременные резервирования одной пары ключей в один вызов Lua.
+
+    Первый поток, пришедший за парой (available_key, reserved_key), становится
+    ведущим: ждёт window секунд (или пока не наберётся max_batch запросов) и
+    отправляет все накопленные количества скриптом coalesced_reservation.
+    Запросы выполняются в порядке поступления с той же семантикой, что и
+    отдельные вызовы reservation; каждый поток получает свой (result, current_amount).
+    Ошибка Redis пробрасывается всем потокам пачки. Если задан events_stream,
+    скрипт пишет в него событие на каждый запрос пачки.
+    """
+
+    def __init__(
+      self,
+      scripts: ScriptRegistry,
+      window: float,
+      max_batch: int,
+      events_stream: str | None = None
+    ) -> None:
+        self.scripts = scripts
+        self.window = window
+        self.max_batch = max_batch
+        self.events_stream = events_stream
+        self._pending: dict[tuple[str, str], _Batch] = {}
+        self._lock = threading.Lock()
+
+    def reserve(self, available_key: str, reserved_key: str, required_amount: Any) -> tuple[int, int | None]:
+        pair = (available_key, reserved_key)
+        with self._lock:
+            batch = self._pending.get(pair)
+            is_leader = batch is None
+            if is_leader:
+                batch = self._pending[pair] = _Batch()
+            index = len(batch.amounts)
+            batch.amounts.append(required_amount)
+            if len(batch.amounts) >= self.max_batch:
+                # Следующие запросы начнут новую пачку
+                del self._pending[pair]
+                batch.full.set()
+
+        if is_leader:
+            self._flush(pair, batch)
+        else:
+            batch.done.wait()
+        if batch.error is not None:
+            raise batch.error
+        return batch.results[index]
+
+    def _flush(self, pair: tuple[str, str], batch: _Batch) -> None:
+        batch.full.wait(self.window)
+        with self._lock:
+            if self._pending.get(pair) is batch:
+                del self._pending[pair]
+        try:
+            keys, args = list(pair), batch.amounts
+            if self.events_stream is not None:
+                keys = keys + [self.events_stream]
+                args = [settings.STOCK_EVENTS_MAXLEN, sku_from_key(pair[0])] + args
+            reply = self.scripts.execute("coalesced_reservation", keys, args)
+            batch.results = list(zip(reply[::2], reply[1::2]))
+        except BaseException as error:
+            batch.error = error
+        finally:
+            batch.done.set()
@@ -0,0 +1,49 @@
+import pytest
+import redis
+import sys
+import os
+
+# Добавляем путь к проекту для импорта
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import settings
+
+
+# ============================================================================
+# FIXTURES - Общие фикстуры для всех тестов
+# ============================================================================
+
+@pytest.fixture
+def clean_redis():
+    """Фикстура для очистки Redis перед и после тестов"""
+    test_redis = redis.StrictRedis(
+        host=settings.REDIS_HOST, 
+        port=settings.REDIS_PORT, 
+        db=15
+    )
+    test_redis.flushdb()
+    yield test_redis
+    test_redis.flushdb()  # Очищаем после теста
+
+
+@pytest.fixture
+def seed_stock(clean_redis):
+    """
+    Фабрика стока в clean_redis.
+
+    seed_stock(keys, available, reserved=0): keys - префикс (ключи
+    <prefix>:available и <prefix>:reserved) или готовая пара ключей
+    (keys.stock_keys, keys.bucket_keys); возвращает пару ключей.
+    С layout="hash" keys - ключ хэша с полями available/reserved/sold/version.
+    """
+    def seed(keys, available, reserved=0, layout="keys"):
+        if layout == "hash":
+            clean_redis.hset(keys, mapping={"available": available, "reserved": reserved, "sold": 0, "version": 0})
+            return keys
+        if isinstance(keys, str):
+            keys = (f"{keys}:available", f"{keys}:reserved")
+        clean_redis.set(keys[0], available)
+        clean_redis.set(keys[1], reserved)
+        return keys
+
+    return seed
@@ -0,0 +1,147 @@
+"""
+Общие на процесс пулы соединений с Redis.
+
+Параметры берутся из settings (и переменных окружения через него).
+Все контроллеры процесса делят один BlockingConnectionPool: при всплеске
+нагрузки запросы ждут свободное соединение до REDIS_POOL_TIMEOUT секунд,
+а не открывают новые сокеты.
+"""
+import asyncio
+import os
+import threading
+import time
+from typing import Any
+
+import redis
+import redis.asyncio as aioredis
+from redis.cluster import RedisCluster
+
+import settings
+
+
+class TimedBlockingConnectionPool(redis.BlockingConnectionPool):
+    """
+    BlockingConnectionPool, сообщающий хукам время получения соединения.
+
+    wait_hooks - объекты с методом on_pool_wait(elapsed); пока список пуст,
+    get_connection ничего не замеряет.
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.wait_hooks: list[Any] = []
+
+    def get_connection(self, *args: Any, **kwargs: Any) -> redis.Connection:
+        if not self.wait_hooks:
+            return super().get_connection(*args, **kwargs)
+        started = time.perf_counter()
+        connection = super().get_connection(*args, **kwargs)
+        elapsed = time.perf_counter() - started
+        for hook in self.wait_hooks:
+            hook.on_pool_wait(elapsed)
+        return connection
+
+
+class AsyncTimedBlockingConnectionPool(aioredis.BlockingConnectionPool):
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.wait_hooks: list[Any] = []
+
+    async def get_connection(self, *args: Any, **kwargs: Any) -> aioredis.Connection:
+        if not self.wait_hooks:
+            return await super().get_connection(*args, **kwargs)
+        started = time.perf_counter()
+        connection = await super().get_connection(*args, **kwargs)
+        elapsed = time.perf_counter() - started
+        for hook in self.wait_hooks:
+            hook.on_pool_wait(elapsed)
+        return connection
+
+
+_pool: TimedBlockingConnectionPool | None = None
+_pool_lock = threading.Lock()
+_cluster_client: RedisCluster | None = None
+_async_pools: dict[asyncio.AbstractEventLoop, AsyncTimedBlockingConnectionPool] = {}
+
+
+def connection_kwargs(is_async: bool = False) -> dict[str, Any]:
+    kwargs: dict[str, Any] = {
+        "db": settings.REDIS_DB,
+        "protocol": settings.REDIS_PROTOCOL,
+        "socket_timeout": settings.REDIS_SOCKET_TIMEOUT,
+        "socket_connect_timeout": settings.REDIS_SOCKET_CONNECT_TIMEOUT,
+        "health_check_interval": settings.REDIS_HEALTH_CHECK_INTERVAL,
+    }
+    module = aioredis if is_async else redis
+    if settings.REDIS_UNIX_SOCKET_PATH:
+        kwargs["connection_class"] = module.UnixDomainSocketConnection
+        kwargs["path"] = settings.REDIS_UNIX_SOCKET_PATH
+    else:
+        kwargs["host"] = settings.REDIS_HOST
+        kwargs["port"] = settings.REDIS_PORT
+        kwargs["socket_keepalive"] = settings.REDIS_SOCKET_KEEPALIVE
+    return kwargs
+
+
+def get_connection_pool() -> TimedBlockingConnectionPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = TimedBlockingConnectionPool(
+                    max_connections=settings.REDIS_MAX_CONNECTIONS,
+                    timeout=settings.REDIS_POOL_TIMEOUT,
+                    **connection_kwargs())
+    return _pool
+
+
+def get_async_connection_pool() -> AsyncTimedBlockingConnectionPool:
+    """
+    Пул для текущего event loop.
+
+    Соединения redis.asyncio привязаны к loop, в котором созданы, поэтому пул
+    общий для всех корутин одного loop. Пулы закрытых loop отбрасываются.
+    """
+    loop = asyncio.get_running_loop()
+    for closed_loop in [known for known in _async_pools if known.is_closed()]:
+        del _async_pools[closed_loop]
+    if loop not in _async_pools:
+        _async_pools[loop] = AsyncTimedBlockingConnectionPool(
+            max_connections=settings.REDIS_MAX_CONNECTIONS,
+            timeout=settings.REDIS_POOL_TIMEOUT,
+            **connection_kwargs(is_async=True))
+    return _async_pools[loop]
+
+
+def get_cluster_client() -> RedisCluster:
+    """
+    Общий на процесс клиент Redis Cluster.
+
+    settings.REDIS_HOST/REDIS_PORT - стартовый узел; у каждого узла свой пул
+    размером REDIS_MAX_CONNECTIONS. Unix-сокет и db в кластере не используются.
+    """
+    global _cluster_client
+    if _cluster_client is None:
+        with _pool_lock:
+            if _cluster_client is None:
+                kwargs = connection_kwargs()
+                for option in ("db", "connection_class", "path"):
+                    kwargs.pop(option, None)
+                kwargs["host"] = settings.REDIS_HOST
+                kwargs["port"] = settings.REDIS_PORT
+                _cluster_client = RedisCluster(max_connections=settings.REDIS_MAX_CONNECTIONS, **kwargs)
+    return _cluster_client
+
+
+def _forget_pools_after_fork() -> None:
+    # Сокеты родителя нельзя ни использовать, ни закрывать из дочернего процесса:
+    # пулы просто забываются, следующий get_*_connection_pool создаст свои.
+    # Блокировка могла быть захвачена другим потоком родителя в момент fork.
+    global _pool, _cluster_client, _pool_lock
+    _pool = None
+    _cluster_client = None
+    _pool_lock = threading.Lock()
+    _async_pools.clear()
+
+
+os.register_at_fork(after_in_child=_forget_pools_after_fork)
@@ -5,4 +5,6 @@ class ProductAmountCacheResults(IntEnum):
     KEY_NOT_EXIST = 1
     ENOUGH_AMOUNT = 2
     NOT_ENOUGH_AMOUNT = 3
-
+    ALREADY_RELEASED = 4
+    UNKNOWN_HOLD = 5
+    INVALID_AMOUNT = 6
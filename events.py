@@ -0,0 +1,148 @@
+"""
+Чтение событий резервирований из стрима через consumer group.
+
+Контроллер с events_stream (или STOCK_EVENTS_STREAM) пишет событие в стрим
+тем же вызовом Lua, что меняет available/reserved: резервирования (в том
+числе корзины, холды, бакеты и хэши), release/commit и sweep холдов. Сервисы
+читают его вместо опроса ключей. Не пишут событий rebalance бакетов (сумма
+не меняется), migrate.py, bulk.py и прямые записи в ключи - после них
+потребителям нужно перечитать остатки:
+
+    consumer = StockEventConsumer("warehouse", "worker-1")
+    consumer.ensure_group()
+    consumer.consume(handle_events)
+"""
+from typing import Callable, Iterator, NamedTuple
+
+import redis
+from redis.exceptions import ResponseError
+
+from connection import get_connection_pool
+import settings
+
+
+class StockEvent(NamedTuple):
+    id: str
+    sku: str
+    amount: str
+    result: int
+    available: int | None
+    # reservation, release (reserved -> available), commit (reserved -> sold)
+    # или expire (sweep_expired_holds вернул холд в available)
+    kind: str = "reservation"
+
+
+def _text(value: bytes | str) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def parse_event(entry_id: bytes | str, fields: dict[bytes | str, bytes | str]) -> StockEvent:
+    # Клиент с decode_responses=True отдаёт str вместо bytes
+    fields = {_text(name): _text(value) for name, value in fields.items()}
+    # amount - как его передал клиент: при INVALID_AMOUNT это может быть не число
+    available = fields["available"]
+    return StockEvent(
+        _text(entry_id),
+        fields["sku"],
+        fields["amount"],
+        int(fields["result"]),
+        int(available) if available else None,
+        fields.get("kind", "reservation"),
+    )
+
+
+class StockEventConsumer:
+    """
+    Участник consumer group стрима событий.
+
+    read() сначала возвращает события, выданные этому consumer и не
+    подтверждённые (например, до падения процесса), затем новые. События
+    подтверждаются через ack() после обработки; consume() делает это сам.
+    """
+
+    def __init__(
+      self,
+      group: str,
+      consumer: str,
+      redis_client: redis.StrictRedis | None = None,
+      stream: str | None = settings.STOCK_EVENTS_STREAM,
+      batch_size: int = 100,
+      block_ms: int = 5000
+    ) -> None:
+        if stream is None:
+            raise ValueError("Не задан стрим событий (STOCK_EVENTS_STREAM)")
+        self.group = group
+        self.consumer = consumer
+        self.redis_client = redis_client or redis.StrictRedis(connection_pool=get_connection_pool())
+        self.stream = stream
+        self.batch_size = batch_size
+        self.block_ms = block_ms
+        self._pending_done = False
+
+    def ensure_group(self, start_id: str = "0") -> None:
+        """Создаёт группу (и стрим), если её нет; start_id="$" - только новые события."""
+        try:
+            self.redis_client.xgroup_create(self.stream, self.group, id=start_id, mkstream=True)
+        except ResponseError as error:
+            if "BUSYGROUP" not in str(error):
+                raise
+
+    def read(self) -> list[StockEvent]:
+        """Следующая пачка событий (не больше batch_size); пустой список после block_ms без событий."""
+        if not self._pending_done:
+            events = self._read("0", block=None)
+            if events:
+                return events
+            self._pending_done = True
+        return self._read(">", block=self.block_ms)
+
+    def _read(self, last_id: str, block: int | None) -> list[StockEvent]:
+        reply = self.redis_client.xreadgroup(
+            self.group, self.consumer, {self.stream: last_id}, count=self.batch_size, block=block
+        )
+        if not reply:
+            return []
+        # RESP2: [[stream, entries]], RESP3 (REDIS_PROTOCOL=3): {stream: [entries]}
+        if isinstance(reply, dict):
+            entries = next(iter(reply.values()))[0]
+        else:
+            _, entries = reply[0]
+        return [parse_event(entry_id, fields) for entry_id, fields in entries if fields]
+
+    def ack(self, events: list[StockEvent]) -> int:
+        if not events:
+            return 0
+        return self.redis_client.xack(self.stream, self.group, *[event.id for event in events])
+
+    def claim_stale(self, min_idle_ms: int) -> list[StockEvent]:
+        """
+        Забирает себе события, которые другие consumer группы не подтвердили
+        за min_idle_ms (не больше batch_size за вызов).
+        """
+        reply = self.redis_client.xautoclaim(
+            self.stream, self.group, self.consumer, min_idle_ms, "0-0", count=self.batch_size
+        )
+        return [parse_event(entry_id, fields) for entry_id, fields in reply[1] if fields]
+
+    def iter_batches(self) -> Iterator[list[StockEvent]]:
+        """Бесконечный поток непустых пачек; подтверждать их должен вызывающий."""
+        while True:
+            events = self.read()
+            if events:
+                yield events
+
+    def consume(self, handler: Callable[[list[StockEvent]], None], max_batches: int | None = None) -> int:
+        """
+        Передаёт пачки handler и подтверждает их, если он не упал.
+
+        Останавливается после max_batches непустых пачек (None - никогда).
+        Возвращает число обработанных событий.
+        """
+        handled = 0
+        for batch_number, events in enumerate(self.iter_batches(), start=1):
+            handler(events)
+            self.ack(events)
+            handled += len(events)
+            if max_batches is not None and batch_number >= max_batches:
+                break
+        return handled
@@ -0,0 +1,54 @@
+"""
+Раскладка ключей стока.
+
+Ключи одного SKU содержат hash tag {sku}, поэтому в Redis Cluster попадают
+в один слот и могут использоваться в одном Lua-скрипте без CROSSSLOT.
+"""
+import settings
+
+
+def stock_keys(sku: str | int, prefix: str = settings.STOCK_KEY_PREFIX) -> tuple[str, str]:
+    return f"{prefix}:{{{sku}}}:available", f"{prefix}:{{{sku}}}:reserved"
+
+
+def stock_hash_key(sku: str | int, prefix: str = settings.STOCK_KEY_PREFIX) -> str:
+    """Ключ хэша стока SKU (поля available/reserved/sold/version)."""
+    return f"{prefix}:{{{sku}}}"
+
+
+def bucket_keys(sku: str | int, bucket: int, prefix: str = settings.STOCK_KEY_PREFIX) -> tuple[str, str]:
+    """
+    Ключи одного бакета шардированного стока.
+
+    У каждого бакета свой hash tag {sku:bucket}, поэтому в кластере бакеты
+    горячего SKU распределяются по разным слотам и узлам.
+    """
+    return f"{prefix}:{{{sku}:{bucket}}}:available", f"{prefix}:{{{sku}:{bucket}}}:reserved"
+
+
+def hash_tag(key: str) -> str | None:
+    """Hash tag ключа по правилам Redis Cluster или None, если его нет."""
+    start = key.find("{")
+    if start == -1:
+        return None
+    end = key.find("}", start + 1)
+    if end == -1 or end == start + 1:
+        return None
+    return key[start + 1:end]
+
+
+def sku_from_key(key: str) -> str:
+    """SKU для событий стока: hash tag ключа из stock_keys или сам ключ, если тега нет."""
+    tag = hash_tag(key)
+    return key if tag is None else tag
+
+
+def idempotency_key(available_key: str, request_id: str) -> str:
+    """
+    Ключ идемпотентности SKU в том же слоте, что и available_key.
+
+    Ключ всегда включает SKU (hash tag или сам available_key без тега), поэтому
+    один request_id для разных SKU не возвращает чужой сохранённый результат.
+    """
+    tag = hash_tag(available_key)
+    return f"{settings.IDEMPOTENCY_KEY_PREFIX}{{{tag or available_key}}}:{request_id}"
@@ -0,0 +1,216 @@
+"""
+Нагрузочный тест ProductStockLogController.
+
+Гоняет резервирования из потоков, процессов или задач asyncio по SKU с
+распределением Zipf (горячие ключи) и печатает ops/s, p50/p95/p99/p999
+задержки и число исходов по ProductAmountCacheResults. --json сохраняет
+результат для сравнения между коммитами.
+
+    python loadtest.py --mode threads --workers 32 --requests 100000 --skus 1000 --zipf 1.1
+    python loadtest.py --mode asyncio --workers 500 --backend fakeredis --json result.json
+
+--backend fakeredis работает без redis-server (нужен lupa для Lua), но
+только в режимах threads и asyncio: процессы не видят общий fake-сервер.
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import subprocess
+import time
+from collections import Counter
+from typing import Callable
+
+from async_redis_controller import AsyncProductStockLogController
+from enums import ProductAmountCacheResults
+from keys import stock_keys
+from redis_controller import ProductStockLogController
+
+
+SKU_PREFIX = "loadtest-"
+
+Workload = list[tuple[str, str, int]]
+Samples = tuple[list[float], Counter]
+
+
+def build_workload(
+  requests: int,
+  skus: int,
+  zipf: float,
+  amount_min: int,
+  amount_max: int,
+  seed: int
+) -> Workload:
+    """Запросы (available_key, reserved_key, amount); SKU ранга k выбирается с весом 1 / k ** zipf."""
+    rng = random.Random(seed)
+    cum_weights = list(itertools.accumulate(1 / rank ** zipf for rank in range(1, skus + 1)))
+    picked = rng.choices(range(skus), cum_weights=cum_weights, k=requests)
+    return [
+        (*stock_keys(f"{SKU_PREFIX}{sku}"), rng.randint(amount_min, amount_max))
+        for sku in picked
+    ]
+
+
+def seed_stock(client, skus: int, initial_stock: int) -> None:
+    pipe = client.pipeline(transaction=False)
+    for sku in range(skus):
+        available_key, reserved_key = stock_keys(f"{SKU_PREFIX}{sku}")
+        pipe.set(available_key, initial_stock)
+        pipe.set(reserved_key, 0)
+    pipe.execute()
+
+
+def _run_slice(controller: ProductStockLogController, workload: Workload) -> Samples:
+    latencies = []
+    outcomes = Counter()
+    for available_key, reserved_key, amount in workload:
+        started = time.perf_counter()
+        result, _ = controller.execute_lua_reservation_script(available_key, reserved_key, amount)
+        latencies.append(time.perf_counter() - started)
+        outcomes[ProductAmountCacheResults(result).name] += 1
+    return latencies, outcomes
+
+
+def run_threads(workload: Workload, workers: int, controller_factory: Callable) -> Samples:
+    controller = controller_factory()
+    slices = [workload[index::workers] for index in range(workers)]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        return _merge(executor.map(lambda part: _run_slice(controller, part), slices))
+
+
+def _process_worker(workload: Workload) -> Samples:
+    return _run_slice(ProductStockLogController(), workload)
+
+
+def run_processes(workload: Workload, workers: int) -> Samples:
+    slices = [workload[index::workers] for index in range(workers)]
+    with multiprocessing.Pool(workers) as pool:
+        return _merge(pool.map(_process_worker, slices))
+
+
+def run_asyncio(workload: Workload, workers: int, redis_client_factory: Callable | None) -> Samples:
+    async def task(controller, part):
+        latencies = []
+        outcomes = Counter()
+        for available_key, reserved_key, amount in part:
+            started = time.perf_counter()
+            result, _ = await controller.execute_lua_reservation_script(available_key, reserved_key, amount)
+            latencies.append(time.perf_counter() - started)
+            outcomes[ProductAmountCacheResults(result).name] += 1
+        return latencies, outcomes
+
+    async def scenario():
+        redis_client = redis_client_factory() if redis_client_factory else None
+        async with AsyncProductStockLogController(redis_client) as controller:
+            return await asyncio.gather(*(
+                task(controller, workload[index::workers]) for index in range(workers)
+            ))
+
+    return _merge(asyncio.run(scenario()))
+
+
+def _merge(samples) -> Samples:
+    latencies = []
+    outcomes = Counter()
+    for part_latencies, part_outcomes in samples:
+        latencies += part_latencies
+        outcomes += part_outcomes
+    return latencies, outcomes
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def summarize(latencies: list[float], outcomes: Counter, elapsed: float) -> dict:
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "seconds": round(elapsed, 3),
+        "ops_per_sec": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "latency_us": {
+            name: round(percentile(latencies, fraction) * 1e6, 1)
+            for name, fraction in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99), ("p999", 0.999))
+        },
+        "outcomes": dict(outcomes),
+    }
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _fakeredis_factories() -> tuple[Callable, Callable]:
+    try:
+        import fakeredis
+    except ImportError:
+        raise SystemExit("--backend fakeredis требует пакет fakeredis (и lupa для Lua-скриптов)")
+    server = fakeredis.FakeServer()
+    return (
+        lambda: fakeredis.FakeStrictRedis(server=server),
+        lambda: fakeredis.FakeAsyncRedis(server=server),
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["threads", "processes", "asyncio"], default="threads")
+    parser.add_argument("--workers", type=int, default=16, help="потоки, процессы или задачи asyncio")
+    parser.add_argument("--requests", type=int, default=100000)
+    parser.add_argument("--skus", type=int, default=1000)
+    parser.add_argument("--zipf", type=float, default=1.0, help="0 - равномерно, больше - горячее")
+    parser.add_argument("--amount-min", type=int, default=1)
+    parser.add_argument("--amount-max", type=int, default=1)
+    parser.add_argument("--initial-stock", type=int, default=1000)
+    parser.add_argument("--backend", choices=["redis", "fakeredis"], default="redis")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", dest="json_path", help="куда сохранить результат в JSON")
+    args = parser.parse_args()
+
+    if args.backend == "fakeredis":
+        if args.mode == "processes":
+            parser.error("--backend fakeredis не поддерживает --mode processes")
+        sync_factory, async_factory = _fakeredis_factories()
+        seed_client = sync_factory()
+    else:
+        sync_factory, async_factory = None, None
+        seed_client = ProductStockLogController().redis_client
+
+    workload = build_workload(
+        args.requests, args.skus, args.zipf, args.amount_min, args.amount_max, args.seed
+    )
+    seed_stock(seed_client, args.skus, args.initial_stock)
+
+    started = time.perf_counter()
+    if args.mode == "threads":
+        latencies, outcomes = run_threads(
+            workload, args.workers, lambda: ProductStockLogController(sync_factory() if sync_factory else None)
+        )
+    elif args.mode == "processes":
+        latencies, outcomes = run_processes(workload, args.workers)
+    else:
+        latencies, outcomes = run_asyncio(workload, args.workers, async_factory)
+    summary = summarize(latencies, outcomes, time.perf_counter() - started)
+
+    summary["config"] = {name: value for name, value in vars(args).items() if name != "json_path"}
+    summary["commit"] = _git_commit()
+    print(json.dumps(summary, indent=2, ensure_ascii=False))
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as output:
+            json.dump(summary, output, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+"""
+Инструментирование вызовов Lua-скриптов и ожидания соединений из пула.
+
+Хуки - объекты с методами InstrumentationHooks; реестр скриптов вызывает их
+только если они переданы, иначе на горячем пути остаётся одна проверка
+пустого списка:
+
+    metrics = ReservationMetrics()
+    controller = ProductStockLogController(hooks=[metrics])
+    get_connection_pool().wait_hooks.append(metrics)
+    ...
+    metrics.snapshot()
+
+PrometheusHooks и OpenTelemetryHooks доступны, если установлены
+prometheus_client или opentelemetry-api.
+"""
+import threading
+from collections import Counter
+from typing import Any, Sequence
+
+from enums import ProductAmountCacheResults
+
+try:
+    import prometheus_client
+except ImportError:
+    prometheus_client = None
+
+try:
+    from opentelemetry import metrics as otel_metrics
+except ImportError:
+    otel_metrics = None
+
+
+# Скрипты, первый элемент ответа которых - код ProductAmountCacheResults
+OUTCOME_SCRIPTS = frozenset({
+    "reservation",
+    "multi_reservation",
+    "sharded_reservation",
+    "hash_reservation",
+    "hash_move",
+    "hold_reservation",
+    "finish_hold",
+})
+
+
+def reply_outcomes(name: str, reply: Any) -> list[int]:
+    """Коды ProductAmountCacheResults из ответа скрипта name (пустой список, если их нет)."""
+    if name in ("batch_reservation", "coalesced_reservation"):
+        return list(reply[::2])
+    if name in OUTCOME_SCRIPTS:
+        return [reply[0]]
+    return []
+
+
+class InstrumentationHooks:
+    """
+    Интерфейс хуков; методы по умолчанию ничего не делают.
+
+    elapsed - секунды. on_script_batch получает один замер на pipeline
+    из calls; replies - ответы в порядке calls.
+    """
+
+    def on_script_call(self, name: str, keys: Sequence[str], reply: Any, elapsed: float) -> None:
+        pass
+
+    def on_script_batch(self, name: str, calls: Sequence, replies: list[Any], elapsed: float) -> None:
+        pass
+
+    def on_noscript(self, name: str) -> None:
+        pass
+
+    def on_pool_wait(self, elapsed: float) -> None:
+        pass
+
+
+class LatencyHistogram:
+    """
+    Потокобезопасная гистограмма задержек в духе HdrHistogram.
+
+    Значения хранятся в микросекундах в лог-линейных корзинах: до 2 ** sub_bucket_bits
+    каждая микросекунда - своя корзина, дальше каждая степень двойки делится
+    на 2 ** (sub_bucket_bits - 1) корзин, так что относительная ошибка
+    не превышает 1 / 2 ** (sub_bucket_bits - 1). Память - только занятые корзины.
+    """
+
+    def __init__(self, sub_bucket_bits: int = 7) -> None:
+        self.sub_bucket_bits = sub_bucket_bits
+        self.sub_bucket_count = 1 << sub_bucket_bits
+        self.half_count = self.sub_bucket_count // 2
+        self.count = 0
+        self.max = 0.0
+        self._counts: dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def _index(self, value: int) -> int:
+        if value < self.sub_bucket_count:
+            return value
+        shift = value.bit_length() - self.sub_bucket_bits
+        return self.sub_bucket_count + (shift - 1) * self.half_count + (value >> shift) - self.half_count
+
+    def _upper_bound(self, index: int) -> int:
+        if index < self.sub_bucket_count:
+            return index
+        shift, offset = divmod(index - self.sub_bucket_count, self.half_count)
+        return ((offset + self.half_count + 1) << (shift + 1)) - 1
+
+    def record(self, seconds: float) -> None:
+        index = self._index(int(seconds * 1e6))
+        with self._lock:
+            self._counts[index] = self._counts.get(index, 0) + 1
+            self.count += 1
+            if seconds > self.max:
+                self.max = seconds
+
+    def percentile(self, fraction: float) -> float:
+        """Верхняя граница корзины, в которую попал fraction-квантиль, в секундах."""
+        with self._lock:
+            if not self.count:
+                return 0.0
+            threshold = max(1, round(self.count * fraction))
+            seen = 0
+            for index in sorted(self._counts):
+                seen += self._counts[index]
+                if seen >= threshold:
+                    return min(self._upper_bound(index) / 1e6, self.max)
+        return self.max
+
+    def snapshot(self) -> dict[str, float]:
+        return {
+            "count": self.count,
+            "p50": self.percentile(0.5),
+            "p95": self.percentile(0.95),
+            "p99": self.percentile(0.99),
+            "p999": self.percentile(0.999),
+            "max": self.max,
+        }
+
+
+class ReservationMetrics(InstrumentationHooks):
+    """
+    Встроенный сборщик: гистограмма задержек на скрипт, счётчики исходов,
+    NOSCRIPT и ожиданий пула.
+
+    outcomes считает (script, код ProductAmountCacheResults); имена кодов
+    подставляет snapshot, чтобы не тратить на них время на горячем пути.
+
+    track_keys включает счётчик вызовов по первому ключу (горячие SKU);
+    после max_tracked_keys разных ключей новые считаются под "<other>".
+    """
+
+    def __init__(self, track_keys: bool = False, max_tracked_keys: int = 1000) -> None:
+        self.track_keys = track_keys
+        self.max_tracked_keys = max_tracked_keys
+        self.latency: dict[str, LatencyHistogram] = {}
+        self.pool_wait = LatencyHistogram()
+        self.outcomes: Counter = Counter()
+        self.noscript: Counter = Counter()
+        self.keys: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def _histogram(self, name: str) -> LatencyHistogram:
+        histogram = self.latency.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self.latency.setdefault(name, LatencyHistogram())
+        return histogram
+
+    def _count(self, name: str, replies: Sequence[Any], keys: Sequence[Sequence[str]]) -> None:
+        with self._lock:
+            for reply in replies:
+                for code in reply_outcomes(name, reply):
+                    self.outcomes[(name, code)] += 1
+            if self.track_keys:
+                for call_keys in keys:
+                    key = call_keys[0] if call_keys else None
+                    if key not in self.keys and len(self.keys) >= self.max_tracked_keys:
+                        key = "<other>"
+                    self.keys[key] += 1
+
+    def on_script_call(self, name: str, keys: Sequence[str], reply: Any, elapsed: float) -> None:
+        self._histogram(name).record(elapsed)
+        self._count(name, [reply], [keys])
+
+    def on_script_batch(self, name: str, calls: Sequence, replies: list[Any], elapsed: float) -> None:
+        self._histogram(f"{name}:pipeline").record(elapsed)
+        self._count(name, replies, [keys for keys, _ in calls])
+
+    def on_noscript(self, name: str) -> None:
+        with self._lock:
+            self.noscript[name] += 1
+
+    def on_pool_wait(self, elapsed: float) -> None:
+        self.pool_wait.record(elapsed)
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            "latency": {name: histogram.snapshot() for name, histogram in list(self.latency.items())},
+            "pool_wait": self.pool_wait.snapshot(),
+            "outcomes": {
+                f"{name}:{ProductAmountCacheResults(code).name}": count
+                for (name, code), count in list(self.outcomes.items())
+            },
+            "noscript": dict(self.noscript),
+            "keys": dict(self.keys.most_common(20)),
+        }
+
+
+class PrometheusHooks(InstrumentationHooks):
+    """Экспорт в prometheus_client; метрики регистрируются в registry (по умолчанию глобальном)."""
+
+    def __init__(self, registry: Any = None, namespace: str = "stock") -> None:
+        if prometheus_client is None:
+            raise RuntimeError("PrometheusHooks требует пакет prometheus_client")
+        if registry is None:
+            registry = prometheus_client.REGISTRY
+        self.latency = prometheus_client.Histogram(
+            "script_duration_seconds", "Длительность вызова Lua-скрипта",
+            ["script"], namespace=namespace, registry=registry,
+        )
+        self.outcomes = prometheus_client.Counter(
+            "script_outcomes_total", "Исходы резервирований",
+            ["script", "outcome"], namespace=namespace, registry=registry,
+        )
+        self.noscript = prometheus_client.Counter(
+            "script_noscript_total", "Ответы NOSCRIPT",
+            ["script"], namespace=namespace, registry=registry,
+        )
+        self.pool_wait = prometheus_client.Histogram(
+            "pool_wait_seconds", "Ожидание соединения из пула",
+            namespace=namespace, registry=registry,
+        )
+
+    def _count(self, name: str, replies: Sequence[Any]) -> None:
+        for reply in replies:
+            for code in reply_outcomes(name, reply):
+                self.outcomes.labels(name, ProductAmountCacheResults(code).name).inc()
+
+    def on_script_call(self, name: str, keys: Sequence[str], reply: Any, elapsed: float) -> None:
+        self.latency.labels(name).observe(elapsed)
+        self._count(name, [reply])
+
+    def on_script_batch(self, name: str, calls: Sequence, replies: list[Any], elapsed: float) -> None:
+        self.latency.labels(f"{name}:pipeline").observe(elapsed)
+        self._count(name, replies)
+
+    def on_noscript(self, name: str) -> None:
+        self.noscript.labels(name).inc()
+
+    def on_pool_wait(self, elapsed: float) -> None:
+        self.pool_wait.observe(elapsed)
+
+
+class OpenTelemetryHooks(InstrumentationHooks):
+    """Экспорт через OpenTelemetry Metrics API; meter по умолчанию - глобальный."""
+
+    def __init__(self, meter: Any = None) -> None:
+        if otel_metrics is None:
+            raise RuntimeError("OpenTelemetryHooks требует пакет opentelemetry-api")
+        if meter is None:
+            meter = otel_metrics.get_meter("stock_reservation")
+        self.latency = meter.create_histogram("stock.script.duration", unit="s")
+        self.outcomes = meter.create_counter("stock.script.outcomes")
+        self.noscript = meter.create_counter("stock.script.noscript")
+        self.pool_wait = meter.create_histogram("stock.pool.wait", unit="s")
+
+    def _count(self, name: str, replies: Sequence[Any]) -> None:
+        for reply in replies:
+            for code in reply_outcomes(name, reply):
+                self.outcomes.add(1, {"script": name, "outcome": ProductAmountCacheResults(code).name})
+
+    def on_script_call(self, name: str, keys: Sequence[str], reply: Any, elapsed: float) -> None:
+        self.latency.record(elapsed, {"script": name})
+        self._count(name, [reply])
+
+    def on_script_batch(self, name: str, calls: Sequence, replies: list[Any], elapsed: float) -> None:
+        self.latency.record(elapsed, {"script": f"{name}:pipeline"})
+        self._count(name, replies)
+
+    def on_noscript(self, name: str) -> None:
+        self.noscript.add(1, {"script": name})
+
+    def on_pool_wait(self, elapsed: float) -> None:
+        self.pool_wait.record(elapsed)
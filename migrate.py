@@ -0,0 +1,68 @@
+"""
+Миграция стока из пар строковых ключей в хэши.
+
+<prefix>:available + <prefix>:reserved -> хэш <prefix> с полями
+available/reserved/sold/version. Ключи перебираются SCAN пачками, каждая
+пачка переносится одним вызовом Lua, поэтому Redis не блокируется надолго.
+Рассчитано на standalone Redis.
+
+    python migrate.py --match "stock:*:available" --batch-size 1000 --delete-old
+"""
+import argparse
+from typing import Iterator
+
+import redis
+
+from connection import get_connection_pool
+from script_registry import ScriptRegistry
+
+
+AVAILABLE_SUFFIX = ":available"
+RESERVED_SUFFIX = ":reserved"
+
+
+def _scan_batches(client: redis.StrictRedis, match: str, batch_size: int) -> Iterator[list[str]]:
+    batch = []
+    for key in client.scan_iter(match=match, count=batch_size):
+        key = key.decode() if isinstance(key, bytes) else key
+        if key.endswith(AVAILABLE_SUFFIX):
+            batch.append(key)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def migrate_to_hash(
+  client: redis.StrictRedis,
+  match: str = "*" + AVAILABLE_SUFFIX,
+  batch_size: int = 1000,
+  delete_old: bool = False
+) -> int:
+    """Переносит все найденные пары ключей в хэши и возвращает число перенесённых SKU."""
+    scripts = ScriptRegistry(client)
+    migrated = 0
+    for batch in _scan_batches(client, match, batch_size):
+        keys = []
+        for available_key in batch:
+            stock_key = available_key[:-len(AVAILABLE_SUFFIX)]
+            keys += [available_key, stock_key + RESERVED_SUFFIX, stock_key]
+        migrated += scripts.execute("migrate_to_hash", keys, ["1" if delete_old else "0"])
+    return migrated
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--match", default="*" + AVAILABLE_SUFFIX)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--delete-old", action="store_true")
+    args = parser.parse_args()
+
+    client = redis.StrictRedis(connection_pool=get_connection_pool())
+    migrated = migrate_to_hash(client, args.match, args.batch_size, args.delete_old)
+    print(f"Перенесено SKU: {migrated}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Резервирования из нескольких процессов.
+
+Потоки упираются в GIL, если вокруг резервирований много Python-кода.
+ReservationProcessPool раздаёт пачки запросов процессам; у каждого процесса
+свои пул соединений (connection.py забывает пулы родителя после fork) и
+реестр скриптов, общие только settings и переменные окружения.
+
+    with ReservationProcessPool(processes=8) as pool:
+        results = pool.reserve(requests)
+"""
+import concurrent.futures
+import multiprocessing
+import os
+from typing import Sequence
+
+from redis_controller import ProductStockLogController, ReservationRequest
+
+
+_worker_controller: ProductStockLogController | None = None
+
+
+def _init_worker() -> None:
+    global _worker_controller
+    _worker_controller = ProductStockLogController()
+    _worker_controller.load_scripts()
+
+
+def _reserve_chunk(requests: Sequence[ReservationRequest]) -> list[tuple[int, int | None]]:
+    return _worker_controller.execute_lua_reservation_batch(requests, chunk_size=len(requests))
+
+
+class ReservationProcessPool:
+    """
+    Пул процессов-исполнителей резервирований.
+
+    processes - число процессов (по умолчанию os.cpu_count()); start_method -
+    "fork", "forkserver" или "spawn" (по умолчанию - метод multiprocessing
+    для платформы). Каждый процесс при старте создаёт свой контроллер
+    и загружает скрипты.
+    """
+
+    def __init__(self, processes: int | None = None, start_method: str | None = None) -> None:
+        self.processes = processes or os.cpu_count() or 1
+        self.executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.processes,
+            mp_context=multiprocessing.get_context(start_method),
+            initializer=_init_worker,
+        )
+
+    def __enter__(self) -> "ReservationProcessPool":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.executor.shutdown()
+
+    def reserve(
+      self,
+      requests: Sequence[ReservationRequest],
+      chunk_size: int = 500
+    ) -> list[tuple[int, int | None]]:
+        """
+        Выполняет независимые резервирования в процессах пула.
+
+        requests режутся на пачки по chunk_size; каждая пачка - один pipeline
+        в одном из процессов. Результаты возвращаются в исходном порядке.
+        """
+        chunks = [requests[start:start + chunk_size] for start in range(0, len(requests), chunk_size)]
+        results = []
+        for chunk_results in self.executor.map(_reserve_chunk, chunks):
+            results += chunk_results
+        return results
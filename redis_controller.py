@@ -1,34 +1,461 @@
-from script import lua_reservation_script
+from typing import Any, Sequence
+import random
+import uuid
+import zlib
+
+from coalescing import ReservationCoalescer
+from connection import get_connection_pool
+from enums import ProductAmountCacheResults
+from keys import bucket_keys, idempotency_key as build_idempotency_key, sku_from_key, stock_hash_key, stock_keys
+from local_cache import TTLCache
+from script_catalog import load_catalog
+from script_registry import ScriptRegistry
+from tracking import KeyInvalidationTracker
 import settings
 import redis
-from redis.commands.core import Script
+
+
+ReservationRequest = tuple[str, str, int]
+
+_NOT_CACHED = object()
+
+
+def _reservation_call(
+  available_key: str,
+  reserved_key: str,
+  required_amount: int,
+  idempotency_key: str | None,
+  events_stream: str | None = None
+) -> tuple[list[str], list]:
+    keys = [available_key, reserved_key]
+    args = [required_amount]
+    if idempotency_key is not None:
+        keys.append(build_idempotency_key(available_key, idempotency_key))
+        args.append(settings.IDEMPOTENCY_TTL)
+    if events_stream is not None:
+        if idempotency_key is None:
+            args.append("")
+        keys.append(events_stream)
+        args += [settings.STOCK_EVENTS_MAXLEN, sku_from_key(available_key)]
+    return keys, args
+
+
+def _batch_calls(
+  requests: Sequence[ReservationRequest],
+  events_stream: str | None = None
+) -> list[tuple[list[str], list]]:
+    return [
+        _reservation_call(available_key, reserved_key, required_amount, None, events_stream)
+        for available_key, reserved_key, required_amount in requests
+    ]
+
+
+def _multi_reservation_args(
+  items: Sequence[ReservationRequest],
+  events_stream: str | None = None
+) -> tuple[list[str], list]:
+    keys = []
+    args = []
+    for available_key, reserved_key, required_amount in items:
+        keys += [available_key, reserved_key]
+        args.append(required_amount)
+    if events_stream is not None:
+        keys.append(events_stream)
+        args = [settings.STOCK_EVENTS_MAXLEN, *args, *[sku_from_key(available_key) for available_key, _, _ in items]]
+    return keys, args
+
+
+def _hold_key(reservation_id: str) -> str:
+    return f"{settings.HOLD_KEY_PREFIX}{reservation_id}"
+
+
+def _hold_call(
+  available_key: str,
+  reserved_key: str,
+  required_amount: int,
+  ttl: int,
+  reservation_id: str,
+  events_stream: str | None = None
+) -> tuple[list[str], list]:
+    keys = [available_key, reserved_key, _hold_key(reservation_id), settings.HOLDS_EXPIRY_KEY]
+    args = [required_amount, ttl, reservation_id, sku_from_key(available_key)]
+    if events_stream is not None:
+        keys.append(events_stream)
+        args.append(settings.STOCK_EVENTS_MAXLEN)
+    return keys, args
+
+
+def _finish_hold_call(reservation_id: str, mode: str, events_stream: str | None = None) -> tuple[list[str], list]:
+    keys = [_hold_key(reservation_id), settings.HOLDS_EXPIRY_KEY]
+    args = [reservation_id, settings.HOLD_TOMBSTONE_TTL, mode]
+    if events_stream is not None:
+        keys.append(events_stream)
+        args.append(settings.STOCK_EVENTS_MAXLEN)
+    return keys, args
+
+
+def _sweep_call(batch_size: int, events_stream: str | None = None) -> tuple[list[str], list]:
+    keys = [settings.HOLDS_EXPIRY_KEY]
+    args = [batch_size, settings.HOLD_TOMBSTONE_TTL, settings.HOLD_KEY_PREFIX]
+    if events_stream is not None:
+        keys.append(events_stream)
+        args.append(settings.STOCK_EVENTS_MAXLEN)
+    return keys, args
+
+
+def _bucket_order(buckets: int, routing_key: str | None) -> list[int]:
+    if routing_key is None:
+        start = random.randrange(buckets)
+    else:
+        start = zlib.crc32(routing_key.encode()) % buckets
+    return [(start + offset) % buckets for offset in range(buckets)]
+
+
+def _multi_reservation_result(reply: list) -> tuple[int, list[tuple[int, int | None]]]:
+    overall, *lines = reply
+    return overall, list(zip(lines[::2], lines[1::2]))
 
 
 class ProductStockLogController:
-    def __init__(self) -> None:
+    def __init__(
+      self,
+      redis_client: redis.StrictRedis | None = None,
+      sold_out_cache_ttl: float = settings.SOLD_OUT_CACHE_TTL,
+      hooks: Sequence[Any] = (),
+      coalesce_window: float = settings.COALESCE_WINDOW,
+      events_stream: str | None = settings.STOCK_EVENTS_STREAM,
+      availability_cache_ttl: float = settings.AVAILABILITY_CACHE_TTL
+    ) -> None:
+        """
+        hooks - объекты metrics.InstrumentationHooks для замеров вызовов скриптов.
+        coalesce_window - окно в секундах, в котором одновременные резервирования
+        одной пары ключей объединяются в один вызов Lua (0 - без объединения).
+        events_stream - стрим, в который скрипты, меняющие available/reserved,
+        атомарно пишут события (см. events.py); None - события не пишутся.
+        availability_cache_ttl - на сколько секунд get_availability может
+        запомнить остаток SKU в памяти процесса (0 - без кэша).
+        """
         self.redis_host = settings.REDIS_HOST
         self.redis_port = settings.REDIS_PORT
         self.redis_db = settings.REDIS_DB
-        self.redis_client = self._get_redis_client()
+        self.redis_client = redis_client or self._get_redis_client()
+        self.scripts = ScriptRegistry(self.redis_client, hooks=hooks)
+        # available_key -> последний available, при котором резервирование не прошло
+        self.sold_out_cache = TTLCache(settings.SOLD_OUT_CACHE_SIZE, sold_out_cache_ttl) if sold_out_cache_ttl else None
+        self.invalidation_listener = None
+        # ключ Redis (available или хэш SKU) -> остаток или None, если SKU нет
+        self.availability_cache = (
+            TTLCache(settings.AVAILABILITY_CACHE_SIZE, availability_cache_ttl) if availability_cache_ttl else None
+        )
+        self.availability_tracker = None
+        self.events_stream = events_stream
+        self.coalescer = (
+            ReservationCoalescer(self.scripts, coalesce_window, settings.COALESCE_MAX_BATCH, events_stream)
+            if coalesce_window else None
+        )
 
     def _get_redis_client(self) -> redis.StrictRedis:
-        redis_client = redis.StrictRedis(
-            host=self.redis_host, 
-            port=self.redis_port, 
-            db=self.redis_db)
-        return redis_client
+        return redis.StrictRedis(connection_pool=get_connection_pool())
+
+    def load_scripts(self) -> None:
+        self.scripts.load()
 
+    def activate_script_version(self, version: str, directory: str = settings.SCRIPT_CATALOG_DIR) -> None:
+        """
+        Переключает контроллер на версию скриптов из каталога (script_catalog.py).
 
-    def _get_lua_reservation_script(self) -> Script:
-        self.lua_reservation_script = self.redis_client.register_script(lua_reservation_script)
-        return self.lua_reservation_script
+        Скрипты новой версии загружаются в Redis до переключения; вызовы,
+        начатые до него, завершаются на прежней версии.
+        """
+        self.scripts.activate(load_catalog(version, directory))
 
     def execute_lua_reservation_script(
       self, 
       available_key: str, 
       reserved_key: str, 
-      required_amount: int
+      required_amount: int,
+      idempotency_key: str | None = None
     ) -> tuple[int, int | None]:
-        lua_script: Script = self._get_lua_reservation_script()
-        result, current_amount = lua_script(keys=[available_key, reserved_key], args=[required_amount])
-        return result, current_amount
\ No newline at end of file
+        """
+        idempotency_key - необязательный идентификатор запроса клиента.
+        Повтор с тем же ключом в течение settings.IDEMPOTENCY_TTL секунд
+        возвращает результат первого вызова и не резервирует товар повторно.
+        Такие запросы не объединяются с другими (coalesce_window) и не проходят
+        через кэш "нет в наличии": повтор должен получить сохранённый результат,
+        даже если SKU с тех пор распродан.
+        """
+        sold_out_cache = self.sold_out_cache if idempotency_key is None else None
+        # Некорректное количество (не int, не больше нуля) проверяет скрипт
+        if sold_out_cache is not None and isinstance(required_amount, int) and required_amount > 0:
+            cached_available = sold_out_cache.get(available_key)
+            if cached_available is not None and cached_available < required_amount:
+                return ProductAmountCacheResults.NOT_ENOUGH_AMOUNT, cached_available
+        if self.coalescer is not None and idempotency_key is None:
+            result, current_amount = self.coalescer.reserve(available_key, reserved_key, required_amount)
+        else:
+            keys, args = _reservation_call(
+                available_key, reserved_key, required_amount, idempotency_key, self.events_stream
+            )
+            result, current_amount = self.scripts.execute("reservation", keys, args)
+        if sold_out_cache is not None:
+            if result == ProductAmountCacheResults.NOT_ENOUGH_AMOUNT:
+                sold_out_cache.set(available_key, current_amount)
+            elif result in (ProductAmountCacheResults.ENOUGH_AMOUNT, ProductAmountCacheResults.KEY_NOT_EXIST):
+                sold_out_cache.pop(available_key)
+        return result, current_amount
+
+    def notify_stock_replenished(self, available_key: str) -> None:
+        """Сообщает всем контроллерам с кэшем "нет в наличии", что сток пополнен."""
+        self.redis_client.publish(settings.STOCK_INVALIDATION_CHANNEL, available_key)
+
+    def start_invalidation_listener(self) -> None:
+        """
+        Подписывается на settings.STOCK_INVALIDATION_CHANNEL в фоновом потоке
+        и удаляет из кэша "нет в наличии" пополненные ключи.
+        """
+        if self.sold_out_cache is None or self.invalidation_listener is not None:
+            return
+        pubsub = self.redis_client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(**{
+            settings.STOCK_INVALIDATION_CHANNEL: lambda message: self.sold_out_cache.pop(message["data"].decode())
+        })
+        self.invalidation_listener = pubsub.run_in_thread(sleep_time=0.1, daemon=True)
+
+    def stop_invalidation_listener(self) -> None:
+        if self.invalidation_listener is not None:
+            self.invalidation_listener.stop()
+            self.invalidation_listener = None
+
+    def get_availability(
+      self,
+      skus: Sequence[str | int],
+      layout: str = "keys",
+      chunk_size: int = 500
+    ) -> dict[str | int, int | None]:
+        """
+        Текущий available для списка SKU; None - SKU нет в Redis.
+
+        layout="keys" читает keys.stock_keys(sku) через MGET по chunk_size ключей,
+        layout="hash" - поле available хэша keys.stock_hash_key(sku) через HGET.
+        Все команды уходят одним pipeline, то есть за один round trip. С кэшем
+        (availability_cache_ttl) SKU из кэша в Redis не запрашиваются.
+        """
+        if layout == "keys":
+            redis_keys = {sku: stock_keys(sku)[0] for sku in skus}
+        elif layout == "hash":
+            redis_keys = {sku: stock_hash_key(sku) for sku in skus}
+        else:
+            raise ValueError(f"Неизвестный layout: {layout}")
+
+        availability = {}
+        missing = []
+        for sku, key in redis_keys.items():
+            cached = _NOT_CACHED if self.availability_cache is None else self.availability_cache.get(key, _NOT_CACHED)
+            if cached is _NOT_CACHED:
+                missing.append(key)
+            else:
+                availability[sku] = cached
+        if missing:
+            values = dict(zip(missing, self._read_availability(missing, layout, chunk_size)))
+            for sku, key in redis_keys.items():
+                if key in values:
+                    availability[sku] = values[key]
+                    if self.availability_cache is not None:
+                        self.availability_cache.set(key, values[key])
+        return {sku: availability[sku] for sku in redis_keys}
+
+    def _read_availability(self, redis_keys: list[str], layout: str, chunk_size: int) -> list[int | None]:
+        pipe = self.redis_client.pipeline(transaction=False)
+        if layout == "keys":
+            for start in range(0, len(redis_keys), chunk_size):
+                pipe.mget(redis_keys[start:start + chunk_size])
+            values = [value for chunk in pipe.execute() for value in chunk]
+        else:
+            for key in redis_keys:
+                pipe.hget(key, "available")
+            values = pipe.execute()
+        return [None if value is None else int(value) for value in values]
+
+    def start_availability_tracking(self) -> None:
+        """
+        Включает серверную инвалидацию кэша get_availability через CLIENT TRACKING
+        (Redis 6+, см. tracking.py): изменённые в Redis SKU сразу удаляются
+        из кэша, а TTL остаётся пределом устаревания на случай обрыва соединения.
+        """
+        if self.availability_cache is None or self.availability_tracker is not None:
+            return
+        tracker = KeyInvalidationTracker(self.availability_cache, [f"{settings.STOCK_KEY_PREFIX}:"])
+        tracker.start()
+        self.availability_tracker = tracker
+
+    def stop_availability_tracking(self) -> None:
+        if self.availability_tracker is not None:
+            self.availability_tracker.stop()
+            self.availability_tracker = None
+
+    def execute_lua_reservation_batch(
+      self,
+      requests: Sequence[ReservationRequest],
+      chunk_size: int = 500
+    ) -> list[tuple[int, int | None]]:
+        """
+        Выполняет независимые резервирования пачками через pipeline.
+
+        requests - последовательность (available_key, reserved_key, required_amount).
+        Каждая резервация успешна или нет сама по себе; на каждые chunk_size
+        запросов уходит один round trip. Результаты возвращаются в исходном порядке.
+        """
+        replies = self.scripts.execute_many("reservation", _batch_calls(requests, self.events_stream), chunk_size)
+        return [(result, current_amount) for result, current_amount in replies]
+
+    def reserve_many(
+      self,
+      items: Sequence[ReservationRequest]
+    ) -> tuple[int, list[tuple[int, int | None]]]:
+        """
+        Атомарно резервирует все строки корзины одним вызовом Lua.
+
+        items - последовательность (available_key, reserved_key, required_amount).
+        Либо применяются все строки, либо ни одна. Возвращает общий результат
+        и (result, current_amount) для каждой строки в исходном порядке.
+        """
+        keys, args = _multi_reservation_args(items, self.events_stream)
+        return _multi_reservation_result(self.scripts.execute("multi_reservation", keys, args))
+
+
+    def execute_sharded_reservation(
+      self,
+      sku: str | int,
+      required_amount: int,
+      buckets: int = settings.STOCK_BUCKETS,
+      routing_key: str | None = None
+    ) -> tuple[int, int | None]:
+        """
+        Резервирует товар горячего SKU, сток которого разбит на бакеты (keys.bucket_keys).
+
+        Первый бакет выбирается по routing_key или случайно, дальше бакеты
+        перебираются по кругу до первого, где хватает товара. Если ни в одном
+        бакете не хватает, но хватает суммы, товар берётся из нескольких бакетов
+        в том же порядке: NOT_ENOUGH_AMOUNT означает, что суммарного остатка
+        меньше required_amount. При успехе current_amount - остаток последнего
+        бакета, из которого брался товар, при NOT_ENOUGH_AMOUNT - суммарный
+        остаток всех бакетов.
+        """
+        keys = [key for bucket in _bucket_order(buckets, routing_key) for key in bucket_keys(sku, bucket)]
+        args = [required_amount]
+        if self.events_stream is not None:
+            keys.append(self.events_stream)
+            args += [settings.STOCK_EVENTS_MAXLEN, sku]
+        result, current_amount = self.scripts.execute("sharded_reservation", keys, args)
+        return result, current_amount
+
+    def rebalance_stock_buckets(self, sku: str | int, buckets: int = settings.STOCK_BUCKETS) -> int:
+        """
+        Выравнивает available между бакетами SKU и возвращает суммарный остаток.
+
+        Подходит и для первичного разбиения: положите весь сток в бакет 0
+        и вызовите rebalance. Суммарный остаток не меняется, событий нет.
+        """
+        keys = [key for bucket in range(buckets) for key in bucket_keys(sku, bucket)]
+        return self.scripts.execute("rebalance_buckets", keys, [])
+
+    def execute_hash_reservation_script(self, stock_key: str, required_amount: int) -> tuple[int, int | None]:
+        """
+        Резервирование для стока, хранящегося в одном хэше (keys.stock_hash_key).
+
+        Коды результата те же, что у execute_lua_reservation_script.
+        """
+        keys, args = self._hash_call(stock_key, [required_amount])
+        result, current_amount = self.scripts.execute("hash_reservation", keys, args)
+        return result, current_amount
+
+    def _hash_call(self, stock_key: str, args: list) -> tuple[list[str], list]:
+        if self.events_stream is None:
+            return [stock_key], args
+        return [stock_key, self.events_stream], args + [settings.STOCK_EVENTS_MAXLEN, sku_from_key(stock_key)]
+
+    def execute_hash_reservation_batch(
+      self,
+      requests: Sequence[tuple[str, int]],
+      chunk_size: int = 500
+    ) -> list[tuple[int, int | None]]:
+        calls = [self._hash_call(stock_key, [required_amount]) for stock_key, required_amount in requests]
+        replies = self.scripts.execute_many("hash_reservation", calls, chunk_size)
+        return [(result, current_amount) for result, current_amount in replies]
+
+    def release_hash_reservation(self, stock_key: str, amount: int) -> tuple[int, int | None]:
+        """Возвращает amount из reserved в available; current_amount - остаток reserved."""
+        return self._move_hash_stock(stock_key, "reserved", "available", amount)
+
+    def commit_hash_reservation(self, stock_key: str, amount: int) -> tuple[int, int | None]:
+        """Переводит amount из reserved в sold; current_amount - остаток reserved."""
+        return self._move_hash_stock(stock_key, "reserved", "sold", amount)
+
+    def _move_hash_stock(self, stock_key: str, from_field: str, to_field: str, amount: int) -> tuple[int, int | None]:
+        keys, args = self._hash_call(stock_key, [from_field, to_field, amount])
+        if self.events_stream is not None:
+            args.append("release" if to_field == "available" else "commit")
+        result, current_amount = self.scripts.execute("hash_move", keys, args)
+        return result, current_amount
+
+    def get_stock_record(self, stock_key: str) -> dict[str, int] | None:
+        """Полное состояние SKU одной командой HGETALL или None, если его нет."""
+        record = self.redis_client.hgetall(stock_key)
+        if not record:
+            return None
+        return {field.decode(): int(value) for field, value in record.items()}
+
+    def reserve_hold(
+      self,
+      available_key: str,
+      reserved_key: str,
+      required_amount: int,
+      ttl: int = settings.HOLD_TTL
+    ) -> tuple[int, int | None, str | None]:
+        """
+        Резервирует товар как холд с временем жизни ttl секунд.
+
+        Возвращает (result, current_amount, reservation_id); reservation_id
+        равен None, если резервирование не прошло. Холд снимается через
+        release/commit, а просроченные возвращает в available sweep_expired_holds.
+        """
+        reservation_id = uuid.uuid4().hex
+        keys, args = _hold_call(available_key, reserved_key, required_amount, ttl, reservation_id, self.events_stream)
+        result, current_amount = self.scripts.execute("hold_reservation", keys, args)
+        if result != ProductAmountCacheResults.ENOUGH_AMOUNT:
+            return result, current_amount, None
+        return result, current_amount, reservation_id
+
+    def release(self, reservation_id: str) -> tuple[int, int | None]:
+        """
+        Возвращает количество холда из reserved в available.
+
+        ENOUGH_AMOUNT - холд снят, current_amount - новый available;
+        ALREADY_RELEASED - холд уже снят (release, commit или sweep);
+        UNKNOWN_HOLD - такого холда нет.
+        """
+        return self._finish_hold(reservation_id, "release")
+
+    def commit(self, reservation_id: str) -> tuple[int, int | None]:
+        """
+        Подтверждает холд: количество списывается из reserved окончательно.
+
+        Коды результата те же, что у release; current_amount - текущий available.
+        """
+        return self._finish_hold(reservation_id, "commit")
+
+    def _finish_hold(self, reservation_id: str, mode: str) -> tuple[int, int | None]:
+        keys, args = _finish_hold_call(reservation_id, mode, self.events_stream)
+        result, current_amount = self.scripts.execute("finish_hold", keys, args)
+        return result, current_amount
+
+    def sweep_expired_holds(self, batch_size: int = settings.HOLD_SWEEP_BATCH_SIZE) -> tuple[int, int]:
+        """
+        Возвращает в available не больше batch_size просроченных холдов за вызов.
+
+        Возвращает (released, processed); processed == batch_size означает, что
+        просроченные холды, возможно, ещё остались.
+        """
+        keys, args = _sweep_call(batch_size, self.events_stream)
+        released, processed = self.scripts.execute("sweep_holds", keys, args)
+        return released, processed
@@ -1,5 +1,13 @@
+# Проверка количества из ARGV: только целое число больше нуля.
+lua_valid_amount_function = """
+local function valid_amount(amount)
+    return amount ~= nil and amount > 0 and amount % 1 == 0
+end
+"""
 
-lua_reservation_script = """
+# Исходный вариант скрипта резервирования (до 6 команд на вызов). Не входит
+# в SCRIPTS, оставлен для сравнения в benchmark.py commands.
+lua_legacy_reservation_script = """
 local available_key = KEYS[1]
 local reserved_key = KEYS[2]
 local required_amount = tonumber(ARGV[1])
@@ -15,4 +23,481 @@ if current_available >= required_amount then
 else
     return {3, current_available}
 end
-"""
\ No newline at end of file
+"""
+
+# XADD события в стрим: поля kind (reservation, release, commit, expire), sku,
+# amount, result, available (пусто, если остатка нет). MAXLEN ~ обрезает стрим
+# целыми узлами, без лишней работы.
+lua_stock_event_function = """
+local function add_stock_event(stream_key, max_length, kind, sku, amount, result, current_available)
+    redis.call("XADD", stream_key, "MAXLEN", "~", max_length, "*",
+        "kind", kind, "sku", sku, "amount", amount, "result", result, "available", current_available or "")
+end
+"""
+
+# Ключ идемпотентности (необязательный) - KEYS[3], если ARGV[2] (его TTL
+# в секундах) не пустой. Первый вызов сохраняет результат под этим ключом,
+# повторы возвращают сохранённый результат, не трогая счётчики.
+# Если заданы ARGV[3] (MAXLEN) и ARGV[4] (SKU), последний ключ - стрим
+# событий: каждый ответ, кроме повтора идемпотентного запроса, пишется в него.
+# Без ключа идемпотентности и стрима: MGET при отказе, MGET + INCRBY + DECRBY при успехе.
+lua_reservation_script = lua_valid_amount_function + lua_stock_event_function + """
+local available_key = KEYS[1]
+local reserved_key = KEYS[2]
+local idempotency_key = ARGV[2] and ARGV[2] ~= "" and KEYS[3] or nil
+local stream_key = ARGV[3] and KEYS[#KEYS] or nil
+local required_amount = tonumber(ARGV[1])
+local function reply(result, current_available)
+    if idempotency_key then
+        redis.call("SET", idempotency_key, result .. ":" .. (current_available or ""), "EX", ARGV[2])
+    end
+    if stream_key then
+        add_stock_event(stream_key, ARGV[3], "reservation", ARGV[4], ARGV[1], result, current_available)
+    end
+    return {result, current_available}
+end
+if idempotency_key then
+    local stored = redis.call("GET", idempotency_key)
+    if stored then
+        local result, current_available = string.match(stored, "^(%d+):(%-?%d*)$")
+        return {tonumber(result), tonumber(current_available) or false}
+    end
+end
+if not valid_amount(required_amount) then
+    return reply(6, false)
+end
+local values = redis.call("MGET", available_key, reserved_key)
+if not values[1] or not values[2] then
+    return reply(1, false)
+end
+local current_available = tonumber(values[1])
+if current_available < required_amount then
+    return reply(3, current_available)
+end
+redis.call("INCRBY", reserved_key, required_amount)
+return reply(2, redis.call("DECRBY", available_key, required_amount))
+"""
+
+# Корзина: KEYS - пары (available, reserved), ARGV - количества строк. Если
+# число KEYS нечётное, последний ключ - стрим событий; тогда ARGV[1] - MAXLEN,
+# за ним количества и SKU строк. Событие пишется на каждую строку; строка, которой
+# хватало товара, при отказе корзины получает в событии общий результат.
+lua_multi_reservation_script = lua_valid_amount_function + lua_stock_event_function + """
+local stream_key = #KEYS % 2 == 1 and KEYS[#KEYS] or nil
+local first = stream_key and 2 or 1
+local lines = stream_key and (#ARGV - 1) / 2 or #ARGV
+local available = {}
+local required = {}
+local results = {}
+local overall = 2
+for i = 1, lines do
+    local available_key = KEYS[2 * i - 1]
+    local reserved_key = KEYS[2 * i]
+    local required_amount = tonumber(ARGV[first + i - 1])
+    if not valid_amount(required_amount) then
+        results[2 * i] = 6
+        results[2 * i + 1] = false
+        overall = 6
+    elseif redis.call("EXISTS", available_key) == 0 or redis.call("EXISTS", reserved_key) == 0 then
+        results[2 * i] = 1
+        results[2 * i + 1] = false
+        if overall ~= 6 then
+            overall = 1
+        end
+    else
+        if available[available_key] == nil then
+            available[available_key] = tonumber(redis.call("GET", available_key))
+            required[available_key] = 0
+        end
+        required[available_key] = required[available_key] + required_amount
+        results[2 * i + 1] = available[available_key]
+        if available[available_key] >= required[available_key] then
+            results[2 * i] = 2
+        else
+            results[2 * i] = 3
+            if overall == 2 then
+                overall = 3
+            end
+        end
+    end
+end
+if overall == 2 then
+    for i = 1, lines do
+        local required_amount = tonumber(ARGV[first + i - 1])
+        results[2 * i + 1] = redis.call("INCRBY", KEYS[2 * i - 1], -required_amount)
+        redis.call("INCRBY", KEYS[2 * i], required_amount)
+    end
+end
+if stream_key then
+    for i = 1, lines do
+        local result = results[2 * i]
+        if overall ~= 2 and result == 2 then
+            result = overall
+        end
+        add_stock_event(stream_key, ARGV[1], "reservation", ARGV[first + lines + i - 1], ARGV[first + i - 1],
+            result, results[2 * i + 1])
+    end
+end
+results[1] = overall
+return results
+"""
+
+# Независимые резервирования нескольких пар ключей одним вызовом: каждая
+# строка применяется или нет сама по себе. Используется для групп ключей
+# одного слота в Redis Cluster.
+lua_batch_reservation_script = lua_valid_amount_function + """
+local results = {}
+for i = 1, #ARGV do
+    local available_key = KEYS[2 * i - 1]
+    local reserved_key = KEYS[2 * i]
+    local required_amount = tonumber(ARGV[i])
+    local values = redis.call("MGET", available_key, reserved_key)
+    if not valid_amount(required_amount) then
+        results[2 * i - 1] = 6
+        results[2 * i] = false
+    elseif not values[1] or not values[2] then
+        results[2 * i - 1] = 1
+        results[2 * i] = false
+    else
+        local current_available = tonumber(values[1])
+        if current_available >= required_amount then
+            results[2 * i - 1] = 2
+            results[2 * i] = redis.call("INCRBY", available_key, -required_amount)
+            redis.call("INCRBY", reserved_key, required_amount)
+        else
+            results[2 * i - 1] = 3
+            results[2 * i] = current_available
+        end
+    end
+end
+return results
+"""
+
+# Объединённые резервирования одной пары ключей (ReservationCoalescer):
+# ARGV - количества в порядке поступления, каждое резервируется или нет так же,
+# как отдельным вызовом reservation. Один MGET и не больше одной пары
+# INCRBY/DECRBY на всю пачку. Ответ - плоский список result, current_available.
+# KEYS[3] (необязательный) - стрим событий; тогда ARGV[1] - MAXLEN, ARGV[2] - SKU,
+# а количества начинаются с ARGV[3].
+lua_coalesced_reservation_script = lua_valid_amount_function + lua_stock_event_function + """
+local available_key = KEYS[1]
+local reserved_key = KEYS[2]
+local stream_key = KEYS[3]
+local first = stream_key and 3 or 1
+local results = {}
+local values = redis.call("MGET", available_key, reserved_key)
+local exists = values[1] and values[2]
+local current_available = tonumber(values[1])
+local granted = 0
+for i = 1, #ARGV - first + 1 do
+    local required_amount = tonumber(ARGV[first + i - 1])
+    if not valid_amount(required_amount) then
+        results[2 * i - 1] = 6
+        results[2 * i] = false
+    elseif not exists then
+        results[2 * i - 1] = 1
+        results[2 * i] = false
+    elseif current_available >= required_amount then
+        current_available = current_available - required_amount
+        granted = granted + required_amount
+        results[2 * i - 1] = 2
+        results[2 * i] = current_available
+    else
+        results[2 * i - 1] = 3
+        results[2 * i] = current_available
+    end
+    if stream_key then
+        add_stock_event(stream_key, ARGV[1], "reservation", ARGV[2], ARGV[first + i - 1], results[2 * i - 1], results[2 * i])
+    end
+end
+if granted > 0 then
+    redis.call("INCRBY", reserved_key, granted)
+    redis.call("DECRBY", available_key, granted)
+end
+return results
+"""
+
+# Шардированный сток: KEYS - пары (available, reserved) бакетов в порядке
+# перебора. Резервирование берётся целиком из первого бакета, где хватает
+# товара; если такого нет, но хватает суммы, - по частям из бакетов в том же
+# порядке. При успехе возвращается остаток последнего бакета, из которого
+# брался товар, иначе - сумма по всем бакетам. Если число KEYS нечётное,
+# последний ключ - стрим событий, ARGV[2] - MAXLEN, ARGV[3] - SKU; в событии
+# available - суммарный остаток всех бакетов.
+lua_sharded_reservation_script = lua_valid_amount_function + lua_stock_event_function + """
+local buckets = math.floor(#KEYS / 2)
+local stream_key = #KEYS % 2 == 1 and KEYS[#KEYS] or nil
+local required_amount = tonumber(ARGV[1])
+local function reply(result, current_available)
+    if stream_key then
+        local total_available = false
+        if result == 2 or result == 3 then
+            total_available = 0
+            for i = 1, buckets do
+                total_available = total_available + (tonumber(redis.call("GET", KEYS[2 * i - 1])) or 0)
+            end
+        end
+        add_stock_event(stream_key, ARGV[2], "reservation", ARGV[3], ARGV[1], result, total_available)
+    end
+    return {result, current_available}
+end
+if not valid_amount(required_amount) then
+    return reply(6, false)
+end
+local found = {}
+local total = 0
+for i = 1, buckets do
+    local available_key = KEYS[2 * i - 1]
+    local reserved_key = KEYS[2 * i]
+    local current_available = redis.call("GET", available_key)
+    if current_available and redis.call("EXISTS", reserved_key) == 1 then
+        current_available = tonumber(current_available)
+        if current_available >= required_amount then
+            redis.call("INCRBY", reserved_key, required_amount)
+            return reply(2, redis.call("INCRBY", available_key, -required_amount))
+        end
+        found[#found + 1] = {i, current_available}
+        total = total + current_available
+    end
+end
+if #found == 0 then
+    return reply(1, false)
+end
+if total < required_amount then
+    return reply(3, total)
+end
+local remaining = required_amount
+local left = 0
+for _, bucket in ipairs(found) do
+    local take = math.min(bucket[2], remaining)
+    if take > 0 then
+        redis.call("INCRBY", KEYS[2 * bucket[1]], take)
+        left = redis.call("INCRBY", KEYS[2 * bucket[1] - 1], -take)
+        remaining = remaining - take
+    end
+    if remaining == 0 then
+        break
+    end
+end
+return reply(2, left)
+"""
+
+# Выравнивает available между бакетами (остаток деления - первым бакетам) и
+# создаёт недостающие reserved. Возвращает суммарный available. Суммарный
+# остаток SKU не меняется, поэтому события не пишутся.
+lua_rebalance_buckets_script = """
+local buckets = #KEYS / 2
+local total = 0
+for i = 1, buckets do
+    total = total + (tonumber(redis.call("GET", KEYS[2 * i - 1])) or 0)
+end
+local share = math.floor(total / buckets)
+local extra = total % buckets
+for i = 1, buckets do
+    local target = share
+    if i <= extra then
+        target = target + 1
+    end
+    redis.call("SET", KEYS[2 * i - 1], target)
+    redis.call("SET", KEYS[2 * i], 0, "NX")
+end
+return total
+"""
+
+# Забирает из available не больше ARGV[1] и возвращает, сколько забрано.
+# Используется для неатомарного rebalance бакетов в кластере.
+lua_take_available_script = """
+local current_available = tonumber(redis.call("GET", KEYS[1])) or 0
+local take = math.min(current_available, tonumber(ARGV[1]))
+if take > 0 then
+    redis.call("DECRBY", KEYS[1], take)
+end
+return take
+"""
+
+# Хранение стока SKU в одном хэше с полями available/reserved/sold/version.
+# KEYS[2] (необязательный) - стрим событий, ARGV[2] - MAXLEN, ARGV[3] - SKU.
+lua_hash_reservation_script = lua_valid_amount_function + lua_stock_event_function + """
+local stock_key = KEYS[1]
+local stream_key = KEYS[2]
+local required_amount = tonumber(ARGV[1])
+local function reply(result, current_available)
+    if stream_key then
+        add_stock_event(stream_key, ARGV[2], "reservation", ARGV[3], ARGV[1], result, current_available)
+    end
+    return {result, current_available}
+end
+if not valid_amount(required_amount) then
+    return reply(6, false)
+end
+local current_available = redis.call("HGET", stock_key, "available")
+if not current_available then
+    return reply(1, false)
+end
+current_available = tonumber(current_available)
+if current_available < required_amount then
+    return reply(3, current_available)
+end
+redis.call("HINCRBY", stock_key, "reserved", required_amount)
+redis.call("HINCRBY", stock_key, "version", 1)
+return reply(2, redis.call("HINCRBY", stock_key, "available", -required_amount))
+"""
+
+# Перенос количества между полями хэша стока: reserved -> available (release)
+# или reserved -> sold (commit). Возвращает остаток поля-источника.
+# KEYS[2] (необязательный) - стрим событий, ARGV[4] - MAXLEN, ARGV[5] - SKU,
+# ARGV[6] - kind события; в событии available - поле available после переноса.
+lua_hash_move_script = lua_valid_amount_function + lua_stock_event_function + """
+local stock_key = KEYS[1]
+local stream_key = KEYS[2]
+local from_field = ARGV[1]
+local to_field = ARGV[2]
+local amount = tonumber(ARGV[3])
+local function reply(result, current)
+    if stream_key then
+        local current_available = result ~= 6 and redis.call("HGET", stock_key, "available") or false
+        add_stock_event(stream_key, ARGV[4], ARGV[6], ARGV[5], ARGV[3], result, current_available)
+    end
+    return {result, current}
+end
+if not valid_amount(amount) then
+    return reply(6, false)
+end
+local current = redis.call("HGET", stock_key, from_field)
+if not current then
+    return reply(1, false)
+end
+current = tonumber(current)
+if current < amount then
+    return reply(3, current)
+end
+redis.call("HINCRBY", stock_key, to_field, amount)
+redis.call("HINCRBY", stock_key, "version", 1)
+return reply(2, redis.call("HINCRBY", stock_key, from_field, -amount))
+"""
+
+# Миграция пар строковых ключей в хэши: KEYS - тройки (available, reserved,
+# хэш). Уже существующие хэши не перезаписываются; ARGV[1] == "1" удаляет
+# перенесённые строковые ключи. Возвращает число перенесённых SKU.
+lua_migrate_to_hash_script = """
+local migrated = 0
+for i = 1, #KEYS / 3 do
+    local values = redis.call("MGET", KEYS[3 * i - 2], KEYS[3 * i - 1])
+    if values[1] and values[2] and redis.call("EXISTS", KEYS[3 * i]) == 0 then
+        redis.call("HSET", KEYS[3 * i],
+            "available", values[1], "reserved", values[2], "sold", 0, "version", 0)
+        if ARGV[1] == "1" then
+            redis.call("DEL", KEYS[3 * i - 2], KEYS[3 * i - 1])
+        end
+        migrated = migrated + 1
+    end
+end
+return migrated
+"""
+
+# Холд: ARGV - количество, TTL, id холда, SKU (сохраняется в холде для событий
+# release/commit/expire). KEYS[5] (необязательный) - стрим событий, ARGV[5] - MAXLEN.
+lua_hold_reservation_script = lua_valid_amount_function + lua_stock_event_function + """
+local available_key = KEYS[1]
+local reserved_key = KEYS[2]
+local hold_key = KEYS[3]
+local expiry_key = KEYS[4]
+local stream_key = KEYS[5]
+local required_amount = tonumber(ARGV[1])
+local function reply(result, current_available)
+    if stream_key then
+        add_stock_event(stream_key, ARGV[5], "reservation", ARGV[4], ARGV[1], result, current_available)
+    end
+    return {result, current_available}
+end
+if not valid_amount(required_amount) then
+    return reply(6, false)
+end
+if redis.call("EXISTS", available_key) == 0 or redis.call("EXISTS", reserved_key) == 0 then
+    return reply(1, false)
+end
+local current_available = tonumber(redis.call("GET", available_key))
+if current_available < required_amount then
+    return reply(3, current_available)
+end
+current_available = redis.call("INCRBY", available_key, -required_amount)
+redis.call("INCRBY", reserved_key, required_amount)
+redis.call("HSET", hold_key,
+    "available_key", available_key, "reserved_key", reserved_key,
+    "amount", required_amount, "state", "held", "sku", ARGV[4])
+local now = redis.call("TIME")
+redis.call("ZADD", expiry_key, tonumber(now[1]) + tonumber(ARGV[2]), ARGV[3])
+return reply(2, current_available)
+"""
+
+# Общая часть release/commit/sweep: снимает холд и, если restore, возвращает
+# количество из reserved в available. Снятый холд хранится ещё tombstone_ttl
+# секунд, чтобы повторный вызов вернул ALREADY_RELEASED, а не UNKNOWN_HOLD.
+# Ключи available/reserved берутся из холда, а не из KEYS, поэтому release,
+# commit и sweep рассчитаны на standalone Redis. Если задан stream_key, снятие
+# холда пишет событие kind (только когда счётчики изменились); у холдов,
+# созданных без SKU, в событии вместо SKU ключ available.
+lua_finish_hold_function = lua_stock_event_function + """
+local function finish_hold(hold_key, expiry_key, hold_id, tombstone_ttl, restore, stream_key, max_length, kind)
+    redis.call("ZREM", expiry_key, hold_id)
+    local hold = redis.call("HMGET", hold_key, "available_key", "reserved_key", "amount", "state", "sku")
+    if not hold[1] then
+        return {5, false}
+    end
+    if hold[4] ~= "held" then
+        return {4, false}
+    end
+    local amount = tonumber(hold[3])
+    redis.call("INCRBY", hold[2], -amount)
+    local current_available
+    if restore then
+        current_available = redis.call("INCRBY", hold[1], amount)
+        redis.call("HSET", hold_key, "state", "released")
+    else
+        current_available = tonumber(redis.call("GET", hold[1]))
+        redis.call("HSET", hold_key, "state", "committed")
+    end
+    redis.call("EXPIRE", hold_key, tombstone_ttl)
+    if stream_key then
+        add_stock_event(stream_key, max_length, kind, hold[5] or hold[1], amount, 2, current_available)
+    end
+    return {2, current_available}
+end
+"""
+
+# KEYS[3] (необязательный) - стрим событий, ARGV[4] - MAXLEN.
+lua_finish_hold_script = lua_finish_hold_function + """
+return finish_hold(KEYS[1], KEYS[2], ARGV[1], ARGV[2], ARGV[3] == "release", KEYS[3], ARGV[4], ARGV[3])
+"""
+
+# KEYS[2] (необязательный) - стрим событий, ARGV[4] - MAXLEN.
+lua_sweep_holds_script = lua_finish_hold_function + """
+local expiry_key = KEYS[1]
+local now = redis.call("TIME")
+local expired = redis.call("ZRANGEBYSCORE", expiry_key, "-inf", now[1], "LIMIT", 0, tonumber(ARGV[1]))
+local released = 0
+for _, hold_id in ipairs(expired) do
+    local result = finish_hold(ARGV[3] .. hold_id, expiry_key, hold_id, ARGV[2], true, KEYS[2], ARGV[4], "expire")
+    if result[1] == 2 then
+        released = released + 1
+    end
+end
+return {released, #expired}
+"""
+
+
+SCRIPTS = {
+    "reservation": lua_reservation_script,
+    "multi_reservation": lua_multi_reservation_script,
+    "batch_reservation": lua_batch_reservation_script,
+    "coalesced_reservation": lua_coalesced_reservation_script,
+    "sharded_reservation": lua_sharded_reservation_script,
+    "rebalance_buckets": lua_rebalance_buckets_script,
+    "take_available": lua_take_available_script,
+    "hash_reservation": lua_hash_reservation_script,
+    "hash_move": lua_hash_move_script,
+    "migrate_to_hash": lua_migrate_to_hash_script,
+    "hold_reservation": lua_hold_reservation_script,
+    "finish_hold": lua_finish_hold_script,
+    "sweep_holds": lua_sweep_holds_script,
+}
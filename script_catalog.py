@@ -0,0 +1,150 @@
+"""
+Версионированный каталог Lua-скриптов.
+
+Версия - каталог с файлами <name>.lua и manifest.json, в котором записаны SHA1
+каждого скрипта; манифест генерируется при сборке, при загрузке SHA сверяются
+с файлами. По умолчанию контроллеры используют встроенные скрипты из script.py,
+settings.SCRIPT_VERSION переключает их на версию из SCRIPT_CATALOG_DIR.
+
+    python script_catalog.py build v2       # выгрузить текущие script.SCRIPTS
+    python script_catalog.py manifest v2    # пересчитать SHA после правки .lua
+    python script_catalog.py preload v2     # SCRIPT LOAD перед выкаткой
+"""
+import argparse
+import functools
+import hashlib
+import json
+import os
+from typing import Mapping, NamedTuple
+
+import redis
+import redis.asyncio as aioredis
+
+from connection import get_connection_pool
+from script import SCRIPTS
+import settings
+
+
+MANIFEST_FILE = "manifest.json"
+
+
+class ScriptCatalog(NamedTuple):
+    version: str
+    sources: Mapping[str, str]
+    shas: Mapping[str, str]
+
+
+def script_sha(source: str) -> str:
+    return hashlib.sha1(source.encode()).hexdigest()
+
+
+def from_sources(scripts: Mapping[str, str], version: str = "builtin") -> ScriptCatalog:
+    return ScriptCatalog(version, dict(scripts), {name: script_sha(source) for name, source in scripts.items()})
+
+
+def build_catalog(
+  version: str,
+  directory: str = settings.SCRIPT_CATALOG_DIR,
+  scripts: Mapping[str, str] = SCRIPTS
+) -> str:
+    """Записывает scripts в <directory>/<version>/ вместе с манифестом и возвращает путь версии."""
+    path = os.path.join(directory, version)
+    os.makedirs(path, exist_ok=True)
+    for name, source in scripts.items():
+        with open(os.path.join(path, f"{name}.lua"), "w", encoding="utf-8") as output:
+            output.write(source)
+    write_manifest(version, directory)
+    return path
+
+
+def write_manifest(version: str, directory: str = settings.SCRIPT_CATALOG_DIR) -> dict[str, str]:
+    """Пересчитывает SHA всех .lua версии и перезаписывает manifest.json."""
+    path = os.path.join(directory, version)
+    shas = {}
+    for file_name in sorted(os.listdir(path)):
+        if file_name.endswith(".lua"):
+            with open(os.path.join(path, file_name), encoding="utf-8") as source:
+                shas[file_name[:-len(".lua")]] = script_sha(source.read())
+    with open(os.path.join(path, MANIFEST_FILE), "w", encoding="utf-8") as output:
+        json.dump({"version": version, "scripts": shas}, output, indent=2, sort_keys=True)
+    return shas
+
+
+def load_catalog(version: str, directory: str = settings.SCRIPT_CATALOG_DIR) -> ScriptCatalog:
+    """
+    Читает версию каталога.
+
+    ValueError, если файл не совпадает с SHA из манифеста или в версии нет
+    какого-то из скриптов script.SCRIPTS: реестр заменяет набор целиком.
+    """
+    path = os.path.join(directory, version)
+    with open(os.path.join(path, MANIFEST_FILE), encoding="utf-8") as manifest_file:
+        manifest = json.load(manifest_file)
+    missing = set(SCRIPTS) - set(manifest["scripts"])
+    if missing:
+        raise ValueError(f"В версии {version} нет скриптов: {', '.join(sorted(missing))}")
+    sources = {}
+    for name, sha in manifest["scripts"].items():
+        with open(os.path.join(path, f"{name}.lua"), encoding="utf-8") as source:
+            sources[name] = source.read()
+        if script_sha(sources[name]) != sha:
+            raise ValueError(f"{name}.lua версии {version} не совпадает с манифестом")
+    return ScriptCatalog(version, sources, dict(manifest["scripts"]))
+
+
+@functools.lru_cache(maxsize=None)
+def _cached_catalog(version: str | None, directory: str) -> ScriptCatalog:
+    if version is None:
+        return from_sources(SCRIPTS)
+    return load_catalog(version, directory)
+
+
+def default_catalog() -> ScriptCatalog:
+    """Каталог для новых реестров: settings.SCRIPT_VERSION или встроенные скрипты."""
+    return _cached_catalog(settings.SCRIPT_VERSION, settings.SCRIPT_CATALOG_DIR)
+
+
+def preload(client: redis.StrictRedis, catalog: ScriptCatalog) -> int:
+    """
+    SCRIPT LOAD для скриптов каталога, которых ещё нет в кэше Redis.
+
+    Одна команда SCRIPT EXISTS на весь каталог, исходники отправляются только
+    для отсутствующих. Возвращает число загруженных скриптов.
+    """
+    names = list(catalog.shas)
+    exists = client.script_exists(*[catalog.shas[name] for name in names])
+    missing = [name for name, loaded in zip(names, exists) if not loaded]
+    for name in missing:
+        client.script_load(catalog.sources[name])
+    return len(missing)
+
+
+async def preload_async(client: aioredis.StrictRedis, catalog: ScriptCatalog) -> int:
+    names = list(catalog.shas)
+    exists = await client.script_exists(*[catalog.shas[name] for name in names])
+    missing = [name for name, loaded in zip(names, exists) if not loaded]
+    for name in missing:
+        await client.script_load(catalog.sources[name])
+    return len(missing)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["build", "manifest", "preload"])
+    parser.add_argument("version")
+    parser.add_argument("--directory", default=settings.SCRIPT_CATALOG_DIR)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        print(build_catalog(args.version, args.directory))
+    elif args.command == "manifest":
+        for name, sha in write_manifest(args.version, args.directory).items():
+            print(f"{sha}  {name}")
+    else:
+        client = redis.StrictRedis(connection_pool=get_connection_pool())
+        catalog = load_catalog(args.version, args.directory)
+        print(f"loaded={preload(client, catalog)} total={len(catalog.shas)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+import time
+from typing import Any, Mapping, Sequence
+
+import redis
+import redis.asyncio as aioredis
+from redis.exceptions import NoScriptError
+
+from script_catalog import ScriptCatalog, default_catalog, preload, preload_async
+
+
+ScriptCalls = Sequence[tuple[Sequence[str], Sequence[Any]]]
+
+
+class BaseScriptRegistry:
+    """
+    Реестр Lua-скриптов контроллера.
+
+    Скрипты и их SHA берутся из каталога (script_catalog.ScriptCatalog),
+    вызовы идут через EVALSHA. Если Redis ответил NOSCRIPT (рестарт, failover,
+    SCRIPT FLUSH), скрипт загружается заново и вызов повторяется.
+
+    activate() заменяет каталог одним присваиванием: каждый вызов берёт каталог
+    один раз в начале, поэтому уже начатые вызовы доходят на старой версии,
+    а новые идут на новой.
+
+    hooks - объекты с интерфейсом metrics.InstrumentationHooks. Пока список
+    пуст, вызовы не замеряются.
+    """
+
+    def __init__(self, catalog: ScriptCatalog | None = None, hooks: Sequence[Any] = ()) -> None:
+        self.catalog = catalog or default_catalog()
+        self.hooks = list(hooks)
+
+    @property
+    def version(self) -> str:
+        return self.catalog.version
+
+    @property
+    def sources(self) -> Mapping[str, str]:
+        return self.catalog.sources
+
+    @property
+    def shas(self) -> Mapping[str, str]:
+        return self.catalog.shas
+
+    def _collect_replies(
+      self,
+      pending: list[int],
+      pipeline_replies: list[Any],
+      replies: list[Any],
+      retry_noscript: bool
+    ) -> list[int]:
+        missing = []
+        for index, reply in zip(pending, pipeline_replies):
+            if isinstance(reply, NoScriptError) and retry_noscript:
+                missing.append(index)
+            elif isinstance(reply, Exception):
+                raise reply
+            else:
+                replies[index] = reply
+        return missing
+
+    def _notify_call(self, name: str, keys: Sequence[str], reply: Any, started: float) -> None:
+        elapsed = time.perf_counter() - started
+        for hook in self.hooks:
+            hook.on_script_call(name, keys, reply, elapsed)
+
+    def _notify_batch(self, name: str, calls: ScriptCalls, replies: list[Any], started: float) -> None:
+        elapsed = time.perf_counter() - started
+        for hook in self.hooks:
+            hook.on_script_batch(name, calls, replies, elapsed)
+
+    def _notify_noscript(self, name: str) -> None:
+        for hook in self.hooks:
+            hook.on_noscript(name)
+
+
+class ScriptRegistry(BaseScriptRegistry):
+    def __init__(
+      self,
+      redis_client: redis.StrictRedis,
+      catalog: ScriptCatalog | None = None,
+      hooks: Sequence[Any] = ()
+    ) -> None:
+        super().__init__(catalog, hooks)
+        self.redis_client = redis_client
+
+    def load(self) -> None:
+        preload(self.redis_client, self.catalog)
+
+    def activate(self, catalog: ScriptCatalog) -> None:
+        """Загружает скрипты catalog в Redis и делает его активным."""
+        preload(self.redis_client, catalog)
+        self.catalog = catalog
+
+    def execute(
+      self,
+      name: str,
+      keys: Sequence[str],
+      args: Sequence[Any],
+      client: redis.StrictRedis | None = None
+    ) -> Any:
+        if client is None:
+            client = self.redis_client
+        catalog = self.catalog
+        started = time.perf_counter() if self.hooks else None
+        try:
+            reply = client.evalsha(catalog.shas[name], len(keys), *keys, *args)
+        except NoScriptError:
+            if started is not None:
+                self._notify_noscript(name)
+            client.script_load(catalog.sources[name])
+            reply = client.evalsha(catalog.shas[name], len(keys), *keys, *args)
+        if started is not None:
+            self._notify_call(name, keys, reply, started)
+        return reply
+
+    def execute_many(
+      self,
+      name: str,
+      calls: ScriptCalls,
+      chunk_size: int,
+      client: redis.StrictRedis | None = None
+    ) -> list[Any]:
+        """
+        Выполняет независимые вызовы скрипта через pipeline без MULTI/EXEC.
+
+        Вызовы, получившие NOSCRIPT, не были выполнены сервером, поэтому после
+        загрузки скрипта они досылаются отдельным pipeline. Ответы возвращаются
+        в порядке calls.
+        """
+        if client is None:
+            client = self.redis_client
+        replies = []
+        for start in range(0, len(calls), chunk_size):
+            replies += self._execute_chunk(name, calls[start:start + chunk_size], client)
+        return replies
+
+    def _execute_chunk(self, name: str, calls: ScriptCalls, client: redis.StrictRedis) -> list[Any]:
+        catalog = self.catalog
+        started = time.perf_counter() if self.hooks else None
+        pending = list(range(len(calls)))
+        replies: list[Any] = [None] * len(calls)
+        for attempt in range(2):
+            pipe = client.pipeline(transaction=False)
+            for index in pending:
+                keys, args = calls[index]
+                pipe.evalsha(catalog.shas[name], len(keys), *keys, *args)
+            pending = self._collect_replies(
+                pending, pipe.execute(raise_on_error=False), replies, attempt == 0
+            )
+            if not pending:
+                break
+            if started is not None:
+                self._notify_noscript(name)
+            client.script_load(catalog.sources[name])
+        if started is not None:
+            self._notify_batch(name, calls, replies, started)
+        return replies
+
+
+class AsyncScriptRegistry(BaseScriptRegistry):
+    def __init__(
+      self,
+      redis_client: aioredis.StrictRedis,
+      catalog: ScriptCatalog | None = None,
+      hooks: Sequence[Any] = ()
+    ) -> None:
+        super().__init__(catalog, hooks)
+        self.redis_client = redis_client
+
+    async def load(self) -> None:
+        await preload_async(self.redis_client, self.catalog)
+
+    async def activate(self, catalog: ScriptCatalog) -> None:
+        """Загружает скрипты catalog в Redis и делает его активным."""
+        await preload_async(self.redis_client, catalog)
+        self.catalog = catalog
+
+    async def execute(
+      self,
+      name: str,
+      keys: Sequence[str],
+      args: Sequence[Any],
+      client: aioredis.StrictRedis | None = None
+    ) -> Any:
+        if client is None:
+            client = self.redis_client
+        catalog = self.catalog
+        started = time.perf_counter() if self.hooks else None
+        try:
+            reply = await client.evalsha(catalog.shas[name], len(keys), *keys, *args)
+        except NoScriptError:
+            if started is not None:
+                self._notify_noscript(name)
+            await client.script_load(catalog.sources[name])
+            reply = await client.evalsha(catalog.shas[name], len(keys), *keys, *args)
+        if started is not None:
+            self._notify_call(name, keys, reply, started)
+        return reply
+
+    async def execute_many(
+      self,
+      name: str,
+      calls: ScriptCalls,
+      chunk_size: int,
+      client: aioredis.StrictRedis | None = None
+    ) -> list[Any]:
+        if client is None:
+            client = self.redis_client
+        replies = []
+        for start in range(0, len(calls), chunk_size):
+            replies += await self._execute_chunk(name, calls[start:start + chunk_size], client)
+        return replies
+
+    async def _execute_chunk(self, name: str, calls: ScriptCalls, client: aioredis.StrictRedis) -> list[Any]:
+        catalog = self.catalog
+        started = time.perf_counter() if self.hooks else None
+        pending = list(range(len(calls)))
+        replies: list[Any] = [None] * len(calls)
+        for attempt in range(2):
+            pipe = client.pipeline(transaction=False)
+            for index in pending:
+                keys, args = calls[index]
+                pipe.evalsha(catalog.shas[name], len(keys), *keys, *args)
+            pending = self._collect_replies(
+                pending, await pipe.execute(raise_on_error=False), replies, attempt == 0
+            )
+            if not pending:
+                break
+            if started is not None:
+                self._notify_noscript(name)
+            await client.script_load(catalog.sources[name])
+        if started is not None:
+            self._notify_batch(name, calls, replies, started)
+        return replies
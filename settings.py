@@ -1,3 +1,60 @@
-REDIS_HOST = "localhost"
-REDIS_PORT = 6379
-REDIS_DB = 15
+import os
+
+REDIS_HOST = os.environ.get("REDIS_HOST", "localhost")
+REDIS_PORT = int(os.environ.get("REDIS_PORT", 6379))
+REDIS_DB = int(os.environ.get("REDIS_DB", 15))
+# Путь к unix-сокету; если задан, используется вместо host/port
+REDIS_UNIX_SOCKET_PATH = os.environ.get("REDIS_UNIX_SOCKET_PATH") or None
+# 2 - RESP2, 3 - RESP3
+REDIS_PROTOCOL = int(os.environ.get("REDIS_PROTOCOL", 2))
+
+# Пул соединений общий на процесс (см. connection.py)
+REDIS_MAX_CONNECTIONS = int(os.environ.get("REDIS_MAX_CONNECTIONS", 50))
+# Сколько секунд ждать свободное соединение, когда пул исчерпан
+REDIS_POOL_TIMEOUT = float(os.environ.get("REDIS_POOL_TIMEOUT", 20))
+REDIS_SOCKET_TIMEOUT = float(os.environ.get("REDIS_SOCKET_TIMEOUT", 5))
+REDIS_SOCKET_CONNECT_TIMEOUT = float(os.environ.get("REDIS_SOCKET_CONNECT_TIMEOUT", 2))
+REDIS_SOCKET_KEEPALIVE = os.environ.get("REDIS_SOCKET_KEEPALIVE", "1") == "1"
+REDIS_HEALTH_CHECK_INTERVAL = int(os.environ.get("REDIS_HEALTH_CHECK_INTERVAL", 30))
+
+# Холды резервирований (release/commit/sweep)
+HOLD_KEY_PREFIX = os.environ.get("HOLD_KEY_PREFIX", "hold:")
+HOLDS_EXPIRY_KEY = os.environ.get("HOLDS_EXPIRY_KEY", "holds:expiry")
+HOLD_TTL = int(os.environ.get("HOLD_TTL", 900))
+# Сколько секунд помнить снятый холд, чтобы отвечать ALREADY_RELEASED
+HOLD_TOMBSTONE_TTL = int(os.environ.get("HOLD_TOMBSTONE_TTL", 3600))
+HOLD_SWEEP_BATCH_SIZE = int(os.environ.get("HOLD_SWEEP_BATCH_SIZE", 100))
+
+# Идемпотентность резервирований
+IDEMPOTENCY_KEY_PREFIX = os.environ.get("IDEMPOTENCY_KEY_PREFIX", "idempotency:")
+IDEMPOTENCY_TTL = int(os.environ.get("IDEMPOTENCY_TTL", 300))
+
+# Раскладка ключей стока (см. keys.py)
+STOCK_KEY_PREFIX = os.environ.get("STOCK_KEY_PREFIX", "stock")
+# Число бакетов шардированного стока горячего SKU
+STOCK_BUCKETS = int(os.environ.get("STOCK_BUCKETS", 8))
+
+# Локальный кэш "нет в наличии" в контроллере; 0 - выключен
+SOLD_OUT_CACHE_TTL = float(os.environ.get("SOLD_OUT_CACHE_TTL", 0))
+SOLD_OUT_CACHE_SIZE = int(os.environ.get("SOLD_OUT_CACHE_SIZE", 10000))
+# Канал, в который публикуются available_key после пополнения стока
+STOCK_INVALIDATION_CHANNEL = os.environ.get("STOCK_INVALIDATION_CHANNEL", "stock:replenished")
+
+# Объединение одновременных резервирований одной пары ключей; 0 - выключено
+COALESCE_WINDOW = float(os.environ.get("COALESCE_WINDOW", 0))
+COALESCE_MAX_BATCH = int(os.environ.get("COALESCE_MAX_BATCH", 1000))
+
+# Стрим событий резервирований (events.py); пусто - события не пишутся
+STOCK_EVENTS_STREAM = os.environ.get("STOCK_EVENTS_STREAM") or None
+# Примерный предел длины стрима (XADD MAXLEN ~)
+STOCK_EVENTS_MAXLEN = int(os.environ.get("STOCK_EVENTS_MAXLEN", 100000))
+
+# Каталог версий Lua-скриптов (script_catalog.py) и активная версия;
+# без SCRIPT_VERSION используются встроенные скрипты из script.py
+SCRIPT_CATALOG_DIR = os.environ.get("SCRIPT_CATALOG_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "lua"))
+SCRIPT_VERSION = os.environ.get("SCRIPT_VERSION") or None
+
+# Локальный кэш get_availability: сколько секунд значение может отставать
+# от Redis (0 - кэш выключен) и сколько ключей хранить
+AVAILABILITY_CACHE_TTL = float(os.environ.get("AVAILABILITY_CACHE_TTL", 0))
+AVAILABILITY_CACHE_SIZE = int(os.environ.get("AVAILABILITY_CACHE_SIZE", 100000))
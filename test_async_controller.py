@@ -0,0 +1,183 @@
+import asyncio
+
+from async_redis_controller import AsyncProductStockLogController
+from enums import ProductAmountCacheResults
+
+
+# ============================================================================
+# ТЕСТЫ СОСТОЯНИЙ - асинхронный контроллер
+# ============================================================================
+
+class TestAsyncProductStockLogControllerStates:
+    """
+    Тесты состояний ProductAmountCacheResults для асинхронного контроллера
+    """
+
+    def test_key_not_exist(self, clean_redis):
+        """
+        Тест состояния KEY_NOT_EXIST (1)
+        """
+        async def scenario():
+            async with AsyncProductStockLogController() as controller:
+                return await controller.execute_lua_reservation_script(
+                    "test:async:1:available", "test:async:1:reserved", 5
+                )
+
+        result, current_amount = asyncio.run(scenario())
+
+        assert result == ProductAmountCacheResults.KEY_NOT_EXIST
+        assert current_amount is None
+
+    def test_enough_and_not_enough_amount(self, clean_redis):
+        """
+        Тест состояний ENOUGH_AMOUNT (2) и NOT_ENOUGH_AMOUNT (3)
+        """
+        available_key = "test:async:2:available"
+        reserved_key = "test:async:2:reserved"
+        clean_redis.set(available_key, 10)
+        clean_redis.set(reserved_key, 0)
+
+        async def scenario():
+            async with AsyncProductStockLogController() as controller:
+                first = await controller.execute_lua_reservation_script(available_key, reserved_key, 7)
+                second = await controller.execute_lua_reservation_script(available_key, reserved_key, 7)
+                return first, second
+
+        first, second = asyncio.run(scenario())
+
+        assert first == (ProductAmountCacheResults.ENOUGH_AMOUNT, 3)
+        assert second == (ProductAmountCacheResults.NOT_ENOUGH_AMOUNT, 3)
+        assert int(clean_redis.get(reserved_key)) == 7
+
+    def test_batch_and_reserve_many(self, clean_redis):
+        """
+        Пакетный и корзинный варианты работают так же, как в синхронном контроллере
+        """
+        clean_redis.set("test:async:3:available", 5)
+        clean_redis.set("test:async:3:reserved", 0)
+        clean_redis.set("test:async:4:available", 1)
+        clean_redis.set("test:async:4:reserved", 0)
+
+        async def scenario():
+            async with AsyncProductStockLogController() as controller:
+                batch = await controller.execute_lua_reservation_batch(
+                    [("test:async:3:available", "test:async:3:reserved", 2)] * 3, chunk_size=2
+                )
+                cart = await controller.reserve_many([
+                    ("test:async:3:available", "test:async:3:reserved", 1),
+                    ("test:async:4:available", "test:async:4:reserved", 2),
+                ])
+                return batch, cart
+
+        batch, (overall, lines) = asyncio.run(scenario())
+
+        assert [r for r, _ in batch] == [
+            ProductAmountCacheResults.ENOUGH_AMOUNT,
+            ProductAmountCacheResults.ENOUGH_AMOUNT,
+            ProductAmountCacheResults.NOT_ENOUGH_AMOUNT,
+        ]
+        assert overall == ProductAmountCacheResults.NOT_ENOUGH_AMOUNT
+        assert int(clean_redis.get("test:async:3:available")) == 1
+
+    def test_reload_after_noscript(self, clean_redis):
+        """
+        После SCRIPT FLUSH скрипт загружается заново
+        """
+        clean_redis.set("test:async:5:available", 3)
+        clean_redis.set("test:async:5:reserved", 0)
+
+        async def scenario():
+            async with AsyncProductStockLogController() as controller:
+                await controller.load_scripts()
+                clean_redis.script_flush()
+                return await controller.execute_lua_reservation_script(
+                    "test:async:5:available", "test:async:5:reserved", 1
+                )
+
+        assert asyncio.run(scenario()) == (ProductAmountCacheResults.ENOUGH_AMOUNT, 2)
+
+    def test_hold_release(self, clean_redis):
+        """
+        Холд снимается release, повторный release - ALREADY_RELEASED
+        """
+        clean_redis.set("test:async:6:available", 3)
+        clean_redis.set("test:async:6:reserved", 0)
+
+        async def scenario():
+            async with AsyncProductStockLogController() as controller:
+                _, _, reservation_id = await controller.reserve_hold(
+                    "test:async:6:available", "test:async:6:reserved", 2
+                )
+                return await controller.release(reservation_id), await controller.release(reservation_id)
+
+        first, second = asyncio.run(scenario())
+
+        assert first == (ProductAmountCacheResults.ENOUGH_AMOUNT, 3)
+        assert second == (ProductAmountCacheResults.ALREADY_RELEASED, None)
+
+
+# ============================================================================
+# ТЕСТЫ С КОНКУРЕНТНЫМ ВЫПОЛНЕНИЕМ - asyncio.gather вместо потоков
+# ============================================================================
+
+class TestAsyncProductStockLogControllerConcurrency:
+    """
+    Аналоги тестов TestProductStockLogControllerConcurrency на asyncio.gather
+    """
+
+    def test_parallel_reservations_success(self, clean_redis):
+        """
+        Тысячи задач резервируют товар, суммарно не превышая лимит
+        """
+        available_key = "test:async:concurrent:1:available"
+        reserved_key = "test:async:concurrent:1:reserved"
+        initial_available = 5000
+        num_tasks = 2000
+
+        clean_redis.set(available_key, initial_available)
+        clean_redis.set(reserved_key, 0)
+
+        async def scenario():
+            async with AsyncProductStockLogController() as controller:
+                return await asyncio.gather(*(
+                    controller.execute_lua_reservation_script(available_key, reserved_key, 1)
+                    for _ in range(num_tasks)
+                ))
+
+        results = asyncio.run(scenario())
+
+        successful = sum(1 for r, _ in results if r == ProductAmountCacheResults.ENOUGH_AMOUNT)
+        assert successful == num_tasks
+        assert int(clean_redis.get(available_key)) == initial_available - num_tasks
+        assert int(clean_redis.get(reserved_key)) == num_tasks
+
+    def test_race_condition_check(self, clean_redis):
+        """
+        Задач больше, чем товара: успешных ровно столько, сколько было в наличии
+        """
+        available_key = "test:async:race:available"
+        reserved_key = "test:async:race:reserved"
+        initial_available = 10
+        num_tasks = 3000
+
+        clean_redis.set(available_key, initial_available)
+        clean_redis.set(reserved_key, 0)
+
+        async def scenario():
+            async with AsyncProductStockLogController() as controller:
+                return await asyncio.gather(*(
+                    controller.execute_lua_reservation_script(available_key, reserved_key, 1)
+                    for _ in range(num_tasks)
+                ))
+
+        results = asyncio.run(scenario())
+
+        successful = sum(1 for r, _ in results if r == ProductAmountCacheResults.ENOUGH_AMOUNT)
+        failed = sum(1 for r, _ in results if r == ProductAmountCacheResults.NOT_ENOUGH_AMOUNT)
+        final_available = int(clean_redis.get(available_key))
+        final_reserved = int(clean_redis.get(reserved_key))
+
+        assert successful == initial_available
+        assert failed == num_tasks - initial_available
+        assert final_available == 0
+        assert final_available + final_reserved == initial_available
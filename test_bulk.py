@@ -0,0 +1,91 @@
+import io
+
+from bulk import StockRow, export_stock, load_stock, read_csv, read_jsonl, write_jsonl, write_resp
+from keys import stock_hash_key, stock_keys
+
+
+CSV_INPUT = """sku,available,reserved
+1,10,2
+2,5,
+abc,0,0
+"""
+
+
+# ============================================================================
+# ТЕСТЫ МАССОВОЙ ЗАГРУЗКИ И ВЫГРУЗКИ СТОКА
+# ============================================================================
+
+class TestBulkLoad:
+    """
+    Тесты загрузки CSV/JSONL пачками и формата RESP для redis-cli --pipe
+    """
+
+    def test_read_inputs(self):
+        """
+        Тест чтения CSV и JSONL
+        Пустой reserved читается как 0, JSONL повторяет строки CSV
+        """
+        rows = list(read_csv(io.StringIO(CSV_INPUT)))
+        jsonl = io.StringIO()
+        write_jsonl(rows, jsonl)
+        jsonl.seek(0)
+
+        assert rows == [StockRow("1", 10, 2), StockRow("2", 5, 0), StockRow("abc", 0, 0)]
+        assert list(read_jsonl(jsonl)) == rows
+
+    def test_load_keys(self, clean_redis):
+        """
+        Тест загрузки в пары строковых ключей
+        Пачки по chunk_size, нечисловой SKU тоже загружается
+        """
+        loaded = load_stock(clean_redis, read_csv(io.StringIO(CSV_INPUT)), mode="keys", chunk_size=2)
+
+        available_key, reserved_key = stock_keys("1")
+        assert loaded == 3
+        assert int(clean_redis.get(available_key)) == 10
+        assert int(clean_redis.get(reserved_key)) == 2
+        assert int(clean_redis.get(stock_keys("abc")[0])) == 0
+
+    def test_load_hash(self, clean_redis):
+        """
+        Тест загрузки в хэши
+        Хэш получает все поля стока, sold и version равны 0
+        """
+        load_stock(clean_redis, read_csv(io.StringIO(CSV_INPUT)), mode="hash", chunk_size=2)
+
+        assert clean_redis.hgetall(stock_hash_key("2")) == {
+            b"available": b"5", b"reserved": b"0", b"sold": b"0", b"version": b"0"
+        }
+
+    def test_resp_output(self):
+        """
+        Тест вывода в формате RESP
+        Команды SET пригодны для redis-cli --pipe
+        """
+        stream = io.BytesIO()
+
+        write_resp([StockRow("1", 10, 0)], stream)
+
+        assert stream.getvalue() == (
+            b"*3\r\n$3\r\nSET\r\n$19\r\nstock:{1}:available\r\n$2\r\n10\r\n"
+            b"*3\r\n$3\r\nSET\r\n$18\r\nstock:{1}:reserved\r\n$1\r\n0\r\n"
+        )
+
+
+class TestBulkExport:
+    """
+    Тесты потоковой выгрузки стока
+    """
+
+    def test_export_roundtrip(self, clean_redis):
+        """
+        Тест выгрузки после загрузки
+        Для обеих раскладок выгрузка совпадает с исходными строками
+        """
+        rows = [StockRow(str(sku), sku, sku % 3) for sku in range(50)]
+        for mode in ("keys", "hash"):
+            load_stock(clean_redis, rows, mode=mode, chunk_size=7)
+
+            exported = sorted(export_stock(clean_redis, mode=mode, chunk_size=7), key=lambda row: int(row.sku))
+
+            assert exported == rows
@@ -0,0 +1,153 @@
+from types import SimpleNamespace
+
+import pytest
+from redis.crc import key_slot
+
+from cluster_controller import ClusterProductStockLogController
+from enums import ProductAmountCacheResults
+from keys import bucket_keys, hash_tag, idempotency_key, stock_keys
+
+
+class TwoNodeCluster:
+    """
+    Минимальная топология кластера поверх одного Redis: слоты делятся
+    между двумя "узлами" по чётности, оба узла ведут в clean_redis.
+    """
+
+    def __init__(self, redis_client):
+        self.redis_client = redis_client
+        self.nodes = [SimpleNamespace(name="node-0"), SimpleNamespace(name="node-1")]
+        self.nodes_manager = SimpleNamespace(get_node_from_slot=lambda slot: self.nodes[slot % 2])
+        self.used_nodes = set()
+
+    def keyslot(self, key):
+        return key_slot(key.encode())
+
+    def mget_nonatomic(self, keys):
+        self.used_nodes.update(self.nodes[self.keyslot(key) % 2].name for key in keys)
+        return self.redis_client.mget(keys)
+
+    def get_redis_connection(self, node):
+        self.used_nodes.add(node.name)
+        return self.redis_client
+
+    def __getattr__(self, name):
+        return getattr(self.redis_client, name)
+
+
+# ============================================================================
+# ТЕСТЫ РАСКЛАДКИ КЛЮЧЕЙ - hash tag SKU
+# ============================================================================
+
+class TestStockKeys:
+    """
+    Ключи одного SKU должны попадать в один слот кластера
+    """
+
+    def test_sku_keys_share_slot(self):
+        for sku in ["1", "42", "sku-abc", 100500]:
+            available_key, reserved_key = stock_keys(sku)
+            assert available_key == f"stock:{{{sku}}}:available"
+            assert key_slot(available_key.encode()) == key_slot(reserved_key.encode())
+
+    def test_idempotency_key_follows_tag(self):
+        available_key, _ = stock_keys("42")
+        key = idempotency_key(available_key, "order-1")
+
+        assert hash_tag(key) == "42"
+        assert key_slot(key.encode()) == key_slot(available_key.encode())
+        assert idempotency_key("plain:available", "order-1") == "idempotency:{plain:available}:order-1"
+        assert key_slot(b"idempotency:{plain:available}:order-1") == key_slot(b"plain:available")
+
+    def test_hash_tag_rules(self):
+        assert hash_tag("a{b}c") == "b"
+        assert hash_tag("a{}c") is None
+        assert hash_tag("a{bc") is None
+        assert hash_tag("plain") is None
+
+
+# ============================================================================
+# ТЕСТЫ КЛАСТЕРНОГО КОНТРОЛЛЕРА - группировка пачки по слотам и узлам
+# ============================================================================
+
+class TestClusterReservationBatch:
+    """
+    Пакетное резервирование группируется по слотам и узлам,
+    результаты возвращаются в исходном порядке
+    """
+
+    def test_batch_grouped_by_slot(self, clean_redis):
+        cluster = TwoNodeCluster(clean_redis)
+        controller = ClusterProductStockLogController(cluster)
+        skus = [str(sku) for sku in range(20)]
+        for sku in skus:
+            available_key, reserved_key = stock_keys(sku)
+            clean_redis.set(available_key, 2)
+            clean_redis.set(reserved_key, 0)
+
+        requests = [(*stock_keys(sku), 1) for sku in skus * 3]
+        requests.append((*stock_keys("missing"), 1))
+
+        results = controller.execute_lua_reservation_batch(requests, chunk_size=2)
+
+        assert results[:40] == [(ProductAmountCacheResults.ENOUGH_AMOUNT, 1)] * 20 + [
+            (ProductAmountCacheResults.ENOUGH_AMOUNT, 0)
+        ] * 20
+        assert results[40:60] == [(ProductAmountCacheResults.NOT_ENOUGH_AMOUNT, 0)] * 20
+        assert results[60] == (ProductAmountCacheResults.KEY_NOT_EXIST, None)
+        assert cluster.used_nodes == {"node-0", "node-1"}
+        assert all(int(clean_redis.get(stock_keys(sku)[1])) == 2 for sku in skus)
+
+    def test_sharded_reservation_per_bucket(self, clean_redis):
+        """
+        Бакеты в разных слотах перебираются отдельными вызовами
+        """
+        controller = ClusterProductStockLogController(TwoNodeCluster(clean_redis))
+        for bucket, available in enumerate([0, 1, 2]):
+            available_key, reserved_key = bucket_keys("hot", bucket)
+            clean_redis.set(available_key, available)
+            clean_redis.set(reserved_key, 0)
+
+        results = [controller.execute_sharded_reservation("hot", 1, buckets=3) for _ in range(4)]
+
+        assert [r for r, _ in results] == [ProductAmountCacheResults.ENOUGH_AMOUNT] * 3 + [
+            ProductAmountCacheResults.NOT_ENOUGH_AMOUNT
+        ]
+        assert results[-1][1] == 0
+        assert controller.execute_sharded_reservation("missing", 1, buckets=3) == (
+            ProductAmountCacheResults.KEY_NOT_EXIST, None
+        )
+
+    def test_rebalance_buckets(self, clean_redis):
+        """
+        rebalance переносит излишки между слотами и сохраняет сумму
+        """
+        controller = ClusterProductStockLogController(TwoNodeCluster(clean_redis))
+        clean_redis.set(bucket_keys("hot", 0)[0], 1)
+        clean_redis.set(bucket_keys("hot", 2)[0], 9)
+
+        assert controller.rebalance_stock_buckets("hot", buckets=4) == 10
+
+        assert [int(clean_redis.get(bucket_keys("hot", b)[0])) for b in range(4)] == [3, 3, 2, 2]
+        assert all(int(clean_redis.get(bucket_keys("hot", b)[1])) == 0 for b in range(4))
+
+    def test_events_stream_rejected(self, clean_redis):
+        """
+        Стрим событий в кластере - ошибка конфигурации
+        """
+        with pytest.raises(ValueError, match="STOCK_EVENTS_STREAM"):
+            ClusterProductStockLogController(TwoNodeCluster(clean_redis), events_stream="stock:events")
+
+    def test_availability_across_slots(self, clean_redis):
+        """
+        get_availability не отправляет MGET через границу слотов
+        """
+        cluster = TwoNodeCluster(clean_redis)
+        controller = ClusterProductStockLogController(cluster)
+        for sku in range(10):
+            clean_redis.set(stock_keys(sku)[0], sku)
+
+        assert controller.get_availability([*range(10), "missing"]) == {
+            **{sku: sku for sku in range(10)}, "missing": None
+        }
+        assert cluster.used_nodes == {"node-0", "node-1"}
@@ -0,0 +1,120 @@
+import concurrent.futures
+import threading
+
+import pytest
+
+from enums import ProductAmountCacheResults
+from metrics import ReservationMetrics
+from redis_controller import ProductStockLogController
+import test_controller
+
+
+AVAILABLE_KEY = "test:coalesce:1:available"
+RESERVED_KEY = "test:coalesce:1:reserved"
+
+
+# ============================================================================
+# ТЕ ЖЕ ТЕСТЫ СОСТОЯНИЙ С ОБЪЕДИНЕНИЕМ ЗАПРОСОВ
+# ============================================================================
+
+class TestCoalescedStates(test_controller.TestProductStockLogControllerStates):
+    """
+    Тесты состояний из TestProductStockLogControllerStates на контроллере
+    с coalesce_window: одиночный запрос ведёт себя как раньше
+    """
+
+    @pytest.fixture
+    def controller(self):
+        return ProductStockLogController(coalesce_window=0.001)
+
+
+# ============================================================================
+# ТЕСТЫ ОБЪЕДИНЕНИЯ ЗАПРОСОВ
+# ============================================================================
+
+class TestReservationCoalescing:
+    """
+    Тесты объединения одновременных резервирований одной пары ключей
+    """
+
+    def test_disabled_by_default(self):
+        assert ProductStockLogController().coalescer is None
+
+    def test_concurrent_requests_share_one_call(self, clean_redis, seed_stock):
+        """
+        50 потоков за 30 единицами: ровно 30 успехов, вызовов скрипта
+        намного меньше, чем запросов
+        """
+        seed_stock((AVAILABLE_KEY, RESERVED_KEY), 30)
+        metrics = ReservationMetrics()
+        controller = ProductStockLogController(hooks=[metrics], coalesce_window=0.05)
+        barrier = threading.Barrier(50)
+
+        def reserve(_):
+            barrier.wait()
+            return controller.execute_lua_reservation_script(AVAILABLE_KEY, RESERVED_KEY, 1)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=50) as executor:
+            results = list(executor.map(reserve, range(50)))
+
+        granted = [amount for result, amount in results if result == ProductAmountCacheResults.ENOUGH_AMOUNT]
+        assert len(granted) == 30
+        assert sorted(granted) == list(range(30))
+        assert all(amount == 0 for result, amount in results if result == ProductAmountCacheResults.NOT_ENOUGH_AMOUNT)
+        assert int(clean_redis.get(AVAILABLE_KEY)) == 0
+        assert int(clean_redis.get(RESERVED_KEY)) == 30
+        assert metrics.latency["coalesced_reservation"].count < 10
+
+    def test_arrival_order_and_per_request_results(self, clean_redis, seed_stock):
+        """
+        Пачка выполняется по порядку: крупный запрос может не пройти,
+        а следующий за ним мелкий - пройти
+        """
+        seed_stock((AVAILABLE_KEY, RESERVED_KEY), 5)
+        controller = ProductStockLogController(coalesce_window=0.05)
+        amounts = [3, 4, 2, 0, 1]
+        results = [None] * len(amounts)
+        threads = []
+        for index, amount in enumerate(amounts):
+            def reserve(index=index, amount=amount):
+                results[index] = controller.execute_lua_reservation_script(AVAILABLE_KEY, RESERVED_KEY, amount)
+            threads.append(threading.Thread(target=reserve))
+            threads[-1].start()
+            threads[-1].join(0.005)
+        for thread in threads:
+            thread.join()
+
+        assert results == [
+            (ProductAmountCacheResults.ENOUGH_AMOUNT, 2),
+            (ProductAmountCacheResults.NOT_ENOUGH_AMOUNT, 2),
+            (ProductAmountCacheResults.ENOUGH_AMOUNT, 0),
+            (ProductAmountCacheResults.INVALID_AMOUNT, None),
+            (ProductAmountCacheResults.NOT_ENOUGH_AMOUNT, 0),
+        ]
+        assert int(clean_redis.get(RESERVED_KEY)) == 5
+
+    def test_max_batch_starts_new_batch(self, clean_redis, seed_stock):
+        seed_stock((AVAILABLE_KEY, RESERVED_KEY), 100)
+        metrics = ReservationMetrics()
+        controller = ProductStockLogController(hooks=[metrics], coalesce_window=0.05)
+        controller.coalescer.max_batch = 4
+        barrier = threading.Barrier(8)
+
+        def reserve(_):
+            barrier.wait()
+            return controller.execute_lua_reservation_script(AVAILABLE_KEY, RESERVED_KEY, 1)[0]
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(reserve, range(8)))
+
+        assert results == [ProductAmountCacheResults.ENOUGH_AMOUNT] * 8
+        assert metrics.latency["coalesced_reservation"].count >= 2
+
+    def test_error_reaches_every_caller(self, clean_redis):
+        clean_redis.set(AVAILABLE_KEY, "not a number")
+        clean_redis.set(RESERVED_KEY, 0)
+        controller = ProductStockLogController(coalesce_window=0.01)
+
+        with pytest.raises(Exception):
+            controller.execute_lua_reservation_script(AVAILABLE_KEY, RESERVED_KEY, 1)
+        assert controller.coalescer._pending == {}
@@ -0,0 +1,66 @@
+import asyncio
+
+import redis
+
+import connection
+import settings
+from async_redis_controller import AsyncProductStockLogController
+from redis_controller import ProductStockLogController
+
+
+# ============================================================================
+# ТЕСТЫ ПУЛА СОЕДИНЕНИЙ - общий пул на процесс
+# ============================================================================
+
+class TestConnectionPool:
+    """
+    Тесты общего пула соединений из connection.py
+    """
+
+    def test_controllers_share_pool(self, clean_redis):
+        """
+        Контроллеры используют один пул и не открывают лишних сокетов
+        """
+        controllers = [ProductStockLogController() for _ in range(100)]
+        pools = {id(ctrl.redis_client.connection_pool) for ctrl in controllers}
+
+        for ctrl in controllers:
+            ctrl.redis_client.ping()
+
+        assert pools == {id(connection.get_connection_pool())}
+        assert len(connection.get_connection_pool()._connections) <= settings.REDIS_MAX_CONNECTIONS
+
+    def test_pool_settings(self):
+        """
+        Настройки пула берутся из settings
+        """
+        pool = connection.get_connection_pool()
+
+        assert isinstance(pool, redis.BlockingConnectionPool)
+        assert pool.max_connections == settings.REDIS_MAX_CONNECTIONS
+        assert pool.timeout == settings.REDIS_POOL_TIMEOUT
+        assert pool.connection_kwargs["socket_timeout"] == settings.REDIS_SOCKET_TIMEOUT
+        assert pool.connection_kwargs["health_check_interval"] == settings.REDIS_HEALTH_CHECK_INTERVAL
+
+    def test_unix_socket_settings(self, monkeypatch):
+        """
+        Если задан REDIS_UNIX_SOCKET_PATH, host/port не используются
+        """
+        monkeypatch.setattr(settings, "REDIS_UNIX_SOCKET_PATH", "/tmp/redis.sock")
+
+        kwargs = connection.connection_kwargs()
+
+        assert kwargs["path"] == "/tmp/redis.sock"
+        assert kwargs["connection_class"] is redis.UnixDomainSocketConnection
+        assert "host" not in kwargs
+
+    def test_async_controllers_share_loop_pool(self):
+        """
+        Асинхронные контроллеры одного loop делят пул
+        """
+        async def scenario():
+            first = AsyncProductStockLogController()
+            second = AsyncProductStockLogController()
+            return first.redis_client.connection_pool is second.redis_client.connection_pool
+
+        assert asyncio.run(scenario())
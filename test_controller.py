@@ -1,5 +1,4 @@
 import pytest
-import redis
 from threading import Thread, Lock
 import concurrent.futures
 import time
@@ -11,6 +10,7 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from redis_controller import ProductStockLogController
 from enums import ProductAmountCacheResults
+from keys import bucket_keys, stock_hash_key, stock_keys
 import settings
 
 
@@ -24,19 +24,6 @@ def controller():
     return ctrl
 
 
-@pytest.fixture
-def clean_redis():
-    """Фикстура для очистки Redis перед и после тестов"""
-    test_redis = redis.StrictRedis(
-        host=settings.REDIS_HOST, 
-        port=settings.REDIS_PORT, 
-        db=15
-    )
-    test_redis.flushdb()
-    yield test_redis
-    test_redis.flushdb()  # Очищаем после теста
-
-
 # ============================================================================
 # ТЕСТЫ СОСТОЯНИЙ - Проверка всех возможных результатов из Enum
 # ============================================================================
@@ -203,6 +190,43 @@ class TestProductStockLogControllerStates:
         assert result == ProductAmountCacheResults.NOT_ENOUGH_AMOUNT
         assert current_amount == 0
 
+    @pytest.mark.parametrize("required_amount", [0, -5, 1.5, "abc"])
+    def test_invalid_amount_state(self, controller, clean_redis, required_amount):
+        """
+        Тест состояния INVALID_AMOUNT (6)
+        Количество не целое положительное - счётчики не меняются
+        """
+        available_key = "test:product:8:available"
+        reserved_key = "test:product:8:reserved"
+
+        clean_redis.set(available_key, 10)
+        clean_redis.set(reserved_key, 0)
+
+        result, current_amount = controller.execute_lua_reservation_script(
+            available_key, reserved_key, required_amount
+        )
+
+        assert result == ProductAmountCacheResults.INVALID_AMOUNT
+        assert current_amount is None
+        assert int(clean_redis.get(available_key)) == 10
+        assert int(clean_redis.get(reserved_key)) == 0
+
+    def test_invalid_amount_in_cart(self, controller, clean_redis):
+        """
+        Некорректное количество в одной строке корзины - ничего не применяется
+        """
+        clean_redis.set("test:product:9:available", 10)
+        clean_redis.set("test:product:9:reserved", 0)
+
+        overall, lines = controller.reserve_many([
+            ("test:product:9:available", "test:product:9:reserved", 1),
+            ("test:product:9:available", "test:product:9:reserved", -1),
+        ])
+
+        assert overall == ProductAmountCacheResults.INVALID_AMOUNT
+        assert lines[1] == (ProductAmountCacheResults.INVALID_AMOUNT, None)
+        assert int(clean_redis.get("test:product:9:available")) == 10
+
 
 # ============================================================================
 # ТЕСТЫ С ПАРАЛЛЕЛЬНЫМ ВЫПОЛНЕНИЕМ - Проверка атомарности и thread-safety
@@ -457,3 +481,733 @@ class TestProductStockLogControllerConcurrency:
         assert final_available + final_reserved == initial_available, f"Инвариант суммы нарушен: {final_available} + {final_reserved} != {initial_available}"
         assert final_available >= 0, "Отрицательный остаток!"
         assert final_available == initial_available - total_success, f"Количество успешных операций не соответствует: {final_available} != {initial_available - total_success}"
+
+
+# ============================================================================
+# ТЕСТЫ ИДЕМПОТЕНТНОСТИ - повторы запросов клиента
+# ============================================================================
+
+class TestIdempotentReservations:
+    """
+    Тесты повторов резервирования с одним ключом идемпотентности
+    """
+
+    def test_retry_returns_stored_result(self, controller, clean_redis):
+        """
+        Повтор с тем же ключом возвращает первый результат и не меняет счётчики
+        """
+        available_key = "test:idempotency:1:available"
+        reserved_key = "test:idempotency:1:reserved"
+        clean_redis.set(available_key, 10)
+        clean_redis.set(reserved_key, 0)
+
+        first = controller.execute_lua_reservation_script(
+            available_key, reserved_key, 4, idempotency_key="order-1"
+        )
+        retry = controller.execute_lua_reservation_script(
+            available_key, reserved_key, 4, idempotency_key="order-1"
+        )
+
+        assert first == (ProductAmountCacheResults.ENOUGH_AMOUNT, 6)
+        assert retry == first
+        assert int(clean_redis.get(available_key)) == 6
+        assert int(clean_redis.get(reserved_key)) == 4
+        stored_key = f"{settings.IDEMPOTENCY_KEY_PREFIX}{{{available_key}}}:order-1"
+        assert 0 < clean_redis.ttl(stored_key) <= settings.IDEMPOTENCY_TTL
+
+    def test_same_request_id_for_different_skus(self, controller, clean_redis):
+        """
+        Один request_id для разных SKU - разные ключи идемпотентности
+        """
+        for sku in ("a", "b"):
+            clean_redis.set(f"test:idempotency:{sku}:available", 5)
+            clean_redis.set(f"test:idempotency:{sku}:reserved", 0)
+
+        first = controller.execute_lua_reservation_script(
+            "test:idempotency:a:available", "test:idempotency:a:reserved", 2, idempotency_key="order-1"
+        )
+        second = controller.execute_lua_reservation_script(
+            "test:idempotency:b:available", "test:idempotency:b:reserved", 1, idempotency_key="order-1"
+        )
+
+        assert first == (ProductAmountCacheResults.ENOUGH_AMOUNT, 3)
+        assert second == (ProductAmountCacheResults.ENOUGH_AMOUNT, 4)
+        assert int(clean_redis.get("test:idempotency:b:reserved")) == 1
+
+    def test_retry_of_key_not_exist(self, controller, clean_redis):
+        """
+        Сохраняется и результат без current_amount
+        """
+        args = ("test:idempotency:2:available", "test:idempotency:2:reserved", 1)
+
+        first = controller.execute_lua_reservation_script(*args, idempotency_key="order-2")
+        retry = controller.execute_lua_reservation_script(*args, idempotency_key="order-2")
+
+        assert first == retry == (ProductAmountCacheResults.KEY_NOT_EXIST, None)
+
+    def test_retry_storm(self, controller, clean_redis):
+        """
+        Шторм повторов из многих потоков: каждый заказ применяется ровно один раз
+        """
+        available_key = "test:idempotency:3:available"
+        reserved_key = "test:idempotency:3:reserved"
+        initial_available = 100
+        num_orders = 20
+        retries_per_order = 25
+        clean_redis.set(available_key, initial_available)
+        clean_redis.set(reserved_key, 0)
+
+        def retry_task(attempt):
+            order_id = attempt % num_orders
+            return order_id, controller.execute_lua_reservation_script(
+                available_key, reserved_key, 2, idempotency_key=f"storm-{order_id}"
+            )
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=20) as executor:
+            results = list(executor.map(retry_task, range(num_orders * retries_per_order)))
+
+        outcomes = {}
+        for order_id, outcome in results:
+            outcomes.setdefault(order_id, set()).add(outcome)
+
+        assert all(len(seen) == 1 for seen in outcomes.values()), "Повторы вернули разные результаты"
+        assert int(clean_redis.get(available_key)) == initial_available - 2 * num_orders
+        assert int(clean_redis.get(reserved_key)) == 2 * num_orders
+
+
+# ============================================================================
+# ТЕСТЫ РЕЕСТРА СКРИПТОВ - EVALSHA и восстановление после NOSCRIPT
+# ============================================================================
+
+class TestScriptRegistry:
+    """
+    Тесты для проверки реестра Lua-скриптов контроллера
+    """
+
+    def test_load_scripts_warms_cache(self, controller, clean_redis):
+        """
+        После load_scripts все скрипты уже есть в кэше Redis
+        """
+        clean_redis.script_flush()
+        controller.load_scripts()
+
+        shas = list(controller.scripts.shas.values())
+        assert all(clean_redis.script_exists(*shas))
+
+    def test_reload_after_noscript(self, controller, clean_redis):
+        """
+        После SCRIPT FLUSH (как после рестарта Redis) скрипт загружается заново
+        """
+        available_key = "test:registry:1:available"
+        reserved_key = "test:registry:1:reserved"
+
+        clean_redis.set(available_key, 10)
+        clean_redis.set(reserved_key, 0)
+
+        controller.load_scripts()
+        clean_redis.script_flush()
+
+        result, current_amount = controller.execute_lua_reservation_script(
+            available_key, reserved_key, 3
+        )
+
+        assert result == ProductAmountCacheResults.ENOUGH_AMOUNT
+        assert current_amount == 7
+        assert all(clean_redis.script_exists(controller.scripts.shas["reservation"]))
+
+
+# ============================================================================
+# ТЕСТЫ РЕЗЕРВИРОВАНИЯ КОРЗИНЫ - reserve_many, всё или ничего
+# ============================================================================
+
+class TestReserveMany:
+    """
+    Тесты атомарного резервирования нескольких SKU одним вызовом
+    """
+
+    def test_all_lines_reserved(self, controller, clean_redis, seed_stock):
+        """
+        Всех товаров хватает - резервируются все строки
+        """
+        keys = [seed_stock("test:cart:1", 10), seed_stock("test:cart:2", 5), seed_stock("test:cart:3", 1)]
+        items = [(a, r, amount) for (a, r), amount in zip(keys, [3, 5, 1])]
+
+        overall, lines = controller.reserve_many(items)
+
+        assert overall == ProductAmountCacheResults.ENOUGH_AMOUNT
+        assert lines == [
+            (ProductAmountCacheResults.ENOUGH_AMOUNT, 7),
+            (ProductAmountCacheResults.ENOUGH_AMOUNT, 0),
+            (ProductAmountCacheResults.ENOUGH_AMOUNT, 0),
+        ]
+        assert [int(clean_redis.get(r)) for _, r in keys] == [3, 5, 1]
+
+    def test_nothing_reserved_when_one_line_short(self, controller, clean_redis, seed_stock):
+        """
+        Одной строки не хватает - ни одна строка не применяется
+        """
+        keys = [seed_stock("test:cart:1", 10), seed_stock("test:cart:2", 2)]
+        items = [(keys[0][0], keys[0][1], 3), (keys[1][0], keys[1][1], 5)]
+
+        overall, lines = controller.reserve_many(items)
+
+        assert overall == ProductAmountCacheResults.NOT_ENOUGH_AMOUNT
+        assert lines == [
+            (ProductAmountCacheResults.ENOUGH_AMOUNT, 10),
+            (ProductAmountCacheResults.NOT_ENOUGH_AMOUNT, 2),
+        ]
+        assert int(clean_redis.get(keys[0][0])) == 10
+        assert int(clean_redis.get(keys[1][0])) == 2
+        assert int(clean_redis.get(keys[0][1])) == 0
+
+    def test_missing_key_line(self, controller, clean_redis, seed_stock):
+        """
+        Ключей одной из строк нет - KEY_NOT_EXIST и ничего не применяется
+        """
+        keys = [seed_stock("test:cart:1", 10)]
+        items = [
+            (keys[0][0], keys[0][1], 1),
+            ("test:cart:missing:available", "test:cart:missing:reserved", 1),
+        ]
+
+        overall, lines = controller.reserve_many(items)
+
+        assert overall == ProductAmountCacheResults.KEY_NOT_EXIST
+        assert lines[1] == (ProductAmountCacheResults.KEY_NOT_EXIST, None)
+        assert int(clean_redis.get(keys[0][0])) == 10
+
+    def test_duplicate_sku_lines_are_summed(self, controller, clean_redis, seed_stock):
+        """
+        Один SKU в нескольких строках - проверяется суммарное количество
+        """
+        keys = [seed_stock("test:cart:1", 5)]
+        available_key, reserved_key = keys[0]
+
+        overall, _ = controller.reserve_many(
+            [(available_key, reserved_key, 3), (available_key, reserved_key, 3)]
+        )
+
+        assert overall == ProductAmountCacheResults.NOT_ENOUGH_AMOUNT
+        assert int(clean_redis.get(available_key)) == 5
+
+        overall, lines = controller.reserve_many(
+            [(available_key, reserved_key, 3), (available_key, reserved_key, 2)]
+        )
+
+        assert overall == ProductAmountCacheResults.ENOUGH_AMOUNT
+        assert lines[-1] == (ProductAmountCacheResults.ENOUGH_AMOUNT, 0)
+        assert int(clean_redis.get(reserved_key)) == 5
+
+
+# ============================================================================
+# ТЕСТЫ ПАКЕТНОГО РЕЗЕРВИРОВАНИЯ - pipeline без MULTI/EXEC
+# ============================================================================
+
+class TestReservationBatch:
+    """
+    Тесты execute_lua_reservation_batch для независимых резерваций
+    """
+
+    def test_results_in_input_order(self, controller, clean_redis):
+        """
+        Каждый запрос получает свой результат в исходном порядке
+        """
+        clean_redis.set("test:batch:1:available", 3)
+        clean_redis.set("test:batch:1:reserved", 0)
+        clean_redis.set("test:batch:2:available", 10)
+        clean_redis.set("test:batch:2:reserved", 0)
+
+        requests = [
+            ("test:batch:1:available", "test:batch:1:reserved", 2),
+            ("test:batch:missing:available", "test:batch:missing:reserved", 1),
+            ("test:batch:1:available", "test:batch:1:reserved", 2),
+            ("test:batch:2:available", "test:batch:2:reserved", 4),
+        ]
+
+        results = controller.execute_lua_reservation_batch(requests, chunk_size=3)
+
+        assert results == [
+            (ProductAmountCacheResults.ENOUGH_AMOUNT, 1),
+            (ProductAmountCacheResults.KEY_NOT_EXIST, None),
+            (ProductAmountCacheResults.NOT_ENOUGH_AMOUNT, 1),
+            (ProductAmountCacheResults.ENOUGH_AMOUNT, 6),
+        ]
+
+    def test_noscript_inside_batch(self, controller, clean_redis):
+        """
+        NOSCRIPT посреди пачки - скрипт загружается, все запросы выполняются один раз
+        """
+        available_key = "test:batch:3:available"
+        reserved_key = "test:batch:3:reserved"
+        clean_redis.set(available_key, 100)
+        clean_redis.set(reserved_key, 0)
+        clean_redis.script_flush()
+
+        results = controller.execute_lua_reservation_batch(
+            [(available_key, reserved_key, 1)] * 25, chunk_size=10
+        )
+
+        assert all(r == ProductAmountCacheResults.ENOUGH_AMOUNT for r, _ in results)
+        assert int(clean_redis.get(available_key)) == 75
+        assert int(clean_redis.get(reserved_key)) == 25
+
+    def test_parallel_batches_exhausting(self, controller, clean_redis):
+        """
+        Пачки из нескольких потоков не резервируют больше, чем есть
+        """
+        available_key = "test:batch:4:available"
+        reserved_key = "test:batch:4:reserved"
+        initial_available = 50
+        clean_redis.set(available_key, initial_available)
+        clean_redis.set(reserved_key, 0)
+
+        def reserve_task(thread_id):
+            results = controller.execute_lua_reservation_batch(
+                [(available_key, reserved_key, 1)] * 20, chunk_size=7
+            )
+            return sum(1 for r, _ in results if r == ProductAmountCacheResults.ENOUGH_AMOUNT)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
+            total_success = sum(executor.map(reserve_task, range(5)))
+
+        assert total_success == initial_available
+        assert int(clean_redis.get(available_key)) == 0
+        assert int(clean_redis.get(reserved_key)) == initial_available
+
+
+# ============================================================================
+# ТЕСТЫ ШАРДИРОВАННОГО СТОКА - горячий SKU разбит на бакеты
+# ============================================================================
+
+class TestShardedStock:
+    """
+    Тесты резервирования из бакетов и rebalance
+    """
+
+    def test_rebalance_splits_stock(self, controller, clean_redis, seed_stock):
+        """
+        rebalance раскладывает сток по бакетам поровну
+        """
+        seed_stock(bucket_keys("hot-1", 0), 10)
+
+        assert controller.rebalance_stock_buckets("hot-1", 4) == 10
+
+        values = [int(clean_redis.get(bucket_keys("hot-1", bucket)[0])) for bucket in range(4)]
+        assert values == [3, 3, 2, 2]
+        assert all(int(clean_redis.get(bucket_keys("hot-1", bucket)[1])) == 0 for bucket in range(4))
+
+    def test_fallback_to_other_buckets(self, controller, clean_redis, seed_stock):
+        """
+        Когда бакет пуст, резервирование берётся из следующего
+        """
+        seed_stock(bucket_keys("hot-2", 0), 4)
+        controller.rebalance_stock_buckets("hot-2", 4)
+        clean_redis.set(bucket_keys("hot-2", 0)[0], 0)
+
+        results = [controller.execute_sharded_reservation("hot-2", 1, buckets=4) for _ in range(4)]
+
+        assert [r for r, _ in results].count(ProductAmountCacheResults.ENOUGH_AMOUNT) == 3
+        assert results[-1] == (ProductAmountCacheResults.NOT_ENOUGH_AMOUNT, 0)
+
+    def test_split_across_buckets(self, controller, clean_redis, seed_stock):
+        """
+        Если ни в одном бакете не хватает, количество собирается из нескольких
+        """
+        seed_stock(bucket_keys("hot-3", 0), 4)
+        controller.rebalance_stock_buckets("hot-3", 4)
+
+        assert controller.execute_sharded_reservation("hot-3", 2, buckets=4) == (
+            ProductAmountCacheResults.ENOUGH_AMOUNT, 0
+        )
+        assert controller.execute_sharded_reservation("hot-3", 3, buckets=4) == (
+            ProductAmountCacheResults.NOT_ENOUGH_AMOUNT, 2
+        )
+        assert controller.execute_sharded_reservation("hot-3", 2, buckets=4)[0] == (
+            ProductAmountCacheResults.ENOUGH_AMOUNT
+        )
+        assert sum(int(clean_redis.get(bucket_keys("hot-3", b)[0])) for b in range(4)) == 0
+        assert sum(int(clean_redis.get(bucket_keys("hot-3", b)[1])) for b in range(4)) == 4
+        assert controller.execute_sharded_reservation("missing", 1, buckets=4) == (
+            ProductAmountCacheResults.KEY_NOT_EXIST, None
+        )
+
+    def test_routing_key_picks_bucket(self, controller, clean_redis, seed_stock):
+        """
+        Один routing_key всегда начинает с одного и того же бакета
+        """
+        seed_stock(bucket_keys("hot-4", 0), 40)
+        controller.rebalance_stock_buckets("hot-4", 4)
+
+        for _ in range(3):
+            controller.execute_sharded_reservation("hot-4", 1, buckets=4, routing_key="user-7")
+
+        reserved = [int(clean_redis.get(bucket_keys("hot-4", bucket)[1])) for bucket in range(4)]
+        assert sorted(reserved) == [0, 0, 0, 3]
+
+    def test_parallel_sharded_reservations(self, controller, clean_redis, seed_stock):
+        """
+        Параллельные резервирования не уходят в минус и сохраняют сумму
+        """
+        initial_available = 100
+        seed_stock(bucket_keys("hot-5", 0), initial_available)
+        controller.rebalance_stock_buckets("hot-5", 8)
+
+        def reserve_task(thread_id):
+            return [controller.execute_sharded_reservation("hot-5", 1)[0] for _ in range(10)]
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=20) as executor:
+            results = [r for chunk in executor.map(reserve_task, range(20)) for r in chunk]
+
+        available = sum(int(clean_redis.get(bucket_keys("hot-5", b)[0])) for b in range(8))
+        reserved = sum(int(clean_redis.get(bucket_keys("hot-5", b)[1])) for b in range(8))
+        assert results.count(ProductAmountCacheResults.ENOUGH_AMOUNT) == initial_available
+        assert available == 0
+        assert reserved == initial_available
+
+
+# ============================================================================
+# ТЕСТЫ КЭША "НЕТ В НАЛИЧИИ" - быстрый отказ без обращения к Redis
+# ============================================================================
+
+class TestSoldOutCache:
+    """
+    Тесты локального кэша распроданных SKU в контроллере
+    """
+
+    def test_disabled_by_default(self, controller):
+        assert controller.sold_out_cache is None
+
+    def test_sold_out_answered_locally(self, clean_redis, seed_stock):
+        """
+        После NOT_ENOUGH_AMOUNT повторные попытки не доходят до Redis
+        """
+        controller = ProductStockLogController(sold_out_cache_ttl=60)
+        available_key, reserved_key = seed_stock("test:soldout:1", 0)
+
+        assert controller.execute_lua_reservation_script(available_key, reserved_key, 1) == (
+            ProductAmountCacheResults.NOT_ENOUGH_AMOUNT, 0
+        )
+
+        # Пополняем сток в обход контроллера - кэш всё ещё отвечает "нет"
+        clean_redis.set(available_key, 5)
+        assert controller.execute_lua_reservation_script(available_key, reserved_key, 1) == (
+            ProductAmountCacheResults.NOT_ENOUGH_AMOUNT, 0
+        )
+        assert int(clean_redis.get(available_key)) == 5
+
+    def test_smaller_amount_still_checked(self, clean_redis, seed_stock):
+        """
+        Кэш отказывает только тем, кому точно не хватит
+        """
+        controller = ProductStockLogController(sold_out_cache_ttl=60)
+        available_key, reserved_key = seed_stock("test:soldout:1", 3)
+
+        assert controller.execute_lua_reservation_script(available_key, reserved_key, 5)[0] == (
+            ProductAmountCacheResults.NOT_ENOUGH_AMOUNT
+        )
+        assert controller.execute_lua_reservation_script(available_key, reserved_key, 2) == (
+            ProductAmountCacheResults.ENOUGH_AMOUNT, 1
+        )
+
+    def test_idempotent_retry_bypasses_cache(self, clean_redis, seed_stock):
+        """
+        Повтор с ключом идемпотентности получает сохранённый результат, даже если SKU уже в кэше
+        """
+        controller = ProductStockLogController(sold_out_cache_ttl=60)
+        available_key, reserved_key = seed_stock("test:soldout:1", 2)
+
+        first = controller.execute_lua_reservation_script(
+            available_key, reserved_key, 2, idempotency_key="order-1"
+        )
+        assert controller.execute_lua_reservation_script(available_key, reserved_key, 1) == (
+            ProductAmountCacheResults.NOT_ENOUGH_AMOUNT, 0
+        )
+        retry = controller.execute_lua_reservation_script(
+            available_key, reserved_key, 2, idempotency_key="order-1"
+        )
+
+        assert first == retry == (ProductAmountCacheResults.ENOUGH_AMOUNT, 0)
+        assert int(clean_redis.get(reserved_key)) == 2
+
+    def test_entries_expire(self, clean_redis, seed_stock):
+        """
+        По истечении TTL попытка снова идёт в Redis
+        """
+        controller = ProductStockLogController(sold_out_cache_ttl=0.05)
+        available_key, reserved_key = seed_stock("test:soldout:1", 0)
+        controller.execute_lua_reservation_script(available_key, reserved_key, 1)
+        clean_redis.set(available_key, 5)
+
+        time.sleep(0.1)
+
+        assert controller.execute_lua_reservation_script(available_key, reserved_key, 1) == (
+            ProductAmountCacheResults.ENOUGH_AMOUNT, 4
+        )
+
+    def test_pubsub_invalidation(self, clean_redis, seed_stock):
+        """
+        notify_stock_replenished сбрасывает запись в кэше подписанных контроллеров
+        """
+        controller = ProductStockLogController(sold_out_cache_ttl=60)
+        controller.start_invalidation_listener()
+        try:
+            available_key, reserved_key = seed_stock("test:soldout:1", 0)
+            controller.execute_lua_reservation_script(available_key, reserved_key, 1)
+            clean_redis.set(available_key, 5)
+
+            ProductStockLogController().notify_stock_replenished(available_key)
+            deadline = time.monotonic() + 2
+            while controller.sold_out_cache.get(available_key) is not None and time.monotonic() < deadline:
+                time.sleep(0.01)
+
+            assert controller.execute_lua_reservation_script(available_key, reserved_key, 1) == (
+                ProductAmountCacheResults.ENOUGH_AMOUNT, 4
+            )
+        finally:
+            controller.stop_invalidation_listener()
+
+
+class TestSoldOutCachedStates(TestProductStockLogControllerStates):
+    """
+    Тесты состояний на контроллере с кэшем "нет в наличии", в котором
+    уже есть запись для ключа test_invalid_amount_state
+    """
+
+    @pytest.fixture
+    def controller(self):
+        ctrl = ProductStockLogController(sold_out_cache_ttl=60)
+        ctrl.sold_out_cache.set("test:product:8:available", 0)
+        return ctrl
+
+    @pytest.mark.parametrize("required_amount", [0, -5, 1.5, "abc"])
+    def test_invalid_amount_state(self, controller, clean_redis, required_amount):
+        """
+        INVALID_AMOUNT не подменяется ответом кэша и не сбрасывает запись
+        """
+        super().test_invalid_amount_state(controller, clean_redis, required_amount)
+
+        assert controller.sold_out_cache.get("test:product:8:available") == 0
+
+    def test_numeric_string_amount(self, controller, clean_redis):
+        """
+        Количество строкой не сравнивается с кэшем и проверяется скриптом, как без кэша
+        """
+        clean_redis.set("test:product:8:available", 10)
+        clean_redis.set("test:product:8:reserved", 0)
+
+        assert controller.execute_lua_reservation_script(
+            "test:product:8:available", "test:product:8:reserved", "2"
+        ) == (ProductAmountCacheResults.ENOUGH_AMOUNT, 8)
+
+
+# ============================================================================
+# ТЕСТЫ ХРАНЕНИЯ В ХЭШЕ - available/reserved/sold/version в одном ключе
+# ============================================================================
+
+class TestHashStock:
+    """
+    Тесты резервирования для стока, хранящегося в одном хэше
+    """
+
+    def test_reservation_states(self, controller, clean_redis, seed_stock):
+        """
+        Те же состояния, что и у пары строковых ключей
+        """
+        stock_key = seed_stock(stock_hash_key("hash-1"), 5, layout="hash")
+
+        assert controller.execute_hash_reservation_script(stock_key, 3) == (
+            ProductAmountCacheResults.ENOUGH_AMOUNT, 2
+        )
+        assert controller.execute_hash_reservation_script(stock_key, 3) == (
+            ProductAmountCacheResults.NOT_ENOUGH_AMOUNT, 2
+        )
+        assert controller.execute_hash_reservation_script(stock_hash_key("missing"), 1) == (
+            ProductAmountCacheResults.KEY_NOT_EXIST, None
+        )
+        assert controller.execute_hash_reservation_script(stock_key, 0) == (
+            ProductAmountCacheResults.INVALID_AMOUNT, None
+        )
+        assert controller.get_stock_record(stock_key) == {
+            "available": 2, "reserved": 3, "sold": 0, "version": 1
+        }
+
+    def test_commit_and_release(self, controller, clean_redis, seed_stock):
+        """
+        commit переводит reserved в sold, release - обратно в available
+        """
+        stock_key = seed_stock(stock_hash_key("hash-2"), 10, layout="hash")
+        controller.execute_hash_reservation_script(stock_key, 6)
+
+        assert controller.commit_hash_reservation(stock_key, 4) == (ProductAmountCacheResults.ENOUGH_AMOUNT, 2)
+        assert controller.release_hash_reservation(stock_key, 3) == (ProductAmountCacheResults.NOT_ENOUGH_AMOUNT, 2)
+        assert controller.release_hash_reservation(stock_key, 2) == (ProductAmountCacheResults.ENOUGH_AMOUNT, 0)
+        assert controller.get_stock_record(stock_key) == {
+            "available": 6, "reserved": 0, "sold": 4, "version": 3
+        }
+        assert controller.get_stock_record(stock_hash_key("missing")) is None
+
+    def test_parallel_hash_reservations(self, controller, clean_redis, seed_stock):
+        """
+        Параллельные резервирования через пачки не уходят в минус
+        """
+        initial_available = 50
+        stock_key = seed_stock(stock_hash_key("hash-3"), initial_available, layout="hash")
+
+        def reserve_task(thread_id):
+            results = controller.execute_hash_reservation_batch([(stock_key, 1)] * 10, chunk_size=4)
+            return sum(1 for r, _ in results if r == ProductAmountCacheResults.ENOUGH_AMOUNT)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
+            total_success = sum(executor.map(reserve_task, range(10)))
+
+        record = controller.get_stock_record(stock_key)
+        assert total_success == initial_available
+        assert record["available"] == 0
+        assert record["reserved"] == initial_available
+
+
+# ============================================================================
+# ТЕСТЫ ХОЛДОВ - release, commit и возврат просроченных холдов
+# ============================================================================
+
+class TestReservationHolds:
+    """
+    Тесты холдов с временем жизни и новых состояний
+    ALREADY_RELEASED (4) и UNKNOWN_HOLD (5)
+    """
+
+    def test_release_returns_stock(self, controller, clean_redis, seed_stock):
+        """
+        release возвращает количество из reserved в available
+        """
+        available_key, reserved_key = seed_stock("test:hold:1", 10)
+
+        result, current_amount, reservation_id = controller.reserve_hold(available_key, reserved_key, 4)
+
+        assert result == ProductAmountCacheResults.ENOUGH_AMOUNT
+        assert current_amount == 6
+        assert reservation_id is not None
+
+        assert controller.release(reservation_id) == (ProductAmountCacheResults.ENOUGH_AMOUNT, 10)
+        assert int(clean_redis.get(reserved_key)) == 0
+        assert clean_redis.zcard(settings.HOLDS_EXPIRY_KEY) == 0
+
+    def test_commit_keeps_stock_out(self, controller, clean_redis, seed_stock):
+        """
+        commit списывает количество из reserved без возврата в available
+        """
+        available_key, reserved_key = seed_stock("test:hold:1", 10)
+        _, _, reservation_id = controller.reserve_hold(available_key, reserved_key, 4)
+
+        assert controller.commit(reservation_id) == (ProductAmountCacheResults.ENOUGH_AMOUNT, 6)
+        assert int(clean_redis.get(available_key)) == 6
+        assert int(clean_redis.get(reserved_key)) == 0
+
+    def test_already_released_and_unknown(self, controller, clean_redis, seed_stock):
+        """
+        Повторный release/commit - ALREADY_RELEASED, неизвестный холд - UNKNOWN_HOLD
+        """
+        available_key, reserved_key = seed_stock("test:hold:1", 10)
+        _, _, reservation_id = controller.reserve_hold(available_key, reserved_key, 4)
+        controller.release(reservation_id)
+
+        assert controller.release(reservation_id) == (ProductAmountCacheResults.ALREADY_RELEASED, None)
+        assert controller.commit(reservation_id) == (ProductAmountCacheResults.ALREADY_RELEASED, None)
+        assert controller.release("missing") == (ProductAmountCacheResults.UNKNOWN_HOLD, None)
+        assert int(clean_redis.get(available_key)) == 10
+
+    def test_failed_reservation_has_no_hold(self, controller, clean_redis, seed_stock):
+        """
+        Неудачное резервирование не создаёт холд
+        """
+        available_key, reserved_key = seed_stock("test:hold:1", 1)
+
+        result, current_amount, reservation_id = controller.reserve_hold(available_key, reserved_key, 4)
+
+        assert result == ProductAmountCacheResults.NOT_ENOUGH_AMOUNT
+        assert current_amount == 1
+        assert reservation_id is None
+        assert clean_redis.zcard(settings.HOLDS_EXPIRY_KEY) == 0
+
+    def test_sweep_expired_holds_in_batches(self, controller, clean_redis, seed_stock):
+        """
+        Просроченные холды возвращаются в available пачками не больше batch_size
+        """
+        available_key, reserved_key = seed_stock("test:hold:1", 10)
+        expired = [controller.reserve_hold(available_key, reserved_key, 1, ttl=-1)[2] for _ in range(5)]
+        alive = controller.reserve_hold(available_key, reserved_key, 1, ttl=600)[2]
+
+        assert controller.sweep_expired_holds(batch_size=3) == (3, 3)
+        assert controller.sweep_expired_holds(batch_size=3) == (2, 2)
+        assert controller.sweep_expired_holds(batch_size=3) == (0, 0)
+
+        assert int(clean_redis.get(available_key)) == 9
+        assert int(clean_redis.get(reserved_key)) == 1
+        assert controller.release(expired[0])[0] == ProductAmountCacheResults.ALREADY_RELEASED
+        assert controller.release(alive) == (ProductAmountCacheResults.ENOUGH_AMOUNT, 10)
+
+
+# ============================================================================
+# ТЕСТЫ ЧТЕНИЯ ОСТАТКОВ - get_availability
+# ============================================================================
+
+class TestAvailability:
+    """
+    Тесты пакетного чтения остатков и локального кэша с пределом устаревания
+    """
+
+    def test_keys_layout(self, controller, clean_redis):
+        """
+        Раскладка keys: MGET пачками по chunk_size, порядок SKU сохраняется, отсутствующий SKU - None
+        """
+        for sku in range(1200):
+            clean_redis.set(stock_keys(sku)[0], sku)
+
+        availability = controller.get_availability([*range(1200), "missing"], chunk_size=500)
+
+        assert availability == {**{sku: sku for sku in range(1200)}, "missing": None}
+        assert list(availability) == [*range(1200), "missing"]
+
+    def test_hash_layout(self, controller, clean_redis):
+        """
+        Раскладка hash читает поле available; неизвестный layout - ValueError
+        """
+        clean_redis.hset(stock_hash_key("a"), mapping={"available": 7, "reserved": 1})
+
+        assert controller.get_availability(["a", "b"], layout="hash") == {"a": 7, "b": None}
+        with pytest.raises(ValueError):
+            controller.get_availability(["a"], layout="unknown")
+
+    def test_cache_disabled_by_default(self, controller):
+        """
+        Без availability_cache_ttl кэш остатков не создаётся
+        """
+        assert controller.availability_cache is None
+
+    def test_cached_values_served_locally(self, clean_redis):
+        """
+        В пределах TTL остатки и отсутствие SKU отдаются из кэша, в Redis идут только новые SKU
+        """
+        controller = ProductStockLogController(availability_cache_ttl=60)
+        clean_redis.set(stock_keys("a")[0], 5)
+
+        assert controller.get_availability(["a", "b"]) == {"a": 5, "b": None}
+
+        # Меняем Redis в обход кэша: в пределах TTL кэш отвечает без обращения к Redis
+        clean_redis.set(stock_keys("a")[0], 1)
+        clean_redis.set(stock_keys("b")[0], 3)
+        assert controller.get_availability(["a", "b", "c"]) == {"a": 5, "b": None, "c": None}
+        assert len(controller.availability_cache) == 3
+
+    def test_staleness_bound(self, clean_redis):
+        """
+        После TTL остаток снова читается из Redis
+        """
+        controller = ProductStockLogController(availability_cache_ttl=0.05)
+        clean_redis.set(stock_keys("a")[0], 5)
+        controller.get_availability(["a"])
+        clean_redis.set(stock_keys("a")[0], 4)
+
+        time.sleep(0.06)
+
+        assert controller.get_availability(["a"]) == {"a": 4}
@@ -0,0 +1,196 @@
+import pytest
+import redis
+
+from enums import ProductAmountCacheResults
+from events import StockEvent, StockEventConsumer
+from keys import bucket_keys, stock_hash_key, stock_keys
+from redis_controller import ProductStockLogController
+import settings
+
+
+STREAM = "test:stock:events"
+
+
+@pytest.fixture
+def stock(seed_stock):
+    return seed_stock(stock_keys("sku-1"), 3)
+
+
+def _consumer(clean_redis, name="worker-1", **kwargs):
+    consumer = StockEventConsumer("warehouse", name, redis_client=clean_redis, stream=STREAM, block_ms=10, **kwargs)
+    consumer.ensure_group()
+    return consumer
+
+
+# ============================================================================
+# ТЕСТЫ СТРИМА СОБЫТИЙ
+# ============================================================================
+
+class TestStockEvents:
+    """
+    Тесты записи событий скриптами резервирования и чтения через consumer group
+    """
+
+    def test_disabled_by_default(self, clean_redis, stock):
+        ProductStockLogController().execute_lua_reservation_script(*stock, 1)
+
+        assert clean_redis.exists(STREAM) == 0
+
+    def test_reservation_writes_events(self, clean_redis, stock):
+        controller = ProductStockLogController(events_stream=STREAM)
+
+        controller.execute_lua_reservation_script(*stock, 2)
+        controller.execute_lua_reservation_script(*stock, 2)
+        controller.execute_lua_reservation_batch([(*stock, 1), ("missing:available", "missing:reserved", 1)])
+
+        events = _consumer(clean_redis).read()
+        assert [event[1:] for event in events] == [
+            ("sku-1", "2", ProductAmountCacheResults.ENOUGH_AMOUNT, 1, "reservation"),
+            ("sku-1", "2", ProductAmountCacheResults.NOT_ENOUGH_AMOUNT, 1, "reservation"),
+            ("sku-1", "1", ProductAmountCacheResults.ENOUGH_AMOUNT, 0, "reservation"),
+            ("missing:available", "1", ProductAmountCacheResults.KEY_NOT_EXIST, None, "reservation"),
+        ]
+
+    def test_idempotent_replay_not_repeated(self, clean_redis, stock):
+        controller = ProductStockLogController(events_stream=STREAM)
+
+        for _ in range(3):
+            assert controller.execute_lua_reservation_script(*stock, 1, idempotency_key="order-1") == (
+                ProductAmountCacheResults.ENOUGH_AMOUNT, 2
+            )
+
+        assert clean_redis.xlen(STREAM) == 1
+
+    def test_coalesced_reservations_write_events(self, clean_redis, stock):
+        controller = ProductStockLogController(events_stream=STREAM, coalesce_window=0.001)
+
+        controller.execute_lua_reservation_script(*stock, 5)
+
+        [event] = _consumer(clean_redis).read()
+        assert event[1:] == ("sku-1", "5", ProductAmountCacheResults.NOT_ENOUGH_AMOUNT, 3, "reservation")
+
+    def test_cart_events(self, clean_redis, stock):
+        """
+        reserve_many пишет событие на каждую строку; при отказе корзины - с общим результатом
+        """
+        controller = ProductStockLogController(events_stream=STREAM)
+        other = stock_keys("sku-2")
+        clean_redis.set(other[0], 1)
+        clean_redis.set(other[1], 0)
+
+        controller.reserve_many([(*stock, 1), (*other, 1)])
+        controller.reserve_many([(*stock, 1), (*other, 1)])
+
+        events = _consumer(clean_redis).read()
+        assert [(event.sku, event.result, event.available) for event in events] == [
+            ("sku-1", ProductAmountCacheResults.ENOUGH_AMOUNT, 2),
+            ("sku-2", ProductAmountCacheResults.ENOUGH_AMOUNT, 0),
+            ("sku-1", ProductAmountCacheResults.NOT_ENOUGH_AMOUNT, 2),
+            ("sku-2", ProductAmountCacheResults.NOT_ENOUGH_AMOUNT, 0),
+        ]
+
+    def test_hold_lifecycle_events(self, clean_redis, stock):
+        """
+        Холд пишет reservation, release/commit и expire при sweep; повторное снятие - ничего
+        """
+        controller = ProductStockLogController(events_stream=STREAM)
+        _, _, released_id = controller.reserve_hold(*stock, 1)
+        _, _, committed_id = controller.reserve_hold(*stock, 1)
+        controller.reserve_hold(*stock, 1, ttl=-1)
+        controller.release(released_id)
+        controller.release(released_id)
+        controller.commit(committed_id)
+        controller.sweep_expired_holds()
+
+        events = _consumer(clean_redis).read()
+        assert [(event.kind, event.sku, event.amount, event.available) for event in events] == [
+            ("reservation", "sku-1", "1", 2),
+            ("reservation", "sku-1", "1", 1),
+            ("reservation", "sku-1", "1", 0),
+            ("release", "sku-1", "1", 1),
+            ("commit", "sku-1", "1", 1),
+            ("expire", "sku-1", "1", 2),
+        ]
+
+    def test_hash_and_sharded_events(self, clean_redis):
+        """
+        Хэши и бакеты пишут события с SKU; у бакетов available - сумма по всем бакетам
+        """
+        controller = ProductStockLogController(events_stream=STREAM)
+        clean_redis.hset(stock_hash_key("h"), mapping={"available": 3, "reserved": 0, "sold": 0, "version": 0})
+        clean_redis.set(bucket_keys("b", 0)[0], 4)
+        controller.rebalance_stock_buckets("b", buckets=2)
+
+        controller.execute_hash_reservation_script(stock_hash_key("h"), 2)
+        controller.release_hash_reservation(stock_hash_key("h"), 1)
+        controller.commit_hash_reservation(stock_hash_key("h"), 1)
+        controller.execute_sharded_reservation("b", 3, buckets=2)
+
+        events = _consumer(clean_redis).read()
+        assert [(event.kind, event.sku, event.amount, event.result, event.available) for event in events] == [
+            ("reservation", "h", "2", ProductAmountCacheResults.ENOUGH_AMOUNT, 1),
+            ("release", "h", "1", ProductAmountCacheResults.ENOUGH_AMOUNT, 2),
+            ("commit", "h", "1", ProductAmountCacheResults.ENOUGH_AMOUNT, 2),
+            ("reservation", "b", "3", ProductAmountCacheResults.ENOUGH_AMOUNT, 1),
+        ]
+
+    def test_maxlen_caps_stream(self, clean_redis, stock, monkeypatch):
+        monkeypatch.setattr("settings.STOCK_EVENTS_MAXLEN", 10)
+        controller = ProductStockLogController(events_stream=STREAM)
+
+        controller.execute_lua_reservation_batch([(*stock, 100)] * 500)
+
+        # MAXLEN ~ обрезает целыми узлами стрима, поэтому длина - около предела
+        assert clean_redis.xlen(STREAM) < 500
+
+    def test_consume_acknowledges(self, clean_redis, stock):
+        controller = ProductStockLogController(events_stream=STREAM)
+        for _ in range(5):
+            controller.execute_lua_reservation_script(*stock, 1)
+        consumer = _consumer(clean_redis, batch_size=2)
+        batches = []
+
+        handled = consumer.consume(batches.append, max_batches=3)
+
+        assert handled == 5
+        assert [len(batch) for batch in batches] == [2, 2, 1]
+        assert clean_redis.xpending(STREAM, "warehouse")["pending"] == 0
+        assert consumer.read() == []
+
+    def test_pending_redelivered_after_restart(self, clean_redis, stock):
+        controller = ProductStockLogController(events_stream=STREAM)
+        controller.execute_lua_reservation_script(*stock, 1)
+        first = _consumer(clean_redis).read()
+
+        # Процесс упал, не подтвердив событие: тот же consumer получит его снова
+        restarted = _consumer(clean_redis)
+        assert restarted.read() == first
+        restarted.ack(first)
+        assert restarted.read() == []
+
+    def test_claim_stale_from_other_consumer(self, clean_redis, stock):
+        controller = ProductStockLogController(events_stream=STREAM)
+        controller.execute_lua_reservation_script(*stock, 1)
+        [event] = _consumer(clean_redis, "worker-1").read()
+
+        claimed = _consumer(clean_redis, "worker-2").claim_stale(min_idle_ms=0)
+
+        assert claimed == [event]
+        assert isinstance(event, StockEvent)
+
+    @pytest.mark.parametrize("protocol", [2, 3])
+    @pytest.mark.parametrize("decode_responses", [False, True])
+    def test_reply_shapes(self, clean_redis, stock, protocol, decode_responses):
+        """
+        Ответы XREADGROUP/XAUTOCLAIM разбираются и на RESP3, и с decode_responses
+        """
+        client = redis.StrictRedis(
+            host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=15,
+            protocol=protocol, decode_responses=decode_responses
+        )
+        ProductStockLogController(events_stream=STREAM).execute_lua_reservation_script(*stock, 1)
+
+        [event] = _consumer(client, "worker-1").read()
+        assert event.sku == "sku-1"
+        assert event.result == ProductAmountCacheResults.ENOUGH_AMOUNT
+        assert _consumer(client, "worker-2").claim_stale(min_idle_ms=0) == [event]
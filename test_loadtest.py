@@ -0,0 +1,69 @@
+from collections import Counter
+
+from keys import stock_keys
+from loadtest import SKU_PREFIX, build_workload, percentile, run_asyncio, run_threads, seed_stock, summarize
+from redis_controller import ProductStockLogController
+
+
+# ============================================================================
+# ТЕСТЫ НАГРУЗОЧНОГО ТЕСТА
+# ============================================================================
+
+class TestLoadTest:
+    """
+    Тесты генерации нагрузки, прогонов и сводки по задержкам
+    """
+
+    def test_zipf_workload_prefers_hot_skus(self):
+        """
+        Тест генерации нагрузки по Zipf
+        Нагрузка воспроизводима по seed, чаще всего запрашивается первый SKU
+        """
+        workload = build_workload(5000, 100, 1.2, 1, 3, seed=1)
+        hits = Counter(available_key for available_key, _, _ in workload)
+
+        assert len(workload) == 5000
+        assert workload == build_workload(5000, 100, 1.2, 1, 3, seed=1)
+        assert hits.most_common(1)[0][0] == stock_keys(f"{SKU_PREFIX}0")[0]
+        assert {amount for _, _, amount in workload} == {1, 2, 3}
+
+    def test_summary_percentiles(self):
+        """
+        Тест сводки по задержкам
+        Перцентили, пропускная способность и исходы считаются верно
+        """
+        latencies = [index / 1000 for index in range(1, 1001)]
+
+        summary = summarize(latencies, Counter(ENOUGH_AMOUNT=1000), elapsed=2.0)
+
+        assert percentile(sorted(latencies), 0.5) == 0.501
+        assert summary["ops_per_sec"] == 500.0
+        assert summary["latency_us"]["p999"] == 1000000.0
+        assert summary["outcomes"] == {"ENOUGH_AMOUNT": 1000}
+
+    def test_threads_keep_stock_consistent(self, clean_redis):
+        """
+        Тест прогона в потоках
+        Число успешных резервов совпадает с reserved в Redis
+        """
+        seed_stock(clean_redis, 5, 20)
+        workload = build_workload(200, 5, 1.0, 1, 1, seed=0)
+
+        latencies, outcomes = run_threads(workload, 8, ProductStockLogController)
+
+        reserved = sum(int(clean_redis.get(stock_keys(f"{SKU_PREFIX}{sku}")[1])) for sku in range(5))
+        assert len(latencies) == 200
+        assert outcomes["ENOUGH_AMOUNT"] == reserved
+        assert outcomes["ENOUGH_AMOUNT"] + outcomes["NOT_ENOUGH_AMOUNT"] == 200
+
+    def test_asyncio_mode(self, clean_redis):
+        """
+        Тест прогона на asyncio
+        При достаточном стоке все запросы получают ENOUGH_AMOUNT
+        """
+        seed_stock(clean_redis, 3, 1000)
+
+        latencies, outcomes = run_asyncio(build_workload(100, 3, 1.0, 1, 1, seed=0), 10, None)
+
+        assert len(latencies) == 100
+        assert outcomes == Counter(ENOUGH_AMOUNT=100)
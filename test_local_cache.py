@@ -0,0 +1,63 @@
+from local_cache import TTLCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+# ============================================================================
+# ТЕСТЫ ЛОКАЛЬНОГО КЭША - LRU и TTL
+# ============================================================================
+
+class TestTTLCache:
+    """
+    Тесты TTLCache: вытеснение по LRU и истечение записей
+    """
+
+    def test_entries_expire(self):
+        """
+        Тест истечения записей
+        По прошествии ttl запись не возвращается и удаляется
+        """
+        clock = FakeClock()
+        cache = TTLCache(max_size=10, ttl=1.0, clock=clock)
+        cache.set("a", 0)
+
+        assert cache.get("a") == 0
+        clock.now = 1.0
+        assert cache.get("a") is None
+        assert len(cache) == 0
+
+    def test_lru_eviction(self):
+        """
+        Тест вытеснения по LRU
+        При переполнении вытесняется давно не читанная запись
+        """
+        cache = TTLCache(max_size=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        assert cache.get("a") == 1
+        assert cache.get("b") is None
+        assert cache.get("c") == 3
+
+    def test_pop_and_clear(self):
+        """
+        Тест удаления записей
+        pop отсутствующего ключа не падает, clear очищает кэш
+        """
+        cache = TTLCache(max_size=10, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.pop("a")
+        cache.pop("missing")
+
+        assert cache.get("a") is None
+        cache.clear()
+        assert len(cache) == 0
@@ -0,0 +1,130 @@
+import asyncio
+
+import pytest
+
+from async_redis_controller import AsyncProductStockLogController
+from connection import TimedBlockingConnectionPool, connection_kwargs
+from enums import ProductAmountCacheResults
+from metrics import LatencyHistogram, PrometheusHooks, ReservationMetrics, prometheus_client
+from redis_controller import ProductStockLogController
+import redis
+
+
+# ============================================================================
+# ТЕСТЫ ГИСТОГРАММЫ ЗАДЕРЖЕК
+# ============================================================================
+
+class TestLatencyHistogram:
+    """
+    Тесты лог-линейной гистограммы: точность квантилей и граничные случаи
+    """
+
+    def test_empty(self):
+        assert LatencyHistogram().percentile(0.99) == 0.0
+
+    def test_percentiles_within_relative_error(self):
+        histogram = LatencyHistogram()
+        for micros in range(1, 100001):
+            histogram.record(micros / 1e6)
+
+        assert histogram.count == 100000
+        for fraction in (0.5, 0.95, 0.99, 0.999):
+            expected = fraction * 0.1
+            assert expected <= histogram.percentile(fraction) <= expected * 1.02
+        assert histogram.percentile(1.0) == histogram.max == 0.1
+
+    def test_small_values_are_exact(self):
+        histogram = LatencyHistogram()
+        for micros in (3, 3, 7, 100):
+            histogram.record(micros / 1e6)
+
+        assert histogram.percentile(0.5) == 3e-6
+        assert histogram.percentile(0.75) == 7e-6
+
+
+# ============================================================================
+# ТЕСТЫ ХУКОВ КОНТРОЛЛЕРА
+# ============================================================================
+
+class TestReservationMetrics:
+    """
+    Тесты сбора задержек, исходов, NOSCRIPT и ожиданий пула через хуки
+    """
+
+    def test_disabled_by_default(self, clean_redis):
+        assert ProductStockLogController().scripts.hooks == []
+
+    def test_outcomes_and_latency(self, clean_redis):
+        clean_redis.set("product:available", 2)
+        clean_redis.set("product:reserved", 0)
+        metrics = ReservationMetrics(track_keys=True)
+        controller = ProductStockLogController(hooks=[metrics])
+
+        controller.execute_lua_reservation_script("product:available", "product:reserved", 2)
+        controller.execute_lua_reservation_script("product:available", "product:reserved", 1)
+        controller.execute_lua_reservation_script("missing:available", "missing:reserved", 1)
+
+        snapshot = metrics.snapshot()
+        assert snapshot["latency"]["reservation"]["count"] == 3
+        assert snapshot["outcomes"] == {
+            "reservation:ENOUGH_AMOUNT": 1,
+            "reservation:NOT_ENOUGH_AMOUNT": 1,
+            "reservation:KEY_NOT_EXIST": 1,
+        }
+        assert snapshot["keys"] == {"product:available": 2, "missing:available": 1}
+
+    def test_batch_and_noscript(self, clean_redis):
+        clean_redis.set("product:available", 1)
+        clean_redis.set("product:reserved", 0)
+        metrics = ReservationMetrics()
+        controller = ProductStockLogController(hooks=[metrics])
+        controller.load_scripts()
+        clean_redis.script_flush()
+
+        controller.execute_lua_reservation_batch([("product:available", "product:reserved", 1)] * 3)
+
+        snapshot = metrics.snapshot()
+        assert snapshot["noscript"] == {"reservation": 1}
+        assert snapshot["latency"]["reservation:pipeline"]["count"] == 1
+        assert snapshot["outcomes"] == {"reservation:ENOUGH_AMOUNT": 1, "reservation:NOT_ENOUGH_AMOUNT": 2}
+
+    def test_tracked_keys_are_bounded(self, clean_redis):
+        metrics = ReservationMetrics(track_keys=True, max_tracked_keys=2)
+        controller = ProductStockLogController(hooks=[metrics])
+
+        for sku in range(4):
+            controller.execute_lua_reservation_script(f"{sku}:available", f"{sku}:reserved", 1)
+
+        assert metrics.keys == {"0:available": 1, "1:available": 1, "<other>": 2}
+
+    def test_pool_wait(self, clean_redis):
+        metrics = ReservationMetrics()
+        pool = TimedBlockingConnectionPool(max_connections=2, **connection_kwargs())
+        pool.wait_hooks.append(metrics)
+
+        redis.StrictRedis(connection_pool=pool).ping()
+
+        assert metrics.pool_wait.count == 1
+        pool.disconnect()
+
+    def test_async_hooks(self, clean_redis):
+        metrics = ReservationMetrics()
+
+        async def scenario():
+            async with AsyncProductStockLogController(hooks=[metrics]) as controller:
+                await controller.execute_lua_reservation_script("product:available", "product:reserved", 1)
+
+        asyncio.run(scenario())
+
+        assert metrics.outcomes == {("reservation", ProductAmountCacheResults.KEY_NOT_EXIST): 1}
+
+    @pytest.mark.skipif(prometheus_client is None, reason="prometheus_client не установлен")
+    def test_prometheus_hooks(self, clean_redis):
+        registry = prometheus_client.CollectorRegistry()
+        controller = ProductStockLogController(hooks=[PrometheusHooks(registry)])
+
+        controller.execute_lua_reservation_script("product:available", "product:reserved", 1)
+
+        assert registry.get_sample_value(
+            "stock_script_outcomes_total", {"script": "reservation", "outcome": "KEY_NOT_EXIST"}
+        ) == 1
@@ -0,0 +1,54 @@
+from migrate import migrate_to_hash
+
+
+# ============================================================================
+# ТЕСТЫ МИГРАЦИИ - пары строковых ключей в хэши
+# ============================================================================
+
+class TestMigrateToHash:
+    """
+    Тесты переноса стока из пар ключей в хэши пачками SCAN
+    """
+
+    def test_pairs_migrated(self, clean_redis):
+        """
+        Тест переноса пар ключей в хэши
+        Все пары переносятся пачками SCAN, старые ключи остаются
+        """
+        for sku in range(25):
+            clean_redis.set(f"test:migrate:{sku}:available", sku)
+            clean_redis.set(f"test:migrate:{sku}:reserved", 1)
+
+        migrated = migrate_to_hash(clean_redis, match="test:migrate:*:available", batch_size=7)
+
+        assert migrated == 25
+        assert clean_redis.hgetall("test:migrate:3") == {
+            b"available": b"3", b"reserved": b"1", b"sold": b"0", b"version": b"0"
+        }
+        assert clean_redis.exists("test:migrate:3:available") == 1
+
+    def test_incomplete_pairs_and_existing_hashes_skipped(self, clean_redis):
+        """
+        Тест пропуска неполных пар и готовых хэшей
+        Пара без reserved и уже существующий хэш не трогаются
+        """
+        clean_redis.set("test:migrate:a:available", 5)
+        clean_redis.set("test:migrate:b:available", 5)
+        clean_redis.set("test:migrate:b:reserved", 0)
+        clean_redis.hset("test:migrate:b", mapping={"available": 9, "reserved": 0})
+
+        assert migrate_to_hash(clean_redis, match="test:migrate:*:available") == 0
+        assert clean_redis.exists("test:migrate:a") == 0
+        assert clean_redis.hget("test:migrate:b", "available") == b"9"
+
+    def test_delete_old_keys(self, clean_redis):
+        """
+        Тест удаления старых ключей
+        С delete_old=True пара ключей удаляется после переноса
+        """
+        clean_redis.set("test:migrate:c:available", 5)
+        clean_redis.set("test:migrate:c:reserved", 2)
+
+        assert migrate_to_hash(clean_redis, match="test:migrate:*:available", delete_old=True) == 1
+        assert clean_redis.exists("test:migrate:c:available", "test:migrate:c:reserved") == 0
+        assert clean_redis.hget("test:migrate:c", "reserved") == b"2"
@@ -0,0 +1,59 @@
+import multiprocessing
+import os
+
+import connection
+from enums import ProductAmountCacheResults
+from process_pool import ReservationProcessPool
+
+
+def _child_pool_state():
+    pool = connection.get_connection_pool()
+    return os.getpid(), pool.pid, connection.get_connection_pool() is pool
+
+
+# ============================================================================
+# ТЕСТЫ ПУЛА ПРОЦЕССОВ
+# ============================================================================
+
+class TestReservationProcessPool:
+    """
+    Тесты резервирований из нескольких процессов
+    """
+
+    def test_pool_rebuilt_after_fork(self, clean_redis):
+        """
+        Дочерний процесс не наследует пул родителя
+        """
+        parent_pool = connection.get_connection_pool()
+        parent_pool.get_connection().disconnect()
+
+        with multiprocessing.get_context("fork").Pool(1) as pool:
+            child_pid, pool_pid, same_pool = pool.apply(_child_pool_state)
+
+        assert child_pid != os.getpid()
+        assert pool_pid == child_pid
+        assert same_pool
+        assert connection.get_connection_pool() is parent_pool
+
+    def test_results_in_order(self, clean_redis):
+        """
+        У каждого запроса свой SKU с остатком sku % 3 - ответ однозначно
+        показывает, на своём ли он месте
+        """
+        requests = []
+        for sku in range(250):
+            available_key, reserved_key = f"test:pp:{sku}:available", f"test:pp:{sku}:reserved"
+            clean_redis.set(available_key, sku % 3)
+            clean_redis.set(reserved_key, 0)
+            requests.append((available_key, reserved_key, 1))
+        requests.append(("test:pp:missing:available", "test:pp:missing:reserved", 1))
+
+        with ReservationProcessPool(processes=3, start_method="fork") as pool:
+            results = pool.reserve(requests, chunk_size=20)
+
+        assert results[:-1] == [
+            (ProductAmountCacheResults.ENOUGH_AMOUNT, sku % 3 - 1) if sku % 3
+            else (ProductAmountCacheResults.NOT_ENOUGH_AMOUNT, 0)
+            for sku in range(250)
+        ]
+        assert results[-1] == (ProductAmountCacheResults.KEY_NOT_EXIST, None)
@@ -0,0 +1,143 @@
+import json
+import os
+import threading
+
+import pytest
+
+from enums import ProductAmountCacheResults
+from redis_controller import ProductStockLogController
+from script import SCRIPTS
+from script_catalog import build_catalog, default_catalog, from_sources, load_catalog, preload, write_manifest
+from script_registry import ScriptRegistry
+import settings
+
+
+def _build_v2(directory):
+    # Та же логика, другой исходник - другой SHA
+    scripts = dict(SCRIPTS, reservation=SCRIPTS["reservation"] + "-- v2\n")
+    build_catalog("v2", str(directory), scripts)
+    return load_catalog("v2", str(directory))
+
+
+class _PausedClient:
+    """Клиент, который задерживает первый EVALSHA, пока тест не разрешит продолжить"""
+
+    def __init__(self, client):
+        self.client = client
+        self.started = threading.Event()
+        self.resume = threading.Event()
+        self.evalsha_shas = []
+
+    def evalsha(self, sha, *args):
+        self.evalsha_shas.append(sha)
+        if len(self.evalsha_shas) == 1:
+            self.started.set()
+            self.resume.wait()
+        return self.client.evalsha(sha, *args)
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+
+# ============================================================================
+# ТЕСТЫ КАТАЛОГА СКРИПТОВ
+# ============================================================================
+
+class TestScriptCatalog:
+    """
+    Тесты версий скриптов на диске, манифеста SHA и предзагрузки
+    """
+
+    def test_build_and_load(self, tmp_path):
+        build_catalog("v1", str(tmp_path))
+
+        catalog = load_catalog("v1", str(tmp_path))
+
+        assert catalog.version == "v1"
+        assert catalog.shas == from_sources(SCRIPTS).shas
+        with open(tmp_path / "v1" / "manifest.json") as manifest:
+            assert json.load(manifest)["scripts"] == catalog.shas
+
+    def test_tampered_file_rejected(self, tmp_path):
+        build_catalog("v1", str(tmp_path))
+        with open(tmp_path / "v1" / "reservation.lua", "a") as source:
+            source.write("-- hotfix\n")
+
+        with pytest.raises(ValueError, match="reservation.lua"):
+            load_catalog("v1", str(tmp_path))
+
+        # После пересборки манифеста версия снова загружается
+        write_manifest("v1", str(tmp_path))
+        assert load_catalog("v1", str(tmp_path)).sources["reservation"].endswith("-- hotfix\n")
+
+    def test_incomplete_version_rejected(self, tmp_path):
+        build_catalog("v1", str(tmp_path))
+        os.remove(tmp_path / "v1" / "sweep_holds.lua")
+        write_manifest("v1", str(tmp_path))
+
+        with pytest.raises(ValueError, match="sweep_holds"):
+            load_catalog("v1", str(tmp_path))
+
+    def test_preload_sends_only_missing(self, clean_redis):
+        catalog = from_sources(SCRIPTS)
+        clean_redis.script_flush()
+
+        assert preload(clean_redis, catalog) == len(SCRIPTS)
+        assert preload(clean_redis, catalog) == 0
+        assert all(clean_redis.script_exists(*catalog.shas.values()))
+
+    def test_default_catalog_from_settings(self, tmp_path, monkeypatch):
+        _build_v2(tmp_path)
+        monkeypatch.setattr(settings, "SCRIPT_CATALOG_DIR", str(tmp_path))
+        monkeypatch.setattr(settings, "SCRIPT_VERSION", "v2")
+
+        assert default_catalog().version == "v2"
+        assert ProductStockLogController().scripts.version == "v2"
+
+
+# ============================================================================
+# ТЕСТЫ ПЕРЕКЛЮЧЕНИЯ ВЕРСИИ
+# ============================================================================
+
+class TestScriptVersionSwitch:
+    """
+    Тесты переключения активной версии скриптов в работающем контроллере
+    """
+
+    def test_activate_version(self, clean_redis, tmp_path):
+        v2 = _build_v2(tmp_path)
+        clean_redis.set("product:available", 5)
+        clean_redis.set("product:reserved", 0)
+        controller = ProductStockLogController()
+        clean_redis.script_flush()
+
+        controller.activate_script_version("v2", str(tmp_path))
+
+        assert controller.scripts.version == "v2"
+        assert all(clean_redis.script_exists(*v2.shas.values()))
+        assert controller.execute_lua_reservation_script("product:available", "product:reserved", 2) == (
+            ProductAmountCacheResults.ENOUGH_AMOUNT, 3
+        )
+
+    def test_in_flight_call_finishes_on_old_version(self, clean_redis, tmp_path):
+        v2 = _build_v2(tmp_path)
+        clean_redis.set("product:available", 5)
+        clean_redis.set("product:reserved", 0)
+        client = _PausedClient(clean_redis)
+        registry = ScriptRegistry(client)
+        registry.load()
+        v1_sha = registry.shas["reservation"]
+        results = []
+
+        in_flight = threading.Thread(
+            target=lambda: results.append(registry.execute("reservation", ["product:available", "product:reserved"], [1]))
+        )
+        in_flight.start()
+        client.started.wait()
+        registry.activate(v2)
+        client.resume.set()
+        in_flight.join()
+        results.append(registry.execute("reservation", ["product:available", "product:reserved"], [1]))
+
+        assert client.evalsha_shas == [v1_sha, v2.shas["reservation"]]
+        assert results == [[ProductAmountCacheResults.ENOUGH_AMOUNT, 4], [ProductAmountCacheResults.ENOUGH_AMOUNT, 3]]
@@ -0,0 +1,68 @@
+import time
+
+import pytest
+from redis.exceptions import ResponseError
+
+from keys import stock_keys
+from local_cache import TTLCache
+from redis_controller import ProductStockLogController
+from tracking import INVALIDATE_CHANNEL, KeyInvalidationTracker
+
+
+# ============================================================================
+# ТЕСТЫ ИНВАЛИДАЦИИ ЧЕРЕЗ CLIENT TRACKING
+# ============================================================================
+
+class TestKeyInvalidationTracker:
+    """
+    Тесты разбора уведомлений __redis__:invalidate и работы с настоящим Redis
+    """
+
+    def test_invalidated_keys_removed(self):
+        """
+        Уведомление удаляет из кэша только перечисленные ключи, остальные сообщения игнорируются
+        """
+        cache = TTLCache(10, 60)
+        cache.set("stock:{a}:available", 1)
+        cache.set("stock:{b}:available", 2)
+        tracker = KeyInvalidationTracker(cache, ["stock:"])
+
+        tracker.handle_message([b"message", INVALIDATE_CHANNEL, [b"stock:{a}:available"]])
+        tracker.handle_message([b"subscribe", INVALIDATE_CHANNEL, 1])
+
+        assert cache.get("stock:{a}:available") is None
+        assert cache.get("stock:{b}:available") == 2
+
+    def test_flush_clears_cache(self):
+        """
+        Уведомление без ключей (FLUSHDB, вытеснение таблицы трекинга) очищает кэш целиком
+        """
+        cache = TTLCache(10, 60)
+        cache.set("stock:{a}:available", 1)
+
+        KeyInvalidationTracker(cache, ["stock:"]).handle_message([b"message", INVALIDATE_CHANNEL, None])
+
+        assert len(cache) == 0
+
+    def test_controller_tracking(self, clean_redis):
+        """
+        Запись в Redis в обход контроллера сбрасывает остаток в кэше до истечения TTL
+        """
+        controller = ProductStockLogController(availability_cache_ttl=60)
+        available_key = stock_keys("tracked")[0]
+        clean_redis.set(available_key, 5)
+        try:
+            controller.start_availability_tracking()
+        except ResponseError:
+            pytest.skip("Сервер не поддерживает CLIENT TRACKING")
+        try:
+            assert controller.get_availability(["tracked"]) == {"tracked": 5}
+            clean_redis.set(available_key, 2)
+
+            deadline = time.monotonic() + 2
+            while controller.availability_cache.get(available_key) is not None and time.monotonic() < deadline:
+                time.sleep(0.01)
+
+            assert controller.get_availability(["tracked"]) == {"tracked": 2}
+        finally:
+            controller.stop_availability_tracking()
@@ -0,0 +1,113 @@
+"""
+Серверная инвалидация локального кэша через CLIENT TRACKING (Redis 6+).
+
+Одно соединение подписано на __redis__:invalidate, второе включает
+CLIENT TRACKING в режиме BCAST с REDIRECT на первое: сервер сообщает обо всех
+изменениях ключей с заданными префиксами, даже если этот процесс их не читал.
+Работает на RESP2, поэтому не зависит от settings.REDIS_PROTOCOL.
+"""
+import threading
+from typing import Callable, Sequence
+
+import redis
+from redis.exceptions import ConnectionError, ResponseError, TimeoutError
+
+from connection import connection_kwargs
+from local_cache import TTLCache
+
+
+INVALIDATE_CHANNEL = b"__redis__:invalidate"
+
+
+def _new_connection() -> redis.Connection:
+    kwargs = connection_kwargs()
+    connection_class = kwargs.pop("connection_class", redis.Connection)
+    kwargs["protocol"] = 2
+    return connection_class(**kwargs)
+
+
+class KeyInvalidationTracker:
+    """
+    Удаляет из cache ключи, изменённые на сервере.
+
+    Ключи кэша должны совпадать с ключами Redis. После потери соединения
+    кэш очищается целиком (уведомления за это время потеряны), и трекер
+    переподключается через reconnect_delay секунд.
+    """
+
+    def __init__(
+      self,
+      cache: TTLCache,
+      prefixes: Sequence[str],
+      connection_factory: Callable[[], redis.Connection] = _new_connection,
+      reconnect_delay: float = 1.0
+    ) -> None:
+        self.cache = cache
+        self.prefixes = list(prefixes)
+        self.connection_factory = connection_factory
+        self.reconnect_delay = reconnect_delay
+        self._listener: redis.Connection | None = None
+        self._tracker: redis.Connection | None = None
+        self._stopped = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        """Включает трекинг; ResponseError, если сервер не поддерживает CLIENT TRACKING."""
+        self._connect()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._disconnect()
+
+    def _connect(self) -> None:
+        listener = self.connection_factory()
+        tracker = self.connection_factory()
+        try:
+            listener.send_command("CLIENT", "ID")
+            client_id = listener.read_response()
+            prefix_args = [arg for prefix in self.prefixes for arg in ("PREFIX", prefix)]
+            tracker.send_command("CLIENT", "TRACKING", "ON", "REDIRECT", client_id, "BCAST", *prefix_args)
+            tracker.read_response()
+            listener.send_command("SUBSCRIBE", INVALIDATE_CHANNEL)
+            listener.read_response()
+        except BaseException:
+            listener.disconnect()
+            tracker.disconnect()
+            raise
+        self._listener = listener
+        self._tracker = tracker
+
+    def _disconnect(self) -> None:
+        for connection in (self._listener, self._tracker):
+            if connection is not None:
+                connection.disconnect()
+        self._listener = None
+        self._tracker = None
+
+    def handle_message(self, message: list) -> None:
+        kind, channel, keys = message
+        if kind != b"message" or channel != INVALIDATE_CHANNEL:
+            return
+        # keys = None - FLUSHDB/FLUSHALL или вытеснение таблицы трекинга
+        if keys is None:
+            self.cache.clear()
+            return
+        for key in keys:
+            self.cache.pop(key.decode())
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                if self._listener is None:
+                    self._connect()
+                if self._listener.can_read(timeout=0.1):
+                    self.handle_message(self._listener.read_response())
+            except (ConnectionError, TimeoutError, ResponseError, OSError):
+                self._disconnect()
+                self.cache.clear()
+                self._stopped.wait(self.reconnect_delay)